@@ -2,6 +2,7 @@ import json
 import math
 import os
 import re
+from array import array
 from collections import defaultdict
 
 Inventory = {
@@ -38,75 +39,191 @@ Product = {
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
+class _StockEngine:
+    """
+    Keeps the article stock in a contiguous integer array indexed by interned
+    article ids and the BOMs in a CSR (compressed sparse row) matrix: the articles
+    of product row ``p`` are ``indices[indptr[p]:indptr[p + 1]]`` with the matching
+    ``amounts``. A reverse index from article columns to product rows limits every
+    recomputation to the products whose BOM touches a changed article.
+    """
+
+    def __init__(self):
+        self.article_index = {}  # art_id -> column
+        self.article_names = []
+        self.stock = array("q")
+        self.known = bytearray()  # 1 if the article was uploaded to the inventory
+        self.article_products = []  # column -> set of product rows
+        self.product_index = {}  # product name key -> row
+        self.product_names = []
+        self.indptr = array("q", [0])
+        self.indices = array("q")
+        self.amounts = array("q")
+        self.quantities = []  # row -> number of products that can be created
+
+    def intern_article(self, article_id):
+        column = self.article_index.get(article_id)
+        if column is None:
+            column = self.article_index[article_id] = len(self.article_names)
+            self.article_names.append(None)
+            self.stock.append(0)
+            self.known.append(0)
+            self.article_products.append(set())
+        return column
+
+    def add_stock(self, articles):
+        """
+        Adds the uploaded stock and returns the rows of the affected products.
+        """
+        affected = set()
+        for article_id, article in articles.items():
+            column = self.intern_article(article_id)
+            if self.known[column]:
+                self.stock[column] += article["stock"]
+            else:
+                self.known[column] = 1
+                self.article_names[column] = article["name"]
+                self.stock[column] = article["stock"]
+            affected |= self.article_products[column]
+        return affected
+
+    def set_products(self, products):
+        """
+        Adds or replaces product BOMs and returns the rows of the affected products.
+        """
+        uploaded = {}
+        for key, product in products.items():
+            row = self.product_index.get(key)
+            if row is None:
+                row = self.product_index[key] = len(self.product_names)
+                self.product_names.append(None)
+                self.quantities.append(math.inf)
+            bom = {}
+            for article in product["contain_articles"]:
+                bom[self.intern_article(article.get("art_id"))] = int(
+                    article.get("amount_of")
+                )
+            self.product_names[row] = product["name"]
+            uploaded[row] = bom
+
+        # Rebuild the matrix, uploading product configs is rare compared to reads
+        indptr = array("q", [0])
+        indices = array("q")
+        amounts = array("q")
+        for row in range(len(self.product_names)):
+            if row + 1 < len(self.indptr):
+                start, end = self.indptr[row], self.indptr[row + 1]
+                old_columns = self.indices[start:end]
+            else:
+                old_columns = ()
+            if row in uploaded:
+                for column in old_columns:
+                    self.article_products[column].discard(row)
+                for column in uploaded[row]:
+                    self.article_products[column].add(row)
+                indices.extend(uploaded[row].keys())
+                amounts.extend(uploaded[row].values())
+            else:
+                indices.extend(old_columns)
+                amounts.extend(self.amounts[start:end])
+            indptr.append(len(indices))
+        self.indptr, self.indices, self.amounts = indptr, indices, amounts
+        return set(uploaded)
+
+    def recompute(self, rows):
+        """
+        Recomputes the quantity of the given products as the minimum of the floor
+        divisions of stock by amount over their known articles.
+        """
+        stock, known = self.stock, self.known
+        for row in rows:
+            start, end = self.indptr[row], self.indptr[row + 1]
+            self.quantities[row] = min(
+                (
+                    stock[column] // amount
+                    for column, amount in zip(
+                        self.indices[start:end], self.amounts[start:end]
+                    )
+                    if known[column]
+                ),
+                default=math.inf,
+            )
+
+    def sell(self, row, quantity):
+        """
+        Subtracts ``quantity`` units of a product from the stock of its articles and
+        returns the rows of the affected products.
+        """
+        start, end = self.indptr[row], self.indptr[row + 1]
+        affected = set()
+        for column, amount in zip(self.indices[start:end], self.amounts[start:end]):
+            if self.known[column]:
+                self.stock[column] -= quantity * amount
+                affected |= self.article_products[column]
+        return affected
+
+
 class Warehouse:
-    _articles_from_inventory: dict
-    _product_config: dict
+    _engine: _StockEngine
 
     @staticmethod
     def modified_product_name(name):
         return re.sub(r"\s+", "", name).lower() if name else None
 
     def __init__(self, inventory=None, products=None):
-        self._products_config = defaultdict()
-        self._articles_from_inventory = defaultdict()
-        self._products_in_inventory = defaultdict()
+        self._engine = _StockEngine()
         if inventory:
-            self._articles_from_inventory = self._processed_inventory(
-                inventory.get("inventory")
+            self._engine.add_stock(
+                self._processed_inventory(inventory.get("inventory"))
             )
         if products:
-            self._products_config = self._processed_product(products.get("products"))
-        self._calculate_products_in_inventory()
+            self._engine.set_products(self._processed_product(products.get("products")))
+        self._engine.recompute(range(len(self._engine.product_names)))
+
+    @property
+    def _products_in_inventory(self):
+        # Products which can not be built, e.g. sold out directly or through a
+        # shared article, are not in the inventory until stock is uploaded
+        engine = self._engine
+        return {
+            key: {"name": engine.product_names[row], "quantity": engine.quantities[row]}
+            for key, row in engine.product_index.items()
+            if engine.quantities[row] != 0
+        }
 
     def get_product(self, name: str = None):
         product_name_key = Warehouse.modified_product_name(name)
-        if product_name_key and product_name_key in self._products_in_inventory:
-            return self._products_in_inventory[product_name_key]
-        return list(self._products_in_inventory.values())
+        products_in_inventory = self._products_in_inventory
+        if product_name_key and product_name_key in products_in_inventory:
+            return products_in_inventory[product_name_key]
+        return list(products_in_inventory.values())
 
     def sell_product(self, name: str, quantity: int = None):
         # update the inventory after removing this product
         product_name_key = Warehouse.modified_product_name(name)
-        if product_name_key and product_name_key not in self._products_in_inventory:
+        row = self._engine.product_index.get(product_name_key)
+        if row is None or self._engine.quantities[row] == 0:
             return "Product can not be sold bc it's not present in Inventory"
-        self._update_inventory(product_name_key, quantity)
+        self._update_inventory(row, quantity)
         return
 
     def upload_inventory(self, file_path):
         with open(file_path) as f:
             inventory = json.load(f)
 
-        articles_from_inventory_after_uploading = self._processed_inventory(
-            inventory.get("inventory")
+        affected = self._engine.add_stock(
+            self._processed_inventory(inventory.get("inventory"))
         )
-
-        for article_id in articles_from_inventory_after_uploading:
-            article_data = articles_from_inventory_after_uploading[article_id]
-            if article_id in self._articles_from_inventory:
-                self._articles_from_inventory[article_id][
-                    "stock"
-                ] = self._articles_from_inventory[article_id][
-                    "stock"
-                ] + article_data.get(
-                    "stock"
-                )
-            else:
-                self._articles_from_inventory[article_id] = article_data
-
-        self._calculate_products_in_inventory()
+        self._engine.recompute(affected)
 
     def upload_products(self, file_path):
         with open(file_path) as f:
             products = json.load(f)
 
-        new_product_config_after_uploading = self._processed_product(
-            products.get("products")
+        affected = self._engine.set_products(
+            self._processed_product(products.get("products"))
         )
-        self._products_config = {
-            **self._products_config,
-            **new_product_config_after_uploading,
-        }
-        self._calculate_products_in_inventory()
+        self._engine.recompute(affected)
 
     def _processed_inventory(self, inventory):
         articles_from_inventory = defaultdict()
@@ -126,33 +243,8 @@ class Warehouse:
             }
         return products_config
 
-    def _calculate_products_in_inventory(self):
-        for product in self._products_config:
-            product_name = self._products_config[product]["name"]
-            contain_articles = self._products_config[product]["contain_articles"]
-            number_of_products_can_create = math.inf
-            for article in contain_articles:
-                if article.get("art_id") in self._articles_from_inventory:
-                    number_of_products_can_create = min(
-                        number_of_products_can_create,
-                        int(
-                            self._articles_from_inventory[article.get("art_id")].get(
-                                "stock"
-                            )
-                        )
-                        // int(article.get("amount_of")),
-                    )
-            self._products_in_inventory[product] = {
-                "name": product_name,
-                "quantity": number_of_products_can_create,
-            }
-
-    def _update_inventory(self, product_name_key, quantity_to_be_sold=None):
-
-        contain_articles = self._products_config[product_name_key]["contain_articles"]
-        current_quantity_of_product = self._products_in_inventory[product_name_key][
-            "quantity"
-        ]
+    def _update_inventory(self, row, quantity_to_be_sold=None):
+        current_quantity_of_product = self._engine.quantities[row]
 
         quantity_to_be_sold = (
             current_quantity_of_product
@@ -166,17 +258,8 @@ class Warehouse:
         if quantity_to_be_sold == 0:
             return
 
-        self._products_in_inventory[product_name_key]["quantity"] = (
-            current_quantity_of_product - quantity_to_be_sold
-        )  # update the product quantity
-        if self._products_in_inventory[product_name_key]["quantity"] == 0:
-            del self._products_in_inventory[product_name_key]
-        for article in contain_articles:  # update  inventory
-            self._articles_from_inventory[article.get("art_id")]["stock"] = int(
-                self._articles_from_inventory[article.get("art_id")]["stock"]
-            ) - quantity_to_be_sold * int(article.get("amount_of"))
-            if self._articles_from_inventory[article.get("art_id")]["stock"] == 0:
-                del self._articles_from_inventory[article.get("art_id")]
+        # update the inventory and every product sharing its articles
+        self._engine.recompute(self._engine.sell(row, quantity_to_be_sold))
 
 
 if __name__ == "__main__":
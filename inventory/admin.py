@@ -1,6 +1,12 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
 
-from .models import Article, ProductArticle, ProductConfig
+from .bom import BOMCycleError, explode
+from .models import (AlertEvent, Article, ImportJob, ProductArticle,
+                     ProductComponent, ProductConfig, Warehouse)
 
 
 class ProductArticleInline(admin.TabularInline):
@@ -8,15 +14,66 @@ class ProductArticleInline(admin.TabularInline):
     extra = 1
 
 
+class ProductComponentFormSet(BaseInlineFormSet):
+    def clean(self):
+        """
+        Rejects sub-assemblies which would make the product contain itself, the BOM
+        is exploded with the edited lines before any of them is saved.
+        """
+        super().clean()
+        # New products are not part of any BOM yet
+        if any(self.errors) or self.instance.pk is None:
+            return
+        components = defaultdict(int)
+        for form in self.forms:
+            data = form.cleaned_data
+            if data.get("component") and not data.get("DELETE"):
+                components[data["component"].pk] += data.get("quantity") or 0
+        try:
+            explode([self.instance.pk], {self.instance.pk: components})
+        except BOMCycleError as e:
+            names = ProductConfig.objects.in_bulk(e.cycle)
+            raise ValidationError(
+                "A product can not contain itself: "
+                + " -> ".join(names[product_id].name for product_id in e.cycle)
+            )
+
+
+class ProductComponentInline(admin.TabularInline):
+    model = ProductComponent
+    formset = ProductComponentFormSet
+    fk_name = "product"
+    extra = 1
+
+
 class ArticleAdmin(admin.ModelAdmin):
     model = Article
-    list_display = ("id", "name", "stock")
+    list_display = ("id", "name", "stock", "reserved", "located", "reorder_level")
+    # Kept by the reservations and the warehouses, see inventory.reservations and
+    # inventory.sites
+    readonly_fields = ("reserved", "located")
 
 
 class ProductAdmin(admin.ModelAdmin):
-    inlines = [ProductArticleInline]
-    list_display = ("name",)
+    inlines = [ProductArticleInline, ProductComponentInline]
+    list_display = ("name", "reorder_level")
+
+
+class ImportJobAdmin(admin.ModelAdmin):
+    model = ImportJob
+    list_display = ("id", "kind", "status", "rows_done", "error_count", "created_at")
+    readonly_fields = [field.name for field in ImportJob._meta.fields]
+
+
+class AlertEventAdmin(admin.ModelAdmin):
+    model = AlertEvent
+    list_display = ("id", "kind", "object_id", "state", "new_stock", "delivered_at")
+    list_filter = ("kind", "state")
+    readonly_fields = [field.name for field in AlertEvent._meta.fields]
 
 
 admin.site.register(Article, ArticleAdmin)
 admin.site.register(ProductConfig, ProductAdmin)
+admin.site.register(ImportJob, ImportJobAdmin)
+admin.site.register(Warehouse)
+admin.site.register(AlertEvent, AlertEventAdmin)
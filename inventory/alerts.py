@@ -0,0 +1,203 @@
+import json
+import os
+import urllib.request
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.logger import setup_logger
+from inventory.models import AlertEvent, Article
+
+# Setup logging
+logger = setup_logger(__name__)
+
+DEFAULT_ALERTS = {
+    # Evaluate the reorder levels when stock changes
+    "ENABLED": True,
+    # Where the events are delivered, "file" or "webhook"
+    "SINK": "file",
+    # File the "file" sink appends JSON lines to, BASE_DIR/alerts.jsonl if None
+    "PATH": None,
+    # URL the "webhook" sink posts the events to
+    "URL": None,
+    # Seconds to wait for the webhook
+    "TIMEOUT": 5,
+    # Events delivered per batch
+    "BATCH_SIZE": 100,
+}
+
+
+def get_alerts_config():
+    config = {**DEFAULT_ALERTS, **getattr(settings, "INVENTORY_ALERTS", {})}
+    if config["PATH"] is None:
+        config["PATH"] = os.path.join(settings.BASE_DIR, "alerts.jsonl")
+    return config
+
+
+def crossing(old, new, level):
+    """
+    Returns the state a change of the stock from ``old`` to ``new`` moves into,
+    ``AlertEvent.LOW`` if it falls to or below the level, ``AlertEvent.RESTOCKED``
+    if it rises above it, None if it stays on the same side.
+    """
+    if level is None or old is None or new is None:
+        return None
+    if new <= level < old:
+        return AlertEvent.LOW
+    if old <= level < new:
+        return AlertEvent.RESTOCKED
+    return None
+
+
+def _event(kind, object_id, level, old, new):
+    state = crossing(old, new, level)
+    if state is None:
+        return None
+    return AlertEvent(
+        kind=kind,
+        object_id=str(object_id),
+        state=state,
+        level=level,
+        old_stock=old,
+        new_stock=new,
+    )
+
+
+def _record(events):
+    events = [event for event in events if event is not None]
+    if events:
+        AlertEvent.objects.bulk_create(events)
+    return events
+
+
+def article_alerts(deltas):
+    """
+    Records the events of the articles whose stock crossed their reorder level.
+
+    Only the changed articles with a level are read, the stock before the change is
+    their current stock minus the delta in hand. Call it in the transaction which
+    changed the stock, the updated rows are locked until it ends.
+
+    :param deltas: A dict mapping article ids to their stock change.
+    :return: The recorded events.
+    """
+    if not get_alerts_config()["ENABLED"]:
+        return []
+    articles = Article.objects.filter(
+        id__in=[article_id for article_id, delta in deltas.items() if delta],
+        reorder_level__isnull=False,
+    ).values_list("id", "stock", "reorder_level")
+    return _record(
+        _event(AlertEvent.ARTICLE, article_id, level, stock - deltas[article_id], stock)
+        for article_id, stock, level in articles
+    )
+
+
+def product_alerts(changes, levels):
+    """
+    Records the events of the products whose units crossed their reorder level.
+
+    :param changes: A dict mapping product ids to their (old, new) units, see
+        ``inventory.availability.refresh_products``.
+    :param levels: A dict mapping product ids to their reorder level.
+    :return: The recorded events.
+    """
+    if not get_alerts_config()["ENABLED"]:
+        return []
+    return _record(
+        _event(AlertEvent.PRODUCT, product_id, levels.get(product_id), old, new)
+        for product_id, (old, new) in changes.items()
+    )
+
+
+def event_payload(event):
+    return {
+        "id": event.id,
+        "kind": event.kind,
+        "object_id": event.object_id,
+        "state": event.state,
+        "level": event.level,
+        "old_stock": event.old_stock,
+        "new_stock": event.new_stock,
+        "created_at": event.created_at,
+    }
+
+
+def write_file(payloads, config):
+    """
+    Appends the events to the file of the "file" sink, one JSON object per line.
+    """
+    with open(config["PATH"], "a") as f:
+        for payload in payloads:
+            f.write(json.dumps(payload, cls=DjangoJSONEncoder) + "\n")
+
+
+def post_webhook(payloads, config):
+    """
+    Posts the events to the URL of the "webhook" sink as ``{"events": [...]}``, any
+    response but a 2xx one fails the delivery.
+    """
+    request = urllib.request.Request(
+        config["URL"],
+        data=json.dumps({"events": payloads}, cls=DjangoJSONEncoder).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=config["TIMEOUT"]):
+        pass
+
+
+SINKS = {
+    "file": write_file,
+    "webhook": post_webhook,
+}
+
+
+def deliver_alerts(batch_size=None):
+    """
+    Delivers the pending events to the configured sink, oldest first.
+
+    The pending events are read through the partial index on the undelivered ones.
+    Events locked by a concurrent delivery are skipped (SKIP LOCKED on backends
+    supporting it). A failed batch is left pending with its error and the run stops,
+    so the next run retries it in order. A sink may see a batch twice if the process
+    dies between delivering and marking it, the event ids tell duplicates apart.
+
+    :param batch_size: Events delivered per batch.
+    :return: The number of delivered events.
+    """
+    config = get_alerts_config()
+    batch_size = batch_size or config["BATCH_SIZE"]
+    sink = SINKS[config["SINK"]]
+    delivered = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                AlertEvent.objects.select_for_update(skip_locked=True)
+                .filter(delivered_at__isnull=True)
+                .order_by("id")[:batch_size]
+            )
+            if not events:
+                return delivered
+            ids = [event.id for event in events]
+            try:
+                sink([event_payload(event) for event in events], config)
+            except Exception as e:
+                logger.warning(f"Delivering {len(ids)} alert events failed: {e}")
+                failed = True
+                for event in events:
+                    event.attempts += 1
+                    event.last_error = str(e)
+                AlertEvent.objects.bulk_update(events, ["attempts", "last_error"])
+            else:
+                failed = False
+                AlertEvent.objects.filter(id__in=ids).update(
+                    delivered_at=timezone.now()
+                )
+        if failed:
+            return delivered
+        delivered += len(ids)
+        if len(ids) < batch_size:
+            return delivered
@@ -0,0 +1,213 @@
+from django.db import connection, models
+from django.db.models import ExpressionWrapper, F, Min, Value, Window
+from django.db.models.functions import Greatest, Lead, RowNumber
+
+from inventory.alerts import article_alerts, product_alerts
+from inventory.cache import invalidate_products
+from inventory.changes import record_changes
+from inventory.models import (ProductAvailability, ProductConfig,
+                              ProductRequirement)
+
+
+def products_for_articles(article_ids):
+    """
+    Returns the ids of all products which need one of the given articles, directly
+    or through a sub-assembly.
+
+    The result is a lazy queryset, so it can be used as a subquery without pulling
+    the ids of widely used articles (e.g. screws) into Python.
+
+    :param article_ids: The ids of the changed articles.
+    """
+    return (
+        ProductRequirement.objects.filter(article_id__in=article_ids)
+        .values("product_id")
+        .distinct()
+    )
+
+
+def compute_availability(product_ids):
+    """
+    Computes the number of units that can be built for the given products, the
+    article limiting it, the headroom of the second tightest article and the units
+    that can be built from the stock not held by reservations nor kept at a
+    warehouse (see ``inventory.sites``).
+
+    The article requirements (see ``inventory.bom``) are ranked per product by the
+    number of units their article allows (window functions), so all four come out
+    of a single pass over the requirements, and only the top ranked one of every
+    product leaves the database.
+
+    :param product_ids: A list or queryset of product ids.
+    :return: A dict mapping product ids to a (stock, bottleneck article id, second
+        headroom, available) tuple, where the second headroom is None for single
+        article products.
+    """
+    headroom = ExpressionWrapper(
+        F("article__stock") / F("quantity"), output_field=models.IntegerField()
+    )
+    # An edit may leave less stock than is reserved or located
+    available = ExpressionWrapper(
+        Greatest(
+            F("article__stock") - F("article__reserved") - F("article__located"),
+            Value(0),
+        )
+        / F("quantity"),
+        output_field=models.IntegerField(),
+    )
+    ranking = {
+        "partition_by": [F("product_id")],
+        "order_by": [headroom.asc(), F("article_id").asc()],
+    }
+    lines = (
+        ProductRequirement.objects.filter(product_id__in=product_ids, quantity__gt=0)
+        .annotate(
+            headroom=headroom,
+            headroom_rank=Window(RowNumber(), **ranking),
+            second_headroom=Window(Lead(headroom), **ranking),
+            available=Window(Min(available), partition_by=[F("product_id")]),
+        )
+        .values_list(
+            "product_id",
+            "article_id",
+            "headroom",
+            "headroom_rank",
+            "second_headroom",
+            "available",
+        )
+    )
+    # Django can not filter on window functions yet, so the top ranked lines are
+    # picked by an outer query
+    sql, params = lines.query.sql_with_params()
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(
+        f"ranked.{quote_name(column)}"
+        for column in (
+            "product_id",
+            "headroom",
+            "article_id",
+            "second_headroom",
+            "available",
+        )
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {columns} FROM ({sql}) ranked "
+            f"WHERE ranked.{quote_name('headroom_rank')} = 1",
+            params,
+        )
+        return {
+            product_id: (stock, bottleneck_article_id, second_headroom, available)
+            for (
+                product_id,
+                stock,
+                bottleneck_article_id,
+                second_headroom,
+                available,
+            ) in cursor
+        }
+
+
+def refresh_products(product_ids):
+    """
+    Recomputes the materialized availability of the given products.
+
+    Products without any article requirements are removed from the projection, just like
+    they never showed up in the products listing. Cached responses of the changed
+    products are invalidated. The bottleneck article, the second headroom and the
+    available units are updated along, but only stock changes are reported. Stock
+    changes crossing the reorder level of a product raise an alert, the level is read
+    along with the stored rows.
+
+    :param product_ids: A list or queryset of product ids.
+    :return: A dict mapping every changed product id to its (old, new) stock, where
+        None means the product was not (or is no longer) listed.
+    """
+    computed = compute_availability(product_ids)
+    existing = {
+        row.product_id: row
+        for row in ProductAvailability.objects.filter(
+            product_id__in=product_ids
+        ).annotate(reorder_level=F("product__reorder_level"))
+    }
+
+    changes = {}
+    to_update = []
+    for product_id, row in existing.items():
+        if product_id not in computed:
+            changes[product_id] = (row.stock, None)
+            continue
+        stock, bottleneck_article_id, second_headroom, available = computed[product_id]
+        if stock != row.stock:
+            changes[product_id] = (row.stock, stock)
+        if (stock, bottleneck_article_id, second_headroom, available) != (
+            row.stock,
+            row.bottleneck_article_id,
+            row.second_headroom,
+            row.available,
+        ):
+            row.stock = stock
+            row.bottleneck_article_id = bottleneck_article_id
+            row.second_headroom = second_headroom
+            row.available = available
+            to_update.append(row)
+    to_create = [
+        ProductAvailability(
+            product_id=product_id,
+            stock=stock,
+            bottleneck_article_id=bottleneck_article_id,
+            second_headroom=second_headroom,
+            available=available,
+        )
+        for product_id, (
+            stock,
+            bottleneck_article_id,
+            second_headroom,
+            available,
+        ) in computed.items()
+        if product_id not in existing
+    ]
+    changes.update((row.product_id, (None, row.stock)) for row in to_create)
+    to_delete = [
+        product_id for product_id, (_, stock) in changes.items() if stock is None
+    ]
+
+    if to_delete:
+        ProductAvailability.objects.filter(product_id__in=to_delete).delete()
+    ProductAvailability.objects.bulk_update(
+        to_update, ["stock", "bottleneck_article", "second_headroom", "available"]
+    )
+    ProductAvailability.objects.bulk_create(to_create)
+    # The cached responses contain the bottleneck as well
+    changed = {*changes, *(row.product_id for row in to_update)}
+    product_alerts(
+        changes,
+        {product_id: row.reorder_level for product_id, row in existing.items()},
+    )
+    invalidate_products(changed)
+    record_changes(products=changed)
+    return changes
+
+
+def articles_changed(article_ids, deltas=None):
+    """
+    Records the changed articles and refreshes the availability of every product
+    that uses one of them.
+
+    :param article_ids: The ids of the articles whose stock changed.
+    :param deltas: A dict mapping article ids to their stock change, the articles
+        crossing their reorder level raise an alert. None if the stock did not
+        change, e.g. for reservations.
+    :return: The changed products, see ``refresh_products``.
+    """
+    record_changes(articles=article_ids)
+    if deltas:
+        article_alerts(deltas)
+    return refresh_products(products_for_articles(article_ids))
+
+
+def rebuild_availability():
+    """
+    Recomputes the availability of all products.
+    """
+    return refresh_products(ProductConfig.objects.values("id"))
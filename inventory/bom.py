@@ -0,0 +1,200 @@
+from collections import defaultdict
+
+from inventory.availability import refresh_products
+from inventory.changes import record_changes
+from inventory.models import (ProductArticle, ProductComponent, ProductConfig,
+                              ProductRequirement)
+
+# Number of ids per IN (...) lookup, widely used sub-assemblies can have tens of
+# thousands of assemblies
+BATCH_SIZE = 1000
+
+
+class BOMCycleError(Exception):
+    """
+    Raised when a product contains itself, directly or through its sub-assemblies.
+
+    ``cycle`` lists the products along the cycle, starting and ending with the same
+    product. They are given by id, or by name for uploads.
+    """
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super().__init__(
+            "Product configurations contain a cycle: "
+            + " -> ".join(str(product_id) for product_id in cycle)
+        )
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start : start + BATCH_SIZE]
+
+
+def _values_in(queryset, field, ids, *fields):
+    """
+    Yields ``values_list(*fields)`` of the rows of ``queryset`` whose ``field`` is
+    one of ``ids``, in batches of ``BATCH_SIZE`` ids.
+    """
+    for batch in _batches(ids):
+        yield from queryset.filter(**{f"{field}__in": batch}).values_list(*fields)
+
+
+def assemblies_using(product_ids):
+    """
+    Returns the given products and every product containing one of them, directly
+    or through other sub-assemblies.
+
+    The assemblies are looked up level by level, one query per level.
+
+    :param product_ids: The ids of the products.
+    :return: A set of product ids.
+    """
+    found = set(product_ids)
+    frontier = set(found)
+    while frontier:
+        frontier = {
+            product_id
+            for product_id, in _values_in(
+                ProductComponent.objects, "component_id", frontier, "product_id"
+            )
+        } - found
+        found |= frontier
+    return found
+
+
+def explode(product_ids, proposed=None):
+    """
+    Flattens the BOMs of the given products into their article requirements.
+
+    The sub-assemblies below the products are loaded level by level, one query per
+    level, and their articles with one more query. Every sub-assembly is flattened
+    once and memoized, however many products contain it.
+
+    :param product_ids: The ids of the products.
+    :param proposed: A dict mapping product ids to a dict of component id to
+        quantity, used instead of their stored sub-assemblies, e.g. to check an edit
+        before saving it.
+    :return: A dict mapping product ids to a dict of article id to quantity.
+    :raises BOMCycleError: If a product contains itself.
+    """
+    proposed = proposed or {}
+    components = defaultdict(lambda: defaultdict(int))
+    loaded = set()
+    frontier = set(product_ids)
+    while frontier:
+        loaded |= frontier
+        for product_id in frontier & proposed.keys():
+            components[product_id].update(proposed[product_id])
+        for product_id, component_id, quantity in _values_in(
+            ProductComponent.objects,
+            "product_id",
+            frontier - proposed.keys(),
+            "product_id",
+            "component_id",
+            "quantity",
+        ):
+            components[product_id][component_id] += quantity
+        frontier = {
+            component_id
+            for product_id in frontier
+            for component_id in components[product_id]
+        } - loaded
+
+    articles = defaultdict(lambda: defaultdict(int))
+    for product_id, article_id, quantity in _values_in(
+        ProductArticle.objects,
+        "product_id",
+        loaded,
+        "product_id",
+        "article_id",
+        "quantity",
+    ):
+        articles[product_id][article_id] += quantity
+
+    flattened = {}
+    path = []
+
+    def flatten(product_id):
+        if product_id in flattened:
+            return flattened[product_id]
+        if product_id in path:
+            raise BOMCycleError(path[path.index(product_id) :] + [product_id])
+        path.append(product_id)
+        requirements = defaultdict(int, articles[product_id])
+        for component_id, quantity in components[product_id].items():
+            for article_id, article_quantity in flatten(component_id).items():
+                requirements[article_id] += quantity * article_quantity
+        path.pop()
+        flattened[product_id] = {
+            article_id: quantity
+            for article_id, quantity in requirements.items()
+            if quantity > 0
+        }
+        return flattened[product_id]
+
+    return {product_id: flatten(product_id) for product_id in product_ids}
+
+
+def bom_changed(product_ids):
+    """
+    Rebuilds the article requirements of products whose BOM changed, and of every
+    product using them as a sub-assembly, then refreshes their availability.
+
+    Stock changes do not touch the requirements, they only have to be rebuilt when
+    a BOM changes.
+
+    :param product_ids: The ids of the products whose articles or sub-assemblies
+        changed.
+    :return: The ids of the products whose requirements changed.
+    :raises BOMCycleError: If a product contains itself.
+    """
+    affected = assemblies_using(product_ids)
+    exploded = explode(affected)
+
+    existing = defaultdict(dict)
+    for batch in _batches(affected):
+        for requirement in ProductRequirement.objects.filter(product_id__in=batch).only(
+            "id", "product_id", "article_id", "quantity"
+        ):
+            existing[requirement.product_id][requirement.article_id] = requirement
+
+    to_create = []
+    to_update = []
+    to_delete = []
+    changed = set()
+    for product_id, requirements in exploded.items():
+        current = existing.pop(product_id, {})
+        for article_id, quantity in requirements.items():
+            requirement = current.pop(article_id, None)
+            if requirement is None:
+                to_create.append(
+                    ProductRequirement(
+                        product_id=product_id, article_id=article_id, quantity=quantity
+                    )
+                )
+                changed.add(product_id)
+            elif requirement.quantity != quantity:
+                requirement.quantity = quantity
+                to_update.append(requirement)
+                changed.add(product_id)
+        if current:
+            to_delete.extend(requirement.id for requirement in current.values())
+            changed.add(product_id)
+
+    for batch in _batches(to_delete):
+        ProductRequirement.objects.filter(id__in=batch).delete()
+    ProductRequirement.objects.bulk_update(to_update, ["quantity"], BATCH_SIZE)
+    ProductRequirement.objects.bulk_create(to_create, BATCH_SIZE)
+    record_changes(products=changed)
+    for batch in _batches(changed):
+        refresh_products(batch)
+    return changed
+
+
+def rebuild_requirements():
+    """
+    Rebuilds the article requirements of all products.
+    """
+    return bom_changed(ProductConfig.objects.values_list("id", flat=True))
@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+DEFAULT_PRODUCT_CACHE = {
+    # "local" for an in-process LRU, "django" for a cache of the CACHES setting,
+    # or None to disable caching. Changes only invalidate the local cache of their
+    # own process, other worker processes serve stale responses for up to TIMEOUT
+    # seconds, so "local" is meant for a single process. The inventory version is
+    # only cached by "django"
+    "BACKEND": "local",
+    "TIMEOUT": 30,
+    "MAX_ENTRIES": 1024,
+    "ALIAS": "default",
+}
+PRODUCT_LIST_KEY = "inventory:products:list"
+VERSION_KEY = "inventory:version"
+
+
+def product_key(product_id):
+    return f"inventory:products:{product_id}" if product_id else PRODUCT_LIST_KEY
+
+
+class LocalLRUCache:
+    """
+    A thread-safe in-process LRU cache whose entries expire after ``timeout`` seconds.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """
+    Stores the entries in a cache of the CACHES setting, e.g. memcached or redis
+    shared by all workers. Size bounds are left to the configured backend.
+    """
+
+    def __init__(self, alias, timeout):
+        self.timeout = timeout
+        self._cache = caches[alias]
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value, self.timeout)
+
+    def delete_many(self, keys):
+        self._cache.delete_many(keys)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class ProductResponseCache:
+    """
+    Caches the serialized JSON of the products listing and of single products.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, product_id=None):
+        content = self.backend.get(product_key(product_id))
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def set(self, product_id, content):
+        self.backend.set(product_key(product_id), content)
+
+    @property
+    def shared(self):
+        """
+        Whether the entries and their invalidations are shared by all processes.
+        """
+        return not isinstance(self.backend, LocalLRUCache)
+
+    def get_version(self):
+        return self.backend.get(VERSION_KEY)
+
+    def set_version(self, version):
+        self.backend.set(VERSION_KEY, version)
+
+    def invalidate_version(self):
+        self.backend.delete_many([VERSION_KEY])
+
+    def invalidate(self, product_ids):
+        """
+        Drops the given products and the listing, which contains all of them.
+        """
+        self.backend.delete_many(
+            [PRODUCT_LIST_KEY] + [product_key(product_id) for product_id in product_ids]
+        )
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        stats = {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        }
+        if isinstance(self.backend, LocalLRUCache):
+            stats["entries"] = len(self.backend)
+        return stats
+
+
+_product_cache = None
+
+
+def get_product_cache():
+    """
+    Returns the product response cache configured by INVENTORY_PRODUCT_CACHE, or None
+    if caching is disabled.
+    """
+    global _product_cache
+    if _product_cache is None:
+        config = {
+            **DEFAULT_PRODUCT_CACHE,
+            **getattr(settings, "INVENTORY_PRODUCT_CACHE", {}),
+        }
+        if config["BACKEND"] == "local":
+            backend = LocalLRUCache(config["MAX_ENTRIES"], config["TIMEOUT"])
+        elif config["BACKEND"] == "django":
+            backend = DjangoCacheBackend(config["ALIAS"], config["TIMEOUT"])
+        else:
+            return None
+        _product_cache = ProductResponseCache(backend)
+    return _product_cache
+
+
+def invalidate_products(product_ids):
+    """
+    Drops the cached responses of the given products.
+
+    The entries are dropped right away and once more after the current transaction
+    commits, so a response cached by a concurrent reader in between is not kept.
+
+    :param product_ids: The ids of the products whose stock or config changed.
+    """
+    product_ids = list(product_ids)
+    cache = get_product_cache()
+    if not product_ids or cache is None:
+        return
+    cache.invalidate(product_ids)
+    transaction.on_commit(lambda: cache.invalidate(product_ids))
+
+
+def invalidate_version():
+    """
+    Drops the cached inventory version, right away and after the current transaction
+    commits, see ``invalidate_products``.
+    """
+    cache = get_product_cache()
+    if cache is None or not cache.shared:
+        return
+    cache.invalidate_version()
+    transaction.on_commit(cache.invalidate_version)
+
+
+@receiver(setting_changed)
+def reset_product_cache(setting, **kwargs):
+    global _product_cache
+    if setting == "INVENTORY_PRODUCT_CACHE":
+        _product_cache = None
@@ -0,0 +1,158 @@
+from inventory.cache import get_product_cache, invalidate_version
+from inventory.models import Article, InventoryChange, ProductAvailability
+
+DEFAULT_CHANGES_LIMIT = 1000
+MAX_CHANGES_LIMIT = 10000
+
+
+class ChangesExpired(Exception):
+    """
+    Raised when the changes after a version were already pruned, the client has to
+    fetch the listings again.
+    """
+
+    def __init__(self, since, oldest):
+        self.since = since
+        self.oldest = oldest
+        super().__init__(
+            f"The changes after version {since} are no longer available, the oldest "
+            f"retained change is {oldest}."
+        )
+
+
+def record_changes(articles=(), products=()):
+    """
+    Appends one change per article and product, which bumps the inventory version.
+
+    :param articles: The ids of the changed articles.
+    :param products: The ids of the changed products.
+    """
+    changes = [
+        InventoryChange(kind=InventoryChange.ARTICLE, object_id=str(article_id))
+        for article_id in dict.fromkeys(articles)
+    ] + [
+        InventoryChange(kind=InventoryChange.PRODUCT, object_id=str(product_id))
+        for product_id in dict.fromkeys(products)
+    ]
+    if changes:
+        InventoryChange.objects.bulk_create(changes)
+        invalidate_version()
+
+
+def current_version():
+    """
+    Returns the current inventory version, 0 before the first change.
+
+    The version is kept in a shared product response cache until the next change,
+    so cached product reads stay free of queries. A local cache would keep it after
+    the changes of other processes, the version is read from the database then.
+    """
+    cache = get_product_cache()
+    if cache is not None and not cache.shared:
+        cache = None
+    version = cache.get_version() if cache else None
+    if version is None:
+        version = (
+            InventoryChange.objects.order_by("-id").values_list("id", flat=True).first()
+            or 0
+        )
+        if cache:
+            cache.set_version(version)
+    return version
+
+
+def changes_since(since, limit=DEFAULT_CHANGES_LIMIT):
+    """
+    Returns the current state of the articles and products changed after a version.
+
+    Objects changed several times are returned once. Objects which no longer exist,
+    or products which are no longer listed, are returned as removed.
+
+    :param since: The version the client is at.
+    :param limit: The most changes to read, ``more`` tells if there are further ones.
+    :return: A dict with the version reached, the changed articles and products and
+        the removed ones.
+    :raises ChangesExpired: If changes after ``since`` were pruned.
+    """
+    oldest = InventoryChange.objects.order_by("id").values_list("id", flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        raise ChangesExpired(since, oldest)
+
+    rows = list(
+        InventoryChange.objects.filter(id__gt=since)
+        .order_by("id")
+        .values_list("id", "kind", "object_id")[:limit]
+    )
+    article_ids = list(
+        dict.fromkeys(
+            object_id for _, kind, object_id in rows if kind == InventoryChange.ARTICLE
+        )
+    )
+    product_ids = list(
+        dict.fromkeys(
+            int(object_id)
+            for _, kind, object_id in rows
+            if kind == InventoryChange.PRODUCT
+        )
+    )
+
+    articles = list(
+        Article.objects.filter(id__in=article_ids)
+        .order_by("id")
+        .values("id", "name", "stock")
+    )
+    products = [
+        {
+            "id": d["product_id"],
+            "name": d["product__name"],
+            "stock": d["stock"],
+            "available": d["available"],
+            "bottleneck_article": d["bottleneck_article_id"],
+            "second_headroom": d["second_headroom"],
+        }
+        for d in ProductAvailability.objects.filter(product_id__in=product_ids)
+        .order_by("product_id")
+        .values(
+            "product_id",
+            "product__name",
+            "stock",
+            "available",
+            "bottleneck_article_id",
+            "second_headroom",
+        )
+    ]
+    found_articles = {article["id"] for article in articles}
+    found_products = {product["id"] for product in products}
+    return {
+        "version": rows[-1][0] if rows else since,
+        "more": len(rows) == limit,
+        "articles": articles,
+        "products": products,
+        "removed": {
+            "articles": [
+                article_id
+                for article_id in article_ids
+                if article_id not in found_articles
+            ],
+            "products": [
+                product_id
+                for product_id in product_ids
+                if product_id not in found_products
+            ],
+        },
+    }
+
+
+def prune_changes(before):
+    """
+    Deletes changes recorded before ``before``, the latest change is always kept so
+    the version never goes back.
+
+    Clients at a pruned version get a ``ChangesExpired`` error and start over.
+
+    :return: The number of deleted changes.
+    """
+    deleted, _ = InventoryChange.objects.filter(
+        created_at__lt=before, id__lt=current_version()
+    ).delete()
+    return deleted
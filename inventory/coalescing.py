@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from inventory.logger import setup_logger
+from inventory.selling import sell_batch
+
+# Setup logging
+logger = setup_logger(__name__)
+
+DEFAULT_SELL_COALESCING = {
+    # Funnel the sales of the sell endpoint through a SellCoalescer
+    "ENABLED": False,
+    # A batch is applied once it holds MAX_BATCH sales or MAX_WAIT_MS passed since
+    # its first sale arrived
+    "MAX_BATCH": 500,
+    "MAX_WAIT_MS": 5,
+    # Sales waiting for a batch, further sales are rejected until the queue drains
+    "MAX_PENDING": 10000,
+    # Seconds a sale may wait in the queue before it is given up
+    "TIMEOUT": 5,
+}
+
+
+class SellQueueFull(Exception):
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        super().__init__(f"{max_pending} sales are already waiting to be applied.")
+
+
+class SellTimeout(Exception):
+    def __init__(self, timeout):
+        self.timeout = timeout
+        super().__init__(f"The sale was not applied within {timeout} seconds.")
+
+
+class SellCoalescer:
+    """
+    Applies concurrent sales in micro-batches from a single worker thread.
+
+    Request threads queue their sale and wait on a future, the worker collects the
+    queued sales into a batch and applies it with one transaction, see
+    ``sell_batch``. The futures are resolved in arrival order with the outcome of
+    their sale.
+    """
+
+    def __init__(
+        self,
+        max_batch=500,
+        max_wait_ms=5,
+        max_pending=10000,
+        timeout=5,
+        apply_batch=sell_batch,
+    ):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.apply_batch = apply_batch
+        self.batches = 0
+        self.sales = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(
+            target=self._run, name="inventory-sell-coalescer", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, product_id, quantity):
+        """
+        Queues a sale.
+
+        :return: A future resolved with the outcome of the sale.
+        :raises SellQueueFull: If ``max_pending`` sales are already queued.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((product_id, quantity, future))
+        except queue.Full:
+            raise SellQueueFull(self.max_pending)
+        return future
+
+    def sell(self, product_id, quantity):
+        """
+        Sells units of a product through the queue, see ``sell_product``.
+
+        :return: The name of the sold product.
+        :raises SellQueueFull: If ``max_pending`` sales are already queued.
+        :raises SellTimeout: If the sale was not picked up within ``timeout``
+            seconds, it is then never applied.
+        """
+        future = self.submit(product_id, quantity)
+        try:
+            outcome = future.result(self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise SellTimeout(self.timeout)
+            # The sale is being applied, its outcome is only a batch away
+            outcome = future.result()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def stop(self):
+        self._stopped.set()
+        self._worker.join()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Sales given up by their request are dropped, the others can no longer be
+        # cancelled
+        return [
+            (product_id, quantity, future)
+            for product_id, quantity, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                outcomes = self.apply_batch(
+                    [(product_id, quantity) for product_id, quantity, _ in batch]
+                )
+            except Exception as e:
+                logger.exception("Applying a batch of %s sales failed", len(batch))
+                outcomes = [e] * len(batch)
+            self.batches += 1
+            self.sales += len(batch)
+            for (_, _, future), outcome in zip(batch, outcomes):
+                future.set_result(outcome)
+
+
+_sell_coalescer = None
+_sell_coalescer_lock = threading.Lock()
+
+
+def get_sell_coalescer():
+    """
+    Returns the sell coalescer configured by INVENTORY_SELL_COALESCING, or None if
+    sales are applied by the request threads themselves.
+    """
+    global _sell_coalescer
+    config = {
+        **DEFAULT_SELL_COALESCING,
+        **getattr(settings, "INVENTORY_SELL_COALESCING", {}),
+    }
+    if not config["ENABLED"]:
+        return None
+    with _sell_coalescer_lock:
+        if _sell_coalescer is None:
+            _sell_coalescer = SellCoalescer(
+                config["MAX_BATCH"],
+                config["MAX_WAIT_MS"],
+                config["MAX_PENDING"],
+                config["TIMEOUT"],
+            )
+    return _sell_coalescer
+
+
+@receiver(setting_changed)
+def reset_sell_coalescer(setting, **kwargs):
+    global _sell_coalescer
+    if setting == "INVENTORY_SELL_COALESCING":
+        with _sell_coalescer_lock:
+            if _sell_coalescer is not None:
+                _sell_coalescer.stop()
+            _sell_coalescer = None
@@ -0,0 +1,179 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from inventory.models import IdempotencyRecord
+
+DEFAULT_IDEMPOTENCY = {
+    # Seconds a response is replayed to retries of its request
+    "TTL": 24 * 60 * 60,
+    # Seconds after which the pending record of a request which never finished, e.g.
+    # because its process died, is taken over by a retry
+    "PENDING_TTL": 60,
+    # Replay the response of an upload to a later upload of the same file, even
+    # without an Idempotency-Key
+    "DEDUPE_UPLOADS": True,
+}
+MAX_KEY_LENGTH = 255
+DELETE_BATCH_SIZE = 10000
+
+
+def get_idempotency_config():
+    return {**DEFAULT_IDEMPOTENCY, **getattr(settings, "INVENTORY_IDEMPOTENCY", {})}
+
+
+def request_fingerprint(request):
+    """
+    Returns the SHA-256 of the request body, of the uploaded files for multipart
+    requests (streamed in chunks, their body can not be read twice).
+    """
+    digest = hashlib.sha256()
+    if request.content_type.startswith("multipart/"):
+        for name, file in sorted(request.FILES.items()):
+            digest.update(name.encode())
+            for data in file.chunks():
+                digest.update(data)
+            file.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(key, fingerprint, pending_ttl):
+    """
+    Inserts the pending record of a key, unless a live record exists.
+
+    :return: A tuple (record, created).
+    """
+    now = timezone.now()
+    # An expired record is taken over by the next request with its key
+    IdempotencyRecord.objects.filter(key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=pending_ttl),
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyRecord.objects.filter(key=key).first(), False
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.content), status=record.status_code)
+    for header, value in record.headers.items():
+        response[header] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view_func=None, dedupe_uploads=False):
+    """
+    Replays the stored response to retries of a request sent with the same
+    ``Idempotency-Key`` header instead of running the view again.
+
+    The key is looked up by its primary key, so the lookup does not depend on the
+    number of stored keys. The first request inserts a pending record, concurrent
+    retries get a 409 response until it is done. Responses with a 5xx status are not
+    stored, the request can be retried. A key reused for a request with another body
+    gets a 422 response.
+
+    :param dedupe_uploads: Use the content hash of the uploaded files as key of
+        requests without an ``Idempotency-Key``, so the same file is imported once
+        per TTL. Only successful uploads are stored, uploads queued as import jobs
+        (202) are not, as their job may still fail.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            config = get_idempotency_config()
+            key = request.headers.get("Idempotency-Key")
+            content_key = (
+                not key
+                and dedupe_uploads
+                and config["DEDUPE_UPLOADS"]
+                and bool(request.FILES)
+            )
+            if not key and not content_key:
+                return view_func(request, *args, **kwargs)
+            if key and len(key) > MAX_KEY_LENGTH:
+                return JsonResponse(
+                    {"error": f"Idempotency keys are at most {MAX_KEY_LENGTH} long."},
+                    status=400,
+                )
+
+            fingerprint = request_fingerprint(request)
+            if content_key:
+                key = f"sha256:{fingerprint}"
+            record_key = hashlib.sha256(
+                f"{request.method} {request.path} {key}".encode()
+            ).hexdigest()
+            record, created = _claim(record_key, fingerprint, config["PENDING_TTL"])
+            if not created:
+                if record is None or record.status_code is None:
+                    response = JsonResponse(
+                        {"error": "A request with this key is in progress."},
+                        status=409,
+                    )
+                    response["Retry-After"] = "1"
+                    return response
+                if record.fingerprint != fingerprint:
+                    return JsonResponse(
+                        {"error": "The key was used for another request."}, status=422
+                    )
+                return _replay(record)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                IdempotencyRecord.objects.filter(key=record_key).delete()
+                raise
+            if (
+                response.streaming
+                or response.status_code >= 500
+                or (
+                    content_key
+                    and (response.status_code >= 400 or response.status_code == 202)
+                )
+            ):
+                IdempotencyRecord.objects.filter(key=record_key).delete()
+            else:
+                IdempotencyRecord.objects.filter(key=record_key).update(
+                    status_code=response.status_code,
+                    headers=dict(response.items()),
+                    content=response.content,
+                    expires_at=timezone.now() + timedelta(seconds=config["TTL"]),
+                )
+            return response
+
+        return wrapper
+
+    if view_func is not None:
+        return decorator(view_func)
+    return decorator
+
+
+def prune_idempotency_records(now=None):
+    """
+    Deletes the expired records in batches through the index on their expiry.
+
+    :return: The number of deleted records.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            IdempotencyRecord.objects.filter(expires_at__lte=now).values_list(
+                "key", flat=True
+            )[:DELETE_BATCH_SIZE]
+        )
+        if not keys:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(key__in=keys).delete()[0]
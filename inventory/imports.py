@@ -0,0 +1,654 @@
+import codecs
+import json
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ParseError, ValidationError
+
+from inventory.availability import articles_changed
+from inventory.bom import BOMCycleError, bom_changed
+from inventory.ledger import record_movements
+from inventory.logger import setup_logger
+from inventory.models import (Article, ProductArticle, ProductComponent,
+                              ProductConfig, StockMovement)
+from inventory.selling import lock_articles
+from inventory.serializers import (ArticleUploadSerializer,
+                                   ProductConfigUploadSerializer)
+from inventory.signals import bom_signals_suppressed
+
+# Setup logging
+logger = setup_logger(__name__)
+
+DEFAULT_IMPORT_CHUNK_SIZE = 1000
+DEFAULT_READ_SIZE = 64 * 1024
+JSON_WHITESPACE = " \t\r\n"
+
+
+def get_import_chunk_size():
+    return getattr(settings, "INVENTORY_IMPORT_CHUNK_SIZE", DEFAULT_IMPORT_CHUNK_SIZE)
+
+
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most ``size`` items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(stream, key, read_size=DEFAULT_READ_SIZE):
+    """
+    Lazily yields the items of the ``key`` array of a top level JSON object.
+
+    Only one item (plus one read buffer) is held in memory at a time, so the size of
+    the uploaded file does not matter. A missing key yields nothing.
+
+    :param stream: A binary or text file-like object.
+    :param key: The name of the array to iterate, e.g. "inventory".
+    :param read_size: The number of bytes read from the stream at once.
+    """
+    return _JSONArrayReader(stream, read_size).iter_array(key)
+
+
+def validate_rows(serializer_class, rows, offset=0, errors=None):
+    """
+    Validates a chunk of uploaded rows.
+
+    Without ``errors`` an invalid row fails the chunk. Otherwise invalid rows are
+    skipped and appended to ``errors`` as ``{"row": index, "errors": ...}``, where
+    index is the position of the row in the file.
+
+    :param serializer_class: The serializer validating one row.
+    :param rows: A list of raw dicts from the uploaded file.
+    :param offset: The position of the first row in the file.
+    :param errors: A list collecting the invalid rows, or None.
+    :return: The validated data of the valid rows.
+    :raises ValidationError: If a row is invalid and ``errors`` is None.
+    """
+    serializer = serializer_class(data=rows, many=True)
+    if serializer.is_valid():
+        return serializer.validated_data
+    if errors is None:
+        raise ValidationError(serializer.errors)
+
+    valid = []
+    for index, (row, row_errors) in enumerate(zip(rows, serializer.errors)):
+        if row_errors:
+            errors.append({"row": offset + index, "errors": row_errors})
+        else:
+            valid.append(row)
+    serializer = serializer_class(data=valid, many=True)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+class UnknownArticlesError(Exception):
+    """
+    Raised when uploaded product configurations reference articles that do not exist.
+
+    ``unknown_articles`` maps every affected product name to its unknown article ids.
+    """
+
+    def __init__(self, unknown_articles):
+        self.unknown_articles = unknown_articles
+        super().__init__(
+            f"{len(unknown_articles)} products reference unknown article ids."
+        )
+
+
+class UnknownProductsError(Exception):
+    """
+    Raised when uploaded product configurations contain sub-assemblies that neither
+    exist nor are part of the upload.
+
+    ``unknown_products`` maps every affected product name to its unknown
+    sub-assembly names.
+    """
+
+    def __init__(self, unknown_products):
+        self.unknown_products = unknown_products
+        super().__init__(
+            f"{len(unknown_products)} products reference unknown sub-assemblies."
+        )
+
+
+class _JSONArrayReader:
+    def __init__(self, stream, read_size):
+        self._stream = stream
+        self._read_size = read_size
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def iter_array(self, key):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            name = self._value()
+            if not isinstance(name, str):
+                raise ParseError("JSON parse error - object keys must be strings.")
+            self._expect(":")
+            if name == key and self._peek() == "[":
+                self._pos += 1
+                yield from self._items()
+            else:
+                self._value()
+            if self._expect(",}") == "}":
+                return
+
+    def _items(self):
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._read_size)
+        if not chunk:
+            self._eof = True
+            text = self._text_decoder.decode(b"", final=True)
+        elif isinstance(chunk, bytes):
+            text = self._text_decoder.decode(chunk)
+        else:
+            text = chunk
+        # Drop everything that has already been consumed
+        self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while (
+                self._pos < len(self._buffer)
+                and self._buffer[self._pos] in JSON_WHITESPACE
+            ):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ParseError(
+                f"JSON parse error - expected one of {chars!r} but found {char!r}."
+            )
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as exc:
+                # The value may just be cut off by the end of the buffer
+                if self._fill():
+                    continue
+                raise ParseError(f"JSON parse error - {exc}")
+            if (
+                end == len(self._buffer)
+                and not self._eof
+                and not isinstance(value, (dict, list, str))
+            ):
+                # A number at the end of the buffer may continue in the next read
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+
+class ArticleImporter:
+    """
+    Imports articles from an uploaded inventory file in chunks.
+
+    Every chunk is validated with ``ArticleUploadSerializer`` and applied with one
+    ``bulk_create`` and one ``bulk_update``: uploaded stock is added to the articles
+    which already exist and new articles are inserted. ``run`` imports the whole file
+    in a single transaction, background jobs commit every chunk on its own, see
+    ``inventory.jobs``.
+
+    :param chunk_size: The number of rows per chunk.
+    :param skip_invalid: Skip invalid rows and report them in ``errors`` instead of
+        failing the import.
+    """
+
+    key = "inventory"
+
+    def __init__(self, chunk_size=None, skip_invalid=False):
+        self.chunk_size = chunk_size or get_import_chunk_size()
+        self.stats = []
+        self.errors = [] if skip_invalid else None
+        # The position of the next chunk in the file
+        self.offset = 0
+
+    def run(self, stream):
+        """
+        Imports the ``inventory`` array of the given JSON file.
+
+        :param stream: The uploaded file object.
+        :return: A list with the throughput stats of every chunk.
+        """
+        started = time.perf_counter()
+        with transaction.atomic():
+            for rows in chunked(iter_json_array(stream, self.key), self.chunk_size):
+                self.apply_chunk(rows)
+            self.finish()
+
+        total_rows = sum(chunk["rows"] for chunk in self.stats)
+        logger.info(
+            f"Imported {total_rows} articles in {len(self.stats)} chunks "
+            f"({time.perf_counter() - started:.3f}s)"
+        )
+        return self.stats
+
+    def apply_chunk(self, rows):
+        """
+        Validates and applies one chunk of uploaded article rows.
+
+        :param rows: A list of raw article dicts from the uploaded file.
+        :return: The throughput stats of the chunk.
+        """
+        started = time.perf_counter()
+        validated_data = validate_rows(
+            ArticleUploadSerializer, rows, self.offset, self.errors
+        )
+        self.offset += len(rows)
+
+        # Merge rows repeating the same article, the first name wins
+        incoming = {}
+        for article_data in validated_data:
+            article_id = str(article_data["art_id"])
+            if article_id in incoming:
+                incoming[article_id]["stock"] += article_data["stock"]
+            else:
+                incoming[article_id] = {
+                    "name": article_data["name"],
+                    "stock": article_data["stock"],
+                }
+
+        existing = {article.id: article for article in lock_articles(incoming)}
+        for article_id, article_obj in existing.items():
+            article_obj.stock += incoming[article_id]["stock"]
+        Article.objects.bulk_update(existing.values(), ["stock"])
+
+        new_articles = [
+            Article(id=article_id, name=data["name"], stock=data["stock"])
+            for article_id, data in incoming.items()
+            if article_id not in existing
+        ]
+        Article.objects.bulk_create(new_articles)
+        deltas = {article_id: data["stock"] for article_id, data in incoming.items()}
+        record_movements(deltas, StockMovement.UPLOAD)
+        articles_changed(list(incoming), deltas)
+
+        seconds = time.perf_counter() - started
+        chunk_stats = {
+            "chunk": len(self.stats) + 1,
+            "rows": len(rows),
+            "created": len(new_articles),
+            "updated": len(existing),
+            "seconds": round(seconds, 6),
+            "rows_per_second": round(len(rows) / seconds, 1) if seconds else None,
+        }
+        self.stats.append(chunk_stats)
+        return chunk_stats
+
+    def resume(self, rows):
+        """
+        Skips a chunk applied before a job was interrupted, adding its stock again
+        would count it twice.
+        """
+        self.offset += len(rows)
+
+    def finish(self):
+        pass
+
+
+class ProductConfigImporter:
+    """
+    Imports product configurations from an uploaded products file in chunks.
+
+    For every chunk the referenced articles are resolved with one query and the stored
+    ``ProductArticle`` rows are diffed against the uploaded BOMs, so only the changed
+    lines are inserted, deleted or updated in bulk. Unknown article ids are collected
+    over the whole file and reported together, in which case nothing is imported.
+
+    Sub-assemblies (``contain_products``) may be defined anywhere in the file, so the
+    ``ProductComponent`` rows are diffed once all chunks are applied. A product
+    containing itself rolls back the whole import.
+
+    With ``skip_invalid`` invalid rows, products with unknown articles and products
+    with unknown sub-assemblies are skipped and reported in ``errors`` instead.
+    """
+
+    key = "products"
+
+    def __init__(self, chunk_size=None, skip_invalid=False):
+        self.chunk_size = chunk_size or get_import_chunk_size()
+        self.stats = []
+        self.errors = [] if skip_invalid else None
+        self.offset = 0
+        self.unknown_articles = {}
+        # The uploaded sub-assemblies, product ids and rows, all by product name
+        self.components = {}
+        self.product_ids = {}
+        self.rows = {}
+
+    def run(self, stream):
+        """
+        Imports the ``products`` array of the given JSON file.
+
+        :param stream: The uploaded file object.
+        :return: A list with the throughput stats of every chunk.
+        :raises UnknownArticlesError: If any BOM references an unknown article.
+        :raises UnknownProductsError: If any BOM references an unknown sub-assembly.
+        :raises BOMCycleError: If a product contains itself, the cycle is given by
+            product names.
+        """
+        started = time.perf_counter()
+        with transaction.atomic():
+            for rows in chunked(iter_json_array(stream, self.key), self.chunk_size):
+                self.apply_chunk(rows)
+            self.finish()
+
+        total_rows = sum(chunk["rows"] for chunk in self.stats)
+        logger.info(
+            f"Imported {total_rows} product configs in {len(self.stats)} chunks "
+            f"({time.perf_counter() - started:.3f}s)"
+        )
+        return self.stats
+
+    def apply_chunk(self, rows):
+        """
+        Validates and applies one chunk of uploaded product configuration rows.
+
+        Once an unknown article has been found the remaining chunks are only checked
+        for unknown articles, since the import is going to be rolled back anyway.
+
+        :param rows: A list of raw product dicts from the uploaded file.
+        :return: The throughput stats of the chunk.
+        """
+        started = time.perf_counter()
+        offset = self.offset
+        errors = [] if self.errors is not None else None
+        validated_data = validate_rows(
+            ProductConfigUploadSerializer, rows, offset, errors
+        )
+        self.offset += len(rows)
+
+        # A product repeated in the file is replaced by its last config, and an
+        # article repeated within a BOM keeps its first quantity
+        boms = {}
+        for product_data in validated_data:
+            bom = {}
+            for article_data in product_data["contain_articles"]:
+                bom.setdefault(article_data["art_id"], article_data["amount_of"])
+            boms[product_data["name"]] = bom
+            components = {}
+            for component_data in product_data["contain_products"]:
+                components.setdefault(
+                    component_data["name"], component_data["amount_of"]
+                )
+            self.components[product_data["name"]] = components
+
+        referenced = set().union(*boms.values())
+        known = set(
+            Article.objects.filter(id__in=referenced).values_list("id", flat=True)
+        )
+        for name, bom in boms.items():
+            missing = sorted(set(bom) - known)
+            if missing:
+                self.unknown_articles[name] = missing
+        if errors is not None:
+            self._skip_unknown_articles(rows, offset, boms, errors)
+            self.errors.extend(sorted(errors, key=lambda error: error["row"]))
+
+        chunk_stats = {
+            "chunk": len(self.stats) + 1,
+            "rows": len(rows),
+            "created": 0,
+            "lines_created": 0,
+            "lines_updated": 0,
+            "lines_deleted": 0,
+        }
+        if not self.unknown_articles:
+            product_ids, chunk_stats["created"] = self._resolve_products(list(boms))
+            chunk_stats.update(self._apply_boms(boms, product_ids))
+            self.product_ids.update(product_ids)
+
+        seconds = time.perf_counter() - started
+        chunk_stats["seconds"] = round(seconds, 6)
+        chunk_stats["rows_per_second"] = (
+            round(len(rows) / seconds, 1) if seconds else None
+        )
+        self.stats.append(chunk_stats)
+        return chunk_stats
+
+    def _skip_unknown_articles(self, rows, offset, boms, errors):
+        """
+        Reports the products of the chunk with unknown articles as invalid rows and
+        drops them from the import.
+        """
+        for index, row in enumerate(rows):
+            if isinstance(row, dict) and row.get("name") in boms:
+                self.rows[row["name"]] = offset + index
+        for name in list(boms):
+            missing = self.unknown_articles.pop(name, None)
+            if missing:
+                errors.append(
+                    {
+                        "row": self.rows[name],
+                        "errors": {
+                            "contain_articles": [f"Unknown articles {missing}."]
+                        },
+                    }
+                )
+                del boms[name]
+                del self.components[name]
+
+    def resume(self, rows):
+        """
+        Applies a chunk again which was applied before a job was interrupted.
+
+        Applying a BOM is idempotent, the chunk only collects the sub-assemblies
+        diffed by ``finish``. Its invalid rows were already reported.
+        """
+        errors = self.errors
+        if errors is not None:
+            self.errors = []
+        self.apply_chunk(rows)
+        self.errors = errors
+
+    def finish(self):
+        """
+        Checks the uploaded articles and applies the sub-assemblies, once all chunks
+        are applied.
+
+        :raises UnknownArticlesError: If any BOM references an unknown article.
+        :raises UnknownProductsError: If any BOM references an unknown sub-assembly.
+        :raises BOMCycleError: If a product contains itself.
+        """
+        if self.unknown_articles:
+            raise UnknownArticlesError(self.unknown_articles)
+        self.apply_components()
+
+    def _resolve_products(self, names):
+        """
+        Maps product names to ids, inserting the products which do not exist yet.
+        """
+        product_ids = {}
+        # If a name is stored more than once the oldest product is used
+        for product_id, name in (
+            ProductConfig.objects.filter(name__in=names)
+            .order_by("-id")
+            .values_list("id", "name")
+        ):
+            product_ids[name] = product_id
+
+        missing = [name for name in names if name not in product_ids]
+        ProductConfig.objects.bulk_create(ProductConfig(name=name) for name in missing)
+        product_ids.update(
+            ProductConfig.objects.filter(name__in=missing).values_list("name", "id")
+        )
+        return product_ids, len(missing)
+
+    def _apply_boms(self, boms, product_ids):
+        """
+        Diffs the stored BOM lines of the given products against the uploaded ones.
+        """
+        existing = defaultdict(dict)
+        to_delete = []
+        for line in ProductArticle.objects.filter(
+            product_id__in=product_ids.values()
+        ).only("id", "product_id", "article_id", "quantity"):
+            if line.article_id in existing[line.product_id]:
+                to_delete.append(line.id)
+            else:
+                existing[line.product_id][line.article_id] = line
+
+        to_create = []
+        to_update = []
+        for name, bom in boms.items():
+            product_id = product_ids[name]
+            current = existing.pop(product_id, {})
+            for article_id, quantity in bom.items():
+                line = current.pop(article_id, None)
+                if line is None:
+                    to_create.append(
+                        ProductArticle(
+                            product_id=product_id,
+                            article_id=article_id,
+                            quantity=quantity,
+                        )
+                    )
+                elif line.quantity != quantity:
+                    line.quantity = quantity
+                    to_update.append(line)
+            to_delete.extend(line.id for line in current.values())
+
+        # The BOMs are rebuilt once per chunk below, not per deleted line
+        with bom_signals_suppressed():
+            for ids in chunked(to_delete, DEFAULT_IMPORT_CHUNK_SIZE):
+                ProductArticle.objects.filter(id__in=ids).delete()
+        ProductArticle.objects.bulk_update(to_update, ["quantity"])
+        ProductArticle.objects.bulk_create(to_create)
+        bom_changed(product_ids.values())
+
+        return {
+            "lines_created": len(to_create),
+            "lines_updated": len(to_update),
+            "lines_deleted": len(to_delete),
+        }
+
+    def apply_components(self):
+        """
+        Diffs the stored sub-assemblies of the uploaded products against the uploaded
+        ones and rebuilds the requirements of the products whose sub-assemblies
+        changed.
+
+        :raises UnknownProductsError: If a sub-assembly is neither stored nor uploaded.
+        :raises BOMCycleError: If a product contains itself.
+        """
+        component_ids = dict(self.product_ids)
+        referenced = set().union(*self.components.values()) - set(component_ids)
+        # If a name is stored more than once the oldest product is used
+        for name_batch in chunked(referenced, self.chunk_size):
+            for product_id, name in (
+                ProductConfig.objects.filter(name__in=name_batch)
+                .order_by("-id")
+                .values_list("id", "name")
+            ):
+                component_ids[name] = product_id
+        unknown_products = {
+            name: sorted(set(components) - set(component_ids))
+            for name, components in self.components.items()
+            if set(components) - set(component_ids)
+        }
+        if unknown_products and self.errors is not None:
+            # Keep the stored sub-assemblies of these products
+            for name, components in sorted(
+                unknown_products.items(), key=lambda item: self.rows.get(item[0], 0)
+            ):
+                self.errors.append(
+                    {
+                        "row": self.rows.get(name),
+                        "errors": {
+                            "contain_products": [
+                                f"Unknown sub-assemblies {components}."
+                            ]
+                        },
+                    }
+                )
+                del self.components[name]
+        elif unknown_products:
+            raise UnknownProductsError(unknown_products)
+
+        existing = defaultdict(dict)
+        to_delete = []
+        for product_batch in chunked(self.product_ids.values(), self.chunk_size):
+            for line in ProductComponent.objects.filter(
+                product_id__in=product_batch
+            ).only("id", "product_id", "component_id", "quantity"):
+                if line.component_id in existing[line.product_id]:
+                    to_delete.append(line.id)
+                else:
+                    existing[line.product_id][line.component_id] = line
+
+        to_create = []
+        to_update = []
+        changed = set()
+        for name, components in self.components.items():
+            product_id = self.product_ids[name]
+            current = existing.pop(product_id, {})
+            for component_name, quantity in components.items():
+                component_id = component_ids[component_name]
+                line = current.pop(component_id, None)
+                if line is None:
+                    to_create.append(
+                        ProductComponent(
+                            product_id=product_id,
+                            component_id=component_id,
+                            quantity=quantity,
+                        )
+                    )
+                    changed.add(product_id)
+                elif line.quantity != quantity:
+                    line.quantity = quantity
+                    to_update.append(line)
+                    changed.add(product_id)
+            if current:
+                to_delete.extend(line.id for line in current.values())
+                changed.add(product_id)
+
+        # The BOMs are rebuilt once per chunk below, not per deleted line
+        with bom_signals_suppressed():
+            for ids in chunked(to_delete, DEFAULT_IMPORT_CHUNK_SIZE):
+                ProductComponent.objects.filter(id__in=ids).delete()
+        ProductComponent.objects.bulk_update(to_update, ["quantity"])
+        ProductComponent.objects.bulk_create(to_create)
+
+        try:
+            for product_batch in chunked(changed, self.chunk_size):
+                bom_changed(product_batch)
+        except BOMCycleError as e:
+            names = {product_id: name for name, product_id in component_ids.items()}
+            raise BOMCycleError(
+                [names.get(product_id, product_id) for product_id in e.cycle]
+            )
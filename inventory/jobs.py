@@ -0,0 +1,222 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from inventory.imports import (ArticleImporter, ProductConfigImporter, chunked,
+                               iter_json_array)
+from inventory.logger import setup_logger
+from inventory.models import ImportJob
+
+# Setup logging
+logger = setup_logger(__name__)
+
+DEFAULT_IMPORT_JOBS = {
+    # Uploads larger than this many bytes are imported by a background job, smaller
+    # ones within the request
+    "THRESHOLD": 1024 * 1024,
+    # Threads importing the queued jobs, 0 imports them within the request
+    "WORKERS": 2,
+    # Where uploads are stored until their job succeeded, BASE_DIR/uploads if None
+    "DIRECTORY": None,
+    # Invalid rows kept per job, further ones are only counted
+    "MAX_ERRORS": 1000,
+}
+
+IMPORTERS = {
+    ImportJob.ARTICLES: ArticleImporter,
+    ImportJob.PRODUCTS: ProductConfigImporter,
+}
+
+
+class JobInterrupted(Exception):
+    """
+    Raised when another runner advanced the checkpoint of a job, it owns the job.
+    """
+
+
+def get_import_jobs_config():
+    config = {**DEFAULT_IMPORT_JOBS, **getattr(settings, "INVENTORY_IMPORT_JOBS", {})}
+    if config["DIRECTORY"] is None:
+        config["DIRECTORY"] = os.path.join(settings.BASE_DIR, "uploads")
+    return config
+
+
+def create_job(kind, file):
+    """
+    Stores an uploaded file on disk and creates its queued import job.
+
+    :param kind: ``ImportJob.ARTICLES`` or ``ImportJob.PRODUCTS``.
+    :param file: The uploaded file object.
+    :return: The import job.
+    """
+    directory = get_import_jobs_config()["DIRECTORY"]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}-{uuid.uuid4().hex}.json")
+    with open(path, "wb") as f:
+        for data in file.chunks():
+            f.write(data)
+    return ImportJob.objects.create(kind=kind, path=path, size=os.path.getsize(path))
+
+
+def _checkpoint(job, importer, rows, position):
+    """
+    Advances the checkpoint of a job past a chunk, within the transaction of the
+    chunk.
+
+    The update is guarded by the previous checkpoint, so a chunk is committed once
+    even if a resumed job is still running elsewhere.
+
+    :raises JobInterrupted: If another runner advanced the checkpoint.
+    """
+    max_errors = get_import_jobs_config()["MAX_ERRORS"]
+    new_errors = importer.errors[: max(max_errors - len(job.errors), 0)]
+    # The sub-assemblies checked at the end are no chunk of their own
+    chunks = 1 if rows else 0
+    updated = ImportJob.objects.filter(pk=job.pk, rows_done=job.rows_done).update(
+        rows_done=job.rows_done + len(rows),
+        chunks_done=job.chunks_done + chunks,
+        position=position,
+        error_count=job.error_count + len(importer.errors),
+        errors=job.errors + new_errors,
+    )
+    if not updated:
+        raise JobInterrupted(f"Import job {job.pk} is run by another worker.")
+    job.rows_done += len(rows)
+    job.chunks_done += chunks
+    job.position = position
+    job.error_count += len(importer.errors)
+    job.errors = job.errors + new_errors
+    importer.errors.clear()
+
+
+def _finish(job, status, error=""):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
+
+
+def run_job(job_id, resume=False):
+    """
+    Imports the stored file of a job chunk by chunk.
+
+    Every chunk is applied in its own transaction together with the checkpoint of
+    the job, so its progress is visible while it runs and a resumed job continues
+    after the last committed chunk without adding uploaded stock twice. Invalid rows
+    are skipped and reported on the job.
+
+    :param job_id: The id of the job.
+    :param resume: Also run the job if it is marked running, e.g. after the process
+        running it crashed.
+    :return: The job, or None if it is not queued (or running if ``resume``).
+    """
+    statuses = [ImportJob.QUEUED, ImportJob.RUNNING] if resume else [ImportJob.QUEUED]
+    claimed = ImportJob.objects.filter(pk=job_id, status__in=statuses).update(
+        status=ImportJob.RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    job = ImportJob.objects.get(pk=job_id)
+    importer = IMPORTERS[job.kind](skip_invalid=True)
+
+    try:
+        with open(job.path, "rb") as stream:
+            rows = iter_json_array(stream, importer.key)
+            for chunk in chunked(islice(rows, job.rows_done), importer.chunk_size):
+                with transaction.atomic():
+                    importer.resume(chunk)
+            for chunk in chunked(rows, importer.chunk_size):
+                with transaction.atomic():
+                    importer.apply_chunk(chunk)
+                    _checkpoint(job, importer, chunk, stream.tell())
+            with transaction.atomic():
+                importer.finish()
+                # Unknown sub-assemblies are only found once all chunks are applied
+                _checkpoint(job, importer, [], job.size)
+                _finish(job, ImportJob.SUCCEEDED)
+    except JobInterrupted:
+        logger.warning(f"Import job {job.pk} was taken over by another worker")
+        return job
+    except Exception as e:
+        logger.exception(f"Import job {job.pk} failed")
+        _finish(job, ImportJob.FAILED, str(e))
+        return job
+
+    os.remove(job.path)
+    logger.info(
+        f"Import job {job.pk} imported {job.rows_done} {job.kind} rows in "
+        f"{job.chunks_done} chunks, {job.error_count} invalid"
+    )
+    return job
+
+
+def _run_in_worker(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def submit_job(job):
+    """
+    Queues a job on the worker threads configured by INVENTORY_IMPORT_JOBS, once the
+    current transaction committed. Without workers the job is run right away.
+
+    :return: The job.
+    """
+    workers = get_import_jobs_config()["WORKERS"]
+    if not workers:
+        return run_job(job.pk) or job
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                workers, thread_name_prefix="inventory-import"
+            )
+        executor = _executor
+    transaction.on_commit(lambda: executor.submit(_run_in_worker, job.pk))
+    return job
+
+
+def resume_jobs():
+    """
+    Runs the queued jobs and the jobs left running by a crashed process, oldest
+    first, in the current thread.
+
+    :return: The resumed jobs.
+    """
+    job_ids = list(
+        ImportJob.objects.filter(status__in=[ImportJob.QUEUED, ImportJob.RUNNING])
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    jobs = []
+    for job_id in job_ids:
+        job = run_job(job_id, resume=True)
+        if job is not None:
+            jobs.append(job)
+    return jobs
+
+
+@receiver(setting_changed)
+def reset_import_executor(setting, **kwargs):
+    global _executor
+    if setting == "INVENTORY_IMPORT_JOBS":
+        with _executor_lock:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = None
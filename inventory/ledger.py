@@ -0,0 +1,187 @@
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from inventory.availability import articles_changed
+from inventory.models import Article, StockMovement, StockSnapshot
+
+
+def record_movements(deltas, kind):
+    """
+    Appends one movement per changed article to the stock ledger.
+
+    The ledger is an audit trail written next to ``Article.stock``, which stays the
+    stock the sales read and guard.
+
+    :param deltas: A dict mapping article ids to their stock change.
+    :param kind: One of the ``StockMovement`` kinds.
+    """
+    StockMovement.objects.bulk_create(
+        StockMovement(article_id=article_id, delta=delta, kind=kind)
+        for article_id, delta in deltas.items()
+        if delta
+    )
+
+
+def _ledger(article_ids=None, until_movement=None):
+    """
+    Annotates articles with their latest snapshot and the movements after it.
+
+    Both are looked up per article through the (article, movement) indexes, so only
+    the movements newer than the snapshot are scanned.
+
+    :param article_ids: The articles to look up, all articles if None.
+    :param until_movement: Ignore snapshots and movements after this movement id.
+    """
+    snapshots = StockSnapshot.objects.filter(article_id=OuterRef("pk"))
+    movements = StockMovement.objects.filter(article_id=OuterRef("pk"))
+    if until_movement is not None:
+        snapshots = snapshots.filter(movement_id__lte=until_movement)
+        movements = movements.filter(id__lte=until_movement)
+    snapshots = snapshots.order_by("-movement_id")
+
+    queryset = (
+        Article.objects.all()
+        if article_ids is None
+        else Article.objects.filter(id__in=article_ids)
+    )
+    queryset = queryset.annotate(
+        snapshot_movement=Coalesce(
+            Subquery(snapshots.values("movement_id")[:1]), Value(0)
+        ),
+        snapshot_stock=Coalesce(Subquery(snapshots.values("stock")[:1]), Value(0)),
+    )
+    later = (
+        movements.filter(id__gt=OuterRef("snapshot_movement"))
+        .order_by()
+        .values("article_id")
+    )
+    return queryset.annotate(
+        movement_delta=Coalesce(
+            Subquery(later.annotate(total=Sum("delta")).values("total")), Value(0)
+        ),
+        last_movement=Coalesce(
+            Subquery(later.annotate(last=Max("id")).values("last")),
+            F("snapshot_movement"),
+        ),
+    )
+
+
+def current_stock(article_ids=None):
+    """
+    Returns the stock of articles according to the ledger, i.e. their latest snapshot
+    plus all movements after it.
+
+    :param article_ids: The articles to look up, all articles if None.
+    :return: A dict mapping article ids to their stock.
+    """
+    return {
+        article_id: snapshot_stock + movement_delta
+        for article_id, snapshot_stock, movement_delta in _ledger(
+            article_ids
+        ).values_list("id", "snapshot_stock", "movement_delta")
+    }
+
+
+def stock_at(article_ids, at):
+    """
+    Returns the stock articles had at a point in time.
+
+    The time is resolved to the last movement created by then, or to the last one
+    folded into a snapshot taken by then if the movements have been pruned.
+
+    :param article_ids: The articles to look up.
+    :param at: An aware datetime.
+    :return: A dict mapping article ids to their stock at that time.
+    """
+    until_movement = max(
+        StockMovement.objects.filter(created_at__lte=at).aggregate(last=Max("id"))[
+            "last"
+        ]
+        or 0,
+        StockSnapshot.objects.filter(taken_at__lte=at).aggregate(
+            last=Max("movement_id")
+        )["last"]
+        or 0,
+    )
+    return {
+        article_id: snapshot_stock + movement_delta
+        for article_id, snapshot_stock, movement_delta in _ledger(
+            article_ids, until_movement
+        ).values_list("id", "snapshot_stock", "movement_delta")
+    }
+
+
+def compact(article_ids=None):
+    """
+    Folds the movements of articles into new snapshots.
+
+    Only articles with movements after their latest snapshot get a new one, so the
+    stock lookups only have to scan the movements since the last compaction.
+
+    :param article_ids: The articles to compact, all articles if None.
+    :return: The number of snapshots taken.
+    """
+    snapshots = [
+        StockSnapshot(
+            article_id=article_id,
+            movement_id=last_movement,
+            stock=snapshot_stock + movement_delta,
+        )
+        for article_id, last_movement, snapshot_stock, movement_delta in _ledger(
+            article_ids
+        )
+        .filter(last_movement__gt=F("snapshot_movement"))
+        .values_list("id", "last_movement", "snapshot_stock", "movement_delta")
+        .iterator()
+    ]
+    StockSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+
+def prune_movements(before):
+    """
+    Deletes movements created before ``before`` that are folded into a snapshot.
+
+    Point in time lookups still resolve times after the snapshots were taken. Times
+    between a pruned movement and the snapshot folding it in return the stock of the
+    previous snapshot, as the movements in between are gone.
+
+    :return: The number of deleted movements.
+    """
+    latest_snapshot = (
+        StockSnapshot.objects.filter(article_id=OuterRef("article_id"))
+        .order_by("-movement_id")
+        .values("movement_id")[:1]
+    )
+    deleted, _ = StockMovement.objects.filter(
+        created_at__lt=before, id__lte=Subquery(latest_snapshot)
+    ).delete()
+    return deleted
+
+
+def rebuild_article_stock(article_ids=None):
+    """
+    Replays the ledger into ``Article.stock`` and refreshes the affected products.
+
+    :param article_ids: The articles to rebuild, all articles if None.
+    :return: The ids of the articles whose stock was corrected.
+    """
+    stock = {
+        article_id: (old_stock, snapshot_stock + movement_delta)
+        for article_id, old_stock, snapshot_stock, movement_delta in _ledger(
+            article_ids
+        )
+        .values_list("id", "stock", "snapshot_stock", "movement_delta")
+        .iterator()
+        if old_stock != snapshot_stock + movement_delta
+    }
+    Article.objects.bulk_update(
+        [Article(id=article_id, stock=new) for article_id, (_, new) in stock.items()],
+        ["stock"],
+    )
+    changed = list(stock)
+    if changed:
+        articles_changed(
+            changed, {article_id: new - old for article_id, (old, new) in stock.items()}
+        )
+    return changed
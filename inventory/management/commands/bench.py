@@ -0,0 +1,373 @@
+import asyncio
+import json
+import math
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from inventory.models import ProductConfig
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a list of values.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the upload, listing, availability and sell endpoints against a "
+        "synthetic catalogue in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--articles", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=200)
+        parser.add_argument(
+            "--fanout", type=int, default=10, help="Number of articles per product."
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=100,
+            help="Number of requests per read and sell scenario.",
+        )
+        parser.add_argument(
+            "--upload-iterations",
+            type=int,
+            default=3,
+            help="Number of requests per upload scenario.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=0,
+            help="Also compare the throughput of the sync (WSGI) and async (ASGI) "
+            "product endpoints with this many concurrent clients.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Disable the product response cache.",
+        )
+        parser.add_argument(
+            "--label", default="", help="A name for the run, e.g. a commit hash."
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="A previous results file to compare the run against."
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        bench_settings = {
+            # Time the imports within the request, not the queueing of background
+            # jobs the later scenarios would race against
+            "INVENTORY_IMPORT_JOBS": {"THRESHOLD": math.inf, "WORKERS": 0},
+            # Every upload iteration sends the same file, import it each time instead
+            # of replaying the response of the first one
+            "INVENTORY_IDEMPOTENCY": {"DEDUPE_UPLOADS": False},
+        }
+        if options["no_cache"]:
+            bench_settings["INVENTORY_PRODUCT_CACHE"] = {"BACKEND": None}
+        try:
+            with override_settings(**bench_settings):
+                results = self.run_scenarios(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "label": options["label"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "config": {
+                key: options[key]
+                for key in (
+                    "articles",
+                    "products",
+                    "fanout",
+                    "iterations",
+                    "upload_iterations",
+                    "concurrency",
+                    "seed",
+                    "no_cache",
+                )
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "results": results,
+        }
+        self.print_report(report)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.print_comparison(json.load(f), report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run_scenarios(self, options):
+        rng = random.Random(options["seed"])
+        client = Client()
+        inventory = {
+            "inventory": [
+                {
+                    "art_id": str(article_id),
+                    "name": f"article {article_id}",
+                    "stock": str(rng.randint(100, 10000)),
+                }
+                for article_id in range(1, options["articles"] + 1)
+            ]
+        }
+        fanout = min(options["fanout"], options["articles"])
+        products = {
+            "products": [
+                {
+                    "name": f"product {product_number}",
+                    "contain_articles": [
+                        {"art_id": str(article_id), "amount_of": str(rng.randint(1, 4))}
+                        for article_id in rng.sample(
+                            range(1, options["articles"] + 1), fanout
+                        )
+                    ],
+                }
+                for product_number in range(1, options["products"] + 1)
+            ]
+        }
+        self.rng = rng
+        inventory_file = json.dumps(inventory).encode()
+        products_file = json.dumps(products).encode()
+
+        def upload(url_name, content):
+            return lambda: client.post(
+                reverse(url_name),
+                {"file": SimpleUploadedFile("upload.json", content)},
+            )
+
+        results = {}
+        results["upload_articles"] = self.measure(
+            upload("inventory:upload-articles", inventory_file),
+            options["upload_iterations"],
+        )
+        results["upload_products_config"] = self.measure(
+            upload("inventory:upload-products-config", products_file),
+            options["upload_iterations"],
+        )
+
+        product_ids = list(ProductConfig.objects.values_list("id", flat=True))
+        results["product_list"] = self.measure(
+            lambda: client.get(reverse("inventory:product-list")),
+            options["iterations"],
+        )
+        results["product_detail"] = self.measure(
+            lambda: client.get(
+                reverse("inventory:product-details", args=[rng.choice(product_ids)])
+            ),
+            options["iterations"],
+        )
+        results["product_sell"] = self.measure(
+            lambda: client.put(
+                reverse("inventory:product-sell", args=[rng.choice(product_ids)]),
+                data={"quantity": 1},
+                content_type="application/json",
+            ),
+            options["iterations"],
+        )
+        if options["concurrency"]:
+            results.update(
+                self.compare_servers(
+                    product_ids, options["iterations"], options["concurrency"]
+                )
+            )
+        return results
+
+    def compare_servers(self, product_ids, iterations, concurrency):
+        """
+        Sends the same product list and sell load to the sync and the async views,
+        from ``concurrency`` threads (WSGI) and ``concurrency`` tasks (ASGI).
+
+        The async views run their database work in the single thread sensitive
+        ``sync_to_async`` thread, so the ASGI numbers measure the tasks queueing for
+        that one thread, not parallel database work.
+        """
+        results = {}
+        for name, sync_url, async_url, method in (
+            (
+                "product_list",
+                "inventory:product-list",
+                "inventory:async-product-list",
+                "get",
+            ),
+            (
+                "product_sell",
+                "inventory:product-sell",
+                "inventory:async-product-sell",
+                "put",
+            ),
+        ):
+            sync_requests = [
+                self.concurrent_request(sync_url, method, product_ids)
+                for _ in range(iterations)
+            ]
+            async_requests = [
+                self.concurrent_request(async_url, method, product_ids)
+                for _ in range(iterations)
+            ]
+            results[f"wsgi_{name}"] = self.measure_threads(sync_requests, concurrency)
+            results[f"asgi_{name}"] = self.measure_tasks(async_requests, concurrency)
+        return results
+
+    def concurrent_request(self, url_name, method, product_ids):
+        if method == "get":
+            return method, reverse(url_name), {}
+        url = reverse(url_name, args=[self.rng.choice(product_ids)])
+        return (
+            method,
+            url,
+            {"data": {"quantity": 1}, "content_type": "application/json"},
+        )
+
+    def measure_threads(self, requests, concurrency):
+        def send(request):
+            method, url, kwargs = request
+            client = Client(raise_request_exception=False)
+            try:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, **kwargs)
+                return (time.perf_counter() - started) * 1000, response.status_code
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            outcomes = list(executor.map(send, requests))
+        return self.throughput(outcomes, time.perf_counter() - started, concurrency)
+
+    def measure_tasks(self, requests, concurrency):
+        async def send_all():
+            client = AsyncClient(raise_request_exception=False)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send(request):
+                method, url, kwargs = request
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await getattr(client, method)(url, **kwargs)
+                    return (time.perf_counter() - started) * 1000, response.status_code
+
+            return await asyncio.gather(*(send(request) for request in requests))
+
+        started = time.perf_counter()
+        outcomes = asyncio.run(send_all())
+        return self.throughput(outcomes, time.perf_counter() - started, concurrency)
+
+    def throughput(self, outcomes, seconds, concurrency):
+        latencies = [latency for latency, _ in outcomes]
+        statuses = {}
+        for _, status_code in outcomes:
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        return {
+            "requests": len(outcomes),
+            "concurrency": concurrency,
+            "status_codes": statuses,
+            "requests_per_second": round(len(outcomes) / seconds, 1),
+            "latency_ms": {
+                "mean": round(statistics.mean(latencies), 3),
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "p99": round(percentile(latencies, 99), 3),
+            },
+        }
+
+    def measure(self, request, iterations):
+        """
+        Sends ``iterations`` requests and returns their latency and query stats.
+
+        The peak memory is measured by one extra request, since tracing the
+        allocations would distort the latencies.
+        """
+        latencies = []
+        queries = []
+        statuses = {}
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        tracemalloc.start()
+        try:
+            request()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "requests": iterations,
+            "status_codes": {str(code): count for code, count in statuses.items()},
+            "latency_ms": {
+                "mean": round(statistics.mean(latencies), 3),
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "p99": round(percentile(latencies, 99), 3),
+            },
+            "queries_per_request": {
+                "mean": round(statistics.mean(queries), 2),
+                "max": max(queries),
+            },
+            "peak_memory_kb": round(peak_memory / 1024, 1),
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'scenario':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'queries':>10}{'peak KB':>12}{'req/s':>10}"
+        )
+        for scenario, result in report["results"].items():
+            latency = result["latency_ms"]
+            # The concurrent scenarios report throughput instead of queries and memory
+            queries = result.get("queries_per_request", {}).get("mean", "-")
+            self.stdout.write(
+                f"{scenario:<24}{latency['p50']:>10}{latency['p95']:>10}"
+                f"{latency['p99']:>10}{queries:>10}"
+                f"{result.get('peak_memory_kb', '-'):>12}"
+                f"{result.get('requests_per_second', '-'):>10}"
+            )
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(f"Compared to {baseline.get('label') or 'the baseline'}:")
+        for scenario, result in report["results"].items():
+            previous = baseline["results"].get(scenario)
+            if not previous:
+                continue
+            changes = []
+            for metric in ("p50", "p95", "p99"):
+                before = previous["latency_ms"][metric]
+                after = result["latency_ms"][metric]
+                change = (after - before) / before * 100 if before else 0
+                changes.append(f"{metric} {change:+.1f}%")
+            self.stdout.write(f"  {scenario:<24}{'  '.join(changes)}")
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.changes import prune_changes
+from inventory.ledger import compact, prune_movements, rebuild_article_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds the stock movements into snapshots. Meant to run periodically, "
+        "e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prune-days",
+            type=int,
+            help=(
+                "Delete compacted movements and inventory changes older than this "
+                "many days."
+            ),
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Replay the ledger into the stock of the articles afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            snapshots = compact()
+        self.stdout.write(f"Took {snapshots} snapshots.")
+
+        if options["prune_days"] is not None:
+            before = timezone.now() - timedelta(days=options["prune_days"])
+            with transaction.atomic():
+                deleted = prune_movements(before)
+                pruned_changes = prune_changes(before)
+            self.stdout.write(f"Deleted {deleted} compacted movements.")
+            self.stdout.write(f"Deleted {pruned_changes} inventory changes.")
+
+        if options["rebuild"]:
+            with transaction.atomic():
+                changed = rebuild_article_stock()
+            self.stdout.write(f"Corrected the stock of {len(changed)} articles.")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
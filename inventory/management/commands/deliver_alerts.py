@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from inventory.alerts import deliver_alerts, get_alerts_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers the pending reorder alerts to the configured sink. Run it "
+        "periodically, e.g. from cron, failed batches are retried by the next run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=get_alerts_config()["BATCH_SIZE"],
+            help="Events delivered per batch.",
+        )
+
+    def handle(self, *args, **options):
+        delivered = deliver_alerts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} alert events."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from inventory.snapshot import DEFAULT_SNAPSHOT_CHUNK_SIZE, dump_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the articles, product configurations, their BOMs and the stock of "
+        "the warehouses to a binary snapshot file, see load_inventory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The snapshot file to write.")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_SNAPSHOT_CHUNK_SIZE,
+            help="Rows per frame, only one frame is held in memory at a time.",
+        )
+
+    def handle(self, *args, **options):
+        with open(options["path"], "wb") as stream:
+            counts = dump_snapshot(stream, options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Dumped {sum(counts.values())} rows to {options['path']}."
+            )
+        )
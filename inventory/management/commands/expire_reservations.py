@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from inventory.reservations import expire_reservations, get_reservation_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Releases the stock held by expired reservations. Run it periodically, e.g. "
+        "from cron, reservations are also swept before every new one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=get_reservation_config()["SWEEP_BATCH_SIZE"],
+            help="Reservations expired per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        expired = expire_reservations(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} reservations."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.snapshot import SnapshotError, load_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads a snapshot file written by dump_inventory into an empty catalogue "
+        "and rebuilds the availability of the products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The snapshot file to load.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            counts = load_snapshot(options["path"])
+        except (OSError, SnapshotError) as e:
+            raise CommandError(e)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {sum(counts.values())} rows from {options['path']} in "
+                f"{time.perf_counter() - start:.2f}s."
+            )
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory.idempotency import prune_idempotency_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the stored responses of idempotency keys whose TTL passed. Expired "
+        "keys are not replayed anyway, run it periodically to keep the store small."
+    )
+
+    def handle(self, *args, **options):
+        deleted = prune_idempotency_records()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired keys."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.availability import rebuild_availability
+from inventory.bom import rebuild_requirements
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the flattened article requirements and the materialized "
+        "availability of all products."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            requirements = rebuild_requirements()
+            changes = rebuild_availability()
+        self.stdout.write(
+            f"Rebuilt the article requirements of {len(requirements)} products."
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated the availability of {len(changes)} products.")
+        )
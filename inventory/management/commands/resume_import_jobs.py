@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from inventory.jobs import resume_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports the queued uploads and resumes the ones interrupted by a crash "
+        "after their last committed chunk."
+    )
+
+    def handle(self, *args, **options):
+        for job in resume_jobs():
+            self.stdout.write(
+                f"Import job {job.id} ({job.kind}): {job.status}, {job.rows_done} rows, "
+                f"{job.error_count} invalid"
+            )
+            if job.error:
+                self.stderr.write(job.error)
+        self.stdout.write(self.style.SUCCESS("Resumed the pending import jobs."))
@@ -0,0 +1,162 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds of the histogram buckets, the last bucket catches everything above
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram, recording a value is a binary search and an increment.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q-quantile, None if it is
+        in the overflow bucket.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        buckets = {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """
+    Aggregates the request metrics of this process per view name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, request_metrics):
+        with self._lock:
+            histograms = self._views.get(view_name)
+            if histograms is None:
+                histograms = self._views[view_name] = {
+                    "wall_ms": Histogram(LATENCY_BUCKETS_MS),
+                    "db_ms": Histogram(LATENCY_BUCKETS_MS),
+                    "db_queries": Histogram(QUERY_COUNT_BUCKETS),
+                }
+            histograms["wall_ms"].record(request_metrics.wall_ms)
+            histograms["db_ms"].record(request_metrics.db_ms)
+            histograms["db_queries"].record(request_metrics.db_queries)
+            for section, milliseconds in request_metrics.sections.items():
+                key = f"{section}_ms"
+                if key not in histograms:
+                    histograms[key] = Histogram(LATENCY_BUCKETS_MS)
+                histograms[key].record(milliseconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view_name: {
+                    name: histogram.snapshot() for name, histogram in histograms.items()
+                }
+                for view_name, histograms in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+class RequestMetrics:
+    """
+    The metrics of the request currently being handled.
+    """
+
+    def __init__(self):
+        self.wall_ms = 0
+        self.db_ms = 0
+        self.db_queries = 0
+        self.sections = {}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        Counts and times every query, see ``connection.execute_wrapper``.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.db_queries += 1
+
+    def as_dict(self):
+        return {
+            "wall_ms": round(self.wall_ms, 3),
+            "db_ms": round(self.db_ms, 3),
+            "db_queries": self.db_queries,
+            **{f"{name}_ms": round(ms, 3) for name, ms in self.sections.items()},
+        }
+
+
+registry = MetricsRegistry()
+current_request = ContextVar("inventory_request_metrics", default=None)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    Counts and times the queries of the current request.
+
+    Installed on every connection when it is created (see ``inventory.signals``),
+    since under ASGI the queries run on connections of the ``sync_to_async`` thread
+    rather than the thread handling the request. The context variable is copied to
+    that thread, so the queries are still attributed to the right request.
+    """
+    request_metrics = current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    return request_metrics.execute_wrapper(execute, sql, params, many, context)
+
+
+@contextmanager
+def track(section):
+    """
+    Adds the time spent in the block to a section of the current request's metrics,
+    e.g. ``with track("serialization"): ...``. Outside of a request this is a no-op.
+    """
+    request_metrics = current_request.get()
+    if request_metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.sections[section] = request_metrics.sections.get(section, 0) + (
+            (time.perf_counter() - started) * 1000
+        )
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from inventory.logger import setup_logger
+from inventory.metrics import RequestMetrics, current_request, registry
+
+# Setup logging
+logger = setup_logger(
+    __name__, level=getattr(settings, "INVENTORY_METRICS_LOG_LEVEL", logging.INFO)
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the wall time, DB query count, DB time and instrumented sections (see
+    ``inventory.metrics.track``) of every request.
+
+    The metrics are logged as one JSON line per request and aggregated per view in
+    ``inventory.metrics.registry``, which is served by the metrics endpoint. The
+    middleware is sync and async capable, so it does not force the async views into
+    a thread under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function so Django awaits it
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request_metrics = RequestMetrics()
+        token = current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        request_metrics.wall_ms = (time.perf_counter() - started) * 1000
+        self.record(request, response, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        request_metrics = RequestMetrics()
+        token = current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        request_metrics.wall_ms = (time.perf_counter() - started) * 1000
+        self.record(request, response, request_metrics)
+        return response
+
+    def record(self, request, response, request_metrics):
+        """
+        Aggregates the metrics of a finished request and logs them.
+
+        The queries are counted by ``inventory.metrics.execute_wrapper``, which is
+        installed on every connection.
+        """
+        match = request.resolver_match
+        view_name = match.view_name if match else "unresolved"
+        registry.record(view_name, request_metrics)
+        logger.info(
+            json.dumps(
+                {
+                    "view": view_name,
+                    "method": request.method,
+                    "status": response.status_code,
+                    **request_metrics.as_dict(),
+                }
+            )
+        )
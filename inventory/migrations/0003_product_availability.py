@@ -0,0 +1,55 @@
+# Generated by Django 3.2.18 on 2026-10-18 12:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, Min
+
+
+def populate_product_availability(apps, schema_editor):
+    ProductArticle = apps.get_model("inventory", "ProductArticle")
+    ProductAvailability = apps.get_model("inventory", "ProductAvailability")
+
+    rows = (
+        ProductArticle.objects.filter(quantity__gt=0)
+        .values("product_id")
+        .annotate(
+            stock=ExpressionWrapper(
+                Min(F("article__stock") / F("quantity")),
+                output_field=models.IntegerField(),
+            )
+        )
+        .values_list("product_id", "stock")
+    )
+    ProductAvailability.objects.bulk_create(
+        ProductAvailability(product_id=product_id, stock=stock)
+        for product_id, stock in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_alter_article_stock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductAvailability",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="availability",
+                        serialize=False,
+                        to="inventory.productconfig",
+                    ),
+                ),
+                ("stock", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(
+            populate_product_availability, migrations.RunPython.noop
+        ),
+    ]
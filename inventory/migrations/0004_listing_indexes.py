@@ -0,0 +1,28 @@
+# Generated by Django 3.2.18 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_product_availability"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="article",
+            name="name",
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name="article",
+            name="stock",
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name="productconfig",
+            name="name",
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 3.2.18 on 2026-10-18 12:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_baseline_snapshots(apps, schema_editor):
+    # The stock of the existing articles becomes the starting point of the ledger
+    Article = apps.get_model("inventory", "Article")
+    StockSnapshot = apps.get_model("inventory", "StockSnapshot")
+    StockSnapshot.objects.bulk_create(
+        StockSnapshot(article_id=article_id, movement_id=0, stock=stock)
+        for article_id, stock in Article.objects.values_list("id", "stock")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0004_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("movement_id", models.BigIntegerField()),
+                ("stock", models.IntegerField()),
+                ("taken_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.article",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StockMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("delta", models.IntegerField()),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("upload", "Upload"),
+                            ("sell", "Sell"),
+                            ("adjustment", "Adjustment"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.article",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="stocksnapshot",
+            index=models.Index(
+                fields=["article", "-movement_id"],
+                name="inventory_s_article_9ada93_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["article", "id"], name="inventory_s_article_352aa8_idx"
+            ),
+        ),
+        migrations.RunPython(create_baseline_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.2.18 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_bottleneck_articles(apps, schema_editor):
+    ProductArticle = apps.get_model("inventory", "ProductArticle")
+    ProductAvailability = apps.get_model("inventory", "ProductAvailability")
+
+    # The article with the lowest stock / quantity of every product, the article id
+    # breaks ties
+    bottlenecks = {}
+    lines = (
+        ProductArticle.objects.filter(quantity__gt=0)
+        .values_list("product_id", "article_id", "article__stock", "quantity")
+        .iterator()
+    )
+    for product_id, article_id, stock, quantity in lines:
+        headroom = (stock // quantity, article_id)
+        if product_id not in bottlenecks or headroom < bottlenecks[product_id]:
+            bottlenecks[product_id] = headroom
+
+    rows = list(ProductAvailability.objects.filter(product_id__in=list(bottlenecks)))
+    for row in rows:
+        row.bottleneck_article_id = bottlenecks[row.product_id][1]
+    ProductAvailability.objects.bulk_update(rows, ["bottleneck_article"], 1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0005_stock_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productavailability",
+            name="bottleneck_article",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="inventory.article",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="productarticle",
+            name="article",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="inventory.article",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productarticle",
+            index=models.Index(
+                fields=["article", "product", "quantity"],
+                name="inventory_p_article_3872fc_idx",
+            ),
+        ),
+        migrations.RunPython(populate_bottleneck_articles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+def populate_second_headroom(apps, schema_editor):
+    ProductArticle = apps.get_model("inventory", "ProductArticle")
+    ProductAvailability = apps.get_model("inventory", "ProductAvailability")
+
+    # The two lowest headrooms (stock / quantity) of every product
+    headrooms = {}
+    lines = (
+        ProductArticle.objects.filter(quantity__gt=0)
+        .values_list("product_id", "article__stock", "quantity")
+        .iterator()
+    )
+    for product_id, stock, quantity in lines:
+        lowest = sorted(headrooms.get(product_id, []) + [stock // quantity])
+        headrooms[product_id] = lowest[:2]
+
+    rows = list(ProductAvailability.objects.filter(product_id__in=list(headrooms)))
+    for row in rows:
+        lowest = headrooms[row.product_id]
+        row.second_headroom = lowest[1] if len(lowest) > 1 else None
+    ProductAvailability.objects.bulk_update(rows, ["second_headroom"], 1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0006_article_impact_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productavailability",
+            name="second_headroom",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="productavailability",
+            index=models.Index(
+                fields=["stock", "second_headroom"], name="inventory_p_stock_3e4f36_idx"
+            ),
+        ),
+        migrations.RunPython(populate_second_headroom, migrations.RunPython.noop),
+    ]
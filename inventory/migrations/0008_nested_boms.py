@@ -0,0 +1,114 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_product_requirements(apps, schema_editor):
+    ProductArticle = apps.get_model("inventory", "ProductArticle")
+    ProductRequirement = apps.get_model("inventory", "ProductRequirement")
+
+    # Without sub-assemblies the requirements are the BOM lines, merged per article
+    requirements = {}
+    lines = ProductArticle.objects.filter(quantity__gt=0).values_list(
+        "product_id", "article_id", "quantity"
+    )
+    for product_id, article_id, quantity in lines.iterator():
+        key = (product_id, article_id)
+        requirements[key] = requirements.get(key, 0) + quantity
+    ProductRequirement.objects.bulk_create(
+        (
+            ProductRequirement(
+                product_id=product_id, article_id=article_id, quantity=quantity
+            )
+            for (product_id, article_id), quantity in requirements.items()
+        ),
+        1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0007_availability_headroom"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductRequirement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+                (
+                    "article",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.article",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="requirements",
+                        to="inventory.productconfig",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ProductComponent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+                (
+                    "component",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="used_in",
+                        to="inventory.productconfig",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="components",
+                        to="inventory.productconfig",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="productrequirement",
+            index=models.Index(
+                fields=["article", "product", "quantity"],
+                name="inventory_p_article_66f69b_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productrequirement",
+            constraint=models.UniqueConstraint(
+                fields=("product", "article"), name="unique_product_requirement"
+            ),
+        ),
+        migrations.RunPython(populate_product_requirements, migrations.RunPython.noop),
+    ]
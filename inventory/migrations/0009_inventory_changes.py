@@ -0,0 +1,36 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_nested_boms"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("article", "Article"), ("product", "Product")],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.CharField(max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
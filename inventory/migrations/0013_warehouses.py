@@ -0,0 +1,78 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0012_idempotency_records"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Warehouse",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(max_length=20, unique=True)),
+                ("name", models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="located",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="LocationStock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stock", models.PositiveIntegerField(default=0)),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="locations",
+                        to="inventory.article",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="inventory.warehouse",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="locationstock",
+            index=models.Index(
+                fields=["article", "warehouse", "stock"],
+                name="inventory_l_article_10bce4_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="locationstock",
+            constraint=models.UniqueConstraint(
+                fields=("warehouse", "article"), name="unique_location_stock"
+            ),
+        ),
+    ]
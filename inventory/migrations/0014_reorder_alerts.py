@@ -0,0 +1,67 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0013_warehouses"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlertEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("article", "Article"), ("product", "Product")],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.CharField(max_length=100)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[("low", "Low"), ("restocked", "Restocked")],
+                        max_length=20,
+                    ),
+                ),
+                ("level", models.PositiveIntegerField()),
+                ("old_stock", models.PositiveIntegerField()),
+                ("new_stock", models.PositiveIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("delivered_at", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="reorder_level",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="productconfig",
+            name="reorder_level",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="alertevent",
+            index=models.Index(
+                condition=models.Q(("delivered_at__isnull", True)),
+                fields=["id"],
+                name="pending_alert_events",
+            ),
+        ),
+    ]
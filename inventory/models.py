@@ -1,18 +1,66 @@
+import threading
+
 from django.db import models
+from django.db.models import Q
+
+_deleting = threading.local()
+
+
+def deleting_products():
+    """
+    Returns the ids of the products the current thread is deleting, their BOM lines
+    are deleted first and must not rebuild the requirements of the product.
+    """
+    if not hasattr(_deleting, "products"):
+        _deleting.products = set()
+    return _deleting.products
 
 
 class Article(models.Model):
     id = models.CharField(primary_key=True, max_length=100)
-    name = models.CharField(max_length=100)
-    stock = models.PositiveIntegerField(default=0)
+    name = models.CharField(max_length=100, db_index=True)
+    stock = models.PositiveIntegerField(default=0, db_index=True)
+    # Units held by active reservations, they are still part of the stock but can
+    # not be sold
+    reserved = models.PositiveIntegerField(default=0)
+    # Units of the stock kept at warehouses (the sum of its LocationStock rows), they
+    # are only sold through the site sales
+    located = models.PositiveIntegerField(default=0)
+    # An alert is raised when the stock falls to or below this level, see
+    # inventory.alerts
+    reorder_level = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.name
 
 
+class ProductConfigQuerySet(models.QuerySet):
+    def delete(self):
+        product_ids = set(self.values_list("id", flat=True))
+        deleting_products().update(product_ids)
+        try:
+            return super().delete()
+        finally:
+            # Also if the delete failed, later BOM edits must rebuild the products
+            deleting_products().difference_update(product_ids)
+
+
 class ProductConfig(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     articles = models.ManyToManyField(Article, through="ProductArticle")
+    # An alert is raised when the units that can be built fall to or below this level
+    reorder_level = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = ProductConfigQuerySet.as_manager()
+
+    def delete(self, *args, **kwargs):
+        # The delete resets the primary key of the instance
+        product_id = self.pk
+        deleting_products().add(product_id)
+        try:
+            return super().delete(*args, **kwargs)
+        finally:
+            deleting_products().discard(product_id)
 
     def __str__(self):
         return f"{self.name}"
@@ -20,8 +68,377 @@ class ProductConfig(models.Model):
 
 class ProductArticle(models.Model):
     product = models.ForeignKey(ProductConfig, on_delete=models.CASCADE)
-    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    # Indexed by the covering index below
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, db_index=False)
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        # Answers which products use an article (and how many units) from the index
+        # alone, even for articles used by tens of thousands of products
+        indexes = [models.Index(fields=["article", "product", "quantity"])]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.article.name} ({self.quantity})"
+
+
+class ProductComponent(models.Model):
+    """
+    A sub-assembly contained in a product, e.g. a drawer unit used in a dresser.
+    """
+
+    product = models.ForeignKey(
+        ProductConfig, on_delete=models.CASCADE, related_name="components"
+    )
+    component = models.ForeignKey(
+        ProductConfig, on_delete=models.CASCADE, related_name="used_in"
+    )
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.product.name} - {self.component.name} ({self.quantity})"
+
+
+class ProductRequirement(models.Model):
+    """
+    The articles a product needs in total, its own articles plus the articles of its
+    sub-assemblies times their quantities.
+
+    Kept up to date by ``inventory.bom`` whenever a BOM changes, so availability and
+    sales never have to walk the sub-assemblies.
+    """
+
+    # Indexed by the unique constraint below
+    product = models.ForeignKey(
+        ProductConfig,
+        on_delete=models.CASCADE,
+        related_name="requirements",
+        db_index=False,
+    )
+    # Indexed by the covering index below
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, db_index=False)
     quantity = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "article"], name="unique_product_requirement"
+            )
+        ]
+        indexes = [models.Index(fields=["article", "product", "quantity"])]
+
     def __str__(self):
         return f"{self.product.name} - {self.article.name} ({self.quantity})"
+
+
+class ProductAvailability(models.Model):
+    """
+    Materialized number of units of a product that can be built from the current stock.
+
+    Kept up to date by ``inventory.availability`` whenever stock or a BOM changes.
+    """
+
+    product = models.OneToOneField(
+        ProductConfig,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="availability",
+    )
+    stock = models.PositiveIntegerField(default=0)
+    # The article with the least stock relative to the quantity the product needs
+    bottleneck_article = models.ForeignKey(
+        Article, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    # The units the second tightest article would allow, None for single article
+    # products
+    second_headroom = models.PositiveIntegerField(null=True, blank=True)
+    # The units that can be built from the stock not held by reservations
+    available = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Serves the most constrained products from the index
+        indexes = [models.Index(fields=["stock", "second_headroom"])]
+
+    def __str__(self):
+        return f"{self.product.name} ({self.stock})"
+
+
+class StockMovement(models.Model):
+    """
+    An append-only record of a change of an article's stock.
+    """
+
+    UPLOAD = "upload"
+    SELL = "sell"
+    ADJUSTMENT = "adjustment"
+    KIND_CHOICES = [
+        (UPLOAD, "Upload"),
+        (SELL, "Sell"),
+        (ADJUSTMENT, "Adjustment"),
+    ]
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    delta = models.IntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["article", "id"])]
+
+    def __str__(self):
+        return f"{self.article_id} {self.delta:+d} ({self.kind})"
+
+
+class StockSnapshot(models.Model):
+    """
+    The stock of an article after folding in all its movements up to ``movement_id``.
+    """
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    movement_id = models.BigIntegerField()
+    stock = models.IntegerField()
+    taken_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["article", "-movement_id"])]
+
+    def __str__(self):
+        return f"{self.article_id} = {self.stock} (up to movement {self.movement_id})"
+
+
+class InventoryChange(models.Model):
+    """
+    An append-only record of a changed article or product.
+
+    The id is the inventory version, it increases with every stock or config change
+    and serves as the ETag of the listings and the cursor of the changes feed.
+    """
+
+    ARTICLE = "article"
+    PRODUCT = "product"
+    KIND_CHOICES = [
+        (ARTICLE, "Article"),
+        (PRODUCT, "Product"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Article ids are strings, product ids are stored as strings as well
+    object_id = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.id}: {self.kind} {self.object_id}"
+
+
+class Reservation(models.Model):
+    """
+    A hold on the articles of some units of a product, e.g. during a checkout.
+
+    The held quantities are kept on ``Article.reserved`` until the reservation is
+    committed (sold), released or expires, see ``inventory.reservations``.
+    """
+
+    ACTIVE = "active"
+    COMMITTED = "committed"
+    RELEASED = "released"
+    EXPIRED = "expired"
+    STATUS_CHOICES = [
+        (ACTIVE, "Active"),
+        (COMMITTED, "Committed"),
+        (RELEASED, "Released"),
+        (EXPIRED, "Expired"),
+    ]
+
+    # The lines keep the held articles if the product is deleted
+    product = models.ForeignKey(ProductConfig, null=True, on_delete=models.SET_NULL)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        # Only active reservations can expire, the sweep reads the expired ones in
+        # expiry order without scanning the closed ones
+        indexes = [
+            models.Index(
+                fields=["expires_at"],
+                condition=Q(status="active"),
+                name="active_reservation_expiry",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.quantity} x {self.product_id} ({self.status})"
+
+
+class ReservationLine(models.Model):
+    """
+    The quantity of an article held by a reservation.
+    """
+
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.CASCADE, related_name="lines"
+    )
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.reservation_id} - {self.article_id} ({self.quantity})"
+
+
+class ImportJob(models.Model):
+    """
+    A stored upload imported in the background, see ``inventory.jobs``.
+
+    ``rows_done`` is the checkpoint: it is updated in the transaction of every
+    applied chunk, so a resumed job continues after the last committed chunk.
+    """
+
+    ARTICLES = "articles"
+    PRODUCTS = "products"
+    KIND_CHOICES = [
+        (ARTICLES, "Articles"),
+        (PRODUCTS, "Products config"),
+    ]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    path = models.CharField(max_length=500)
+    size = models.PositiveBigIntegerField(default=0)
+    # Bytes of the file read up to the checkpoint
+    position = models.PositiveBigIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # The first invalid rows, as {"row": index in the file, "errors": ...}
+    errors = models.JSONField(default=list)
+    # Why the job failed as a whole
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.id}: {self.kind} ({self.status})"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The stored response of a request sent with an idempotency key, replayed to
+    retries of the request until it expires, see ``inventory.idempotency``.
+    """
+
+    # SHA-256 of the method, path and key, fixed size however long the client key
+    key = models.CharField(max_length=64, primary_key=True)
+    # SHA-256 of the request body, a key reused for another request is rejected
+    fingerprint = models.CharField(max_length=64)
+    # None while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    headers = models.JSONField(default=dict)
+    content = models.BinaryField(default=b"")
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
+
+
+class Warehouse(models.Model):
+    """
+    A physical site keeping part of the article stock, see ``inventory.sites``.
+    """
+
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return self.code
+
+
+class LocationStock(models.Model):
+    """
+    The stock of an article at a warehouse.
+
+    The rows of an article add up to its ``Article.located`` units, which are part
+    of ``Article.stock``.
+    """
+
+    # A warehouse keeping stock can not be deleted, its units would vanish from the
+    # located ones
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
+    article = models.ForeignKey(
+        Article, on_delete=models.CASCADE, related_name="locations"
+    )
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["warehouse", "article"], name="unique_location_stock"
+            )
+        ]
+        # The per-site availability joins the requirements on the article and reads
+        # the stock of every site from this index alone
+        indexes = [models.Index(fields=["article", "warehouse", "stock"])]
+
+    def __str__(self):
+        return f"{self.warehouse_id} - {self.article_id} ({self.stock})"
+
+
+class AlertEvent(models.Model):
+    """
+    A reorder level crossed by the stock of an article or a product.
+
+    Events are written in the transaction changing the stock and kept as an outbox
+    until they are delivered to the alert sink, see ``inventory.alerts``.
+    """
+
+    ARTICLE = "article"
+    PRODUCT = "product"
+    KIND_CHOICES = [
+        (ARTICLE, "Article"),
+        (PRODUCT, "Product"),
+    ]
+
+    LOW = "low"
+    RESTOCKED = "restocked"
+    STATE_CHOICES = [
+        (LOW, "Low"),
+        (RESTOCKED, "Restocked"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Article ids are strings, product ids are stored as strings as well
+    object_id = models.CharField(max_length=100)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES)
+    level = models.PositiveIntegerField()
+    old_stock = models.PositiveIntegerField()
+    new_stock = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    # Failed deliveries, the event is retried by the next delivery run
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        # The delivery reads the pending events in order without scanning the
+        # delivered ones
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=Q(delivered_at__isnull=True),
+                name="pending_alert_events",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.kind} {self.object_id} {self.state}"
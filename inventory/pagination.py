@@ -0,0 +1,58 @@
+import sys
+
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key.
+
+    Every page is a ``pk > cursor`` range scan on the primary key index, so deep
+    pages cost the same as the first one.
+    """
+
+    ordering = "pk"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+def prefix_range(field, prefix):
+    """
+    Returns lookups matching values starting with ``prefix`` as an index range scan.
+
+    On PostgreSQL the range would follow the collation of the database, which is
+    no prefix match for non-C collations. ``startswith`` (a LIKE query) is used
+    there instead, served by the ``varchar_pattern_ops`` index Django creates along
+    with every indexed CharField. The other backends compare code points, the
+    ``>= prefix AND < next`` range uses their plain B-tree index. The match is
+    case-sensitive.
+    """
+    if connection.vendor == "postgresql":
+        return {f"{field}__startswith": prefix}
+    # The last character which is not the highest code point is incremented, the
+    # ones after it are dropped, a prefix of only such characters has no bound
+    head = prefix.rstrip(chr(sys.maxunicode))
+    if not head:
+        return {f"{field}__gte": prefix}
+    following = ord(head[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        # Surrogates can not be encoded, skip to the code point after them
+        following = 0xE000
+    upper_bound = head[:-1] + chr(following)
+    return {f"{field}__gte": prefix, f"{field}__lt": upper_bound}
+
+
+def int_param(request, name):
+    """
+    Returns the query parameter ``name`` as an int, or None if it is not given.
+    """
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "A valid integer is required."})
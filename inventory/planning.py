@@ -0,0 +1,180 @@
+import math
+from collections import defaultdict
+
+from inventory.models import ProductRequirement
+from inventory.selling import unreserved_stock
+
+
+class InvalidPlan(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"The plan request has {len(errors)} invalid entries.")
+
+
+class BuildPlanner:
+    """
+    Allocates the shared article stock to a mix of products.
+
+    Building the most (weighted) units of several products from shared articles is
+    an integer allocation problem, solving it exactly does not scale to thousands of
+    products. The planner takes two cheap steps instead:
+
+    1. It searches the largest scale ``t`` at which ``floor(t * weight)`` units of
+       every product can be built together, so the plan keeps the requested mix.
+       Every feasibility check is a single pass over the BOM lines, and the
+       bisection takes about log2(stock * weight) of them.
+    2. It fills the remaining stock greedily, products with a higher weight first.
+       After this pass no product can be built once more from the leftover stock.
+
+    :param boms: A dict mapping product ids to a dict of article id to quantity.
+    :param stock: A dict mapping article ids to their stock.
+    """
+
+    def __init__(self, boms, stock):
+        self.boms = boms
+        self.stock = stock
+
+    def usage(self, plan):
+        usage = defaultdict(int)
+        for product_id, units in plan.items():
+            for article_id, quantity in self.boms[product_id].items():
+                usage[article_id] += quantity * units
+        return usage
+
+    def feasible(self, plan):
+        return all(
+            used <= self.stock[article_id]
+            for article_id, used in self.usage(plan).items()
+        )
+
+    def scaled(self, weights, scale, caps):
+        plan = {}
+        for product_id, weight in weights.items():
+            units = int(scale * weight)
+            if caps is not None:
+                units = min(units, caps[product_id])
+            plan[product_id] = units
+        return plan
+
+    def plan(self, weights, caps=None):
+        """
+        :param weights: A dict mapping product ids to their positive weight.
+        :param caps: An optional dict mapping product ids to the most units wanted.
+        :return: A tuple (plan, scale, leftover), where plan maps product ids to the
+            number of units to build, scale is the common scale of step 1 and
+            leftover maps article ids to the stock left after the plan.
+        """
+        # No product can be built more often than its own articles allow
+        upper = max(
+            min(
+                (
+                    self.stock[article_id] // quantity
+                    for article_id, quantity in self.boms[product_id].items()
+                ),
+                default=0,
+            )
+            / weight
+            for product_id, weight in weights.items()
+        )
+        # Bisect until the bounds differ by less than one unit of every product, the
+        # greedy fill below takes care of that last unit
+        max_weight = max(weights.values())
+        low, high = 0.0, upper + 1
+        while (high - low) * max_weight >= 1:
+            middle = (low + high) / 2
+            if self.feasible(self.scaled(weights, middle, caps)):
+                low = middle
+            else:
+                high = middle
+        plan = self.scaled(weights, low, caps)
+
+        left = dict(self.stock)
+        for article_id, used in self.usage(plan).items():
+            left[article_id] -= used
+        for product_id in sorted(weights, key=lambda p: (-weights[p], p)):
+            bom = self.boms[product_id]
+            units = min(
+                (left[article_id] // quantity for article_id, quantity in bom.items()),
+                default=0,
+            )
+            if caps is not None:
+                units = min(units, caps[product_id] - plan[product_id])
+            if units > 0:
+                plan[product_id] += units
+                for article_id, quantity in bom.items():
+                    left[article_id] -= quantity * units
+        return plan, low, left
+
+
+def plan_builds(weights=None, demand=None):
+    """
+    Computes a joint build plan for products sharing articles, see ``BuildPlanner``.
+
+    Either ``weights`` (build as much as possible in that ratio) or ``demand`` (build
+    up to that many units each, filling every product at the same rate) is given.
+
+    :param weights: A dict mapping product ids to their weight.
+    :param demand: A dict mapping product ids to the number of units wanted.
+    :return: A dict with the units per product, the leftover article stock, the
+        products without articles and the common scale.
+    :raises InvalidPlan: If the weights or the demand are malformed.
+    """
+    if (weights is None) == (demand is None):
+        raise InvalidPlan({"mix": "Expected either 'weights' or 'demand'."})
+    mix = weights if weights is not None else demand
+    if not isinstance(mix, dict) or not mix:
+        raise InvalidPlan({"mix": "Expected a non-empty object of product ids."})
+
+    errors = {}
+    targets = {}
+    for product_id, value in mix.items():
+        if not str(product_id).isdigit():
+            errors[product_id] = "Expected a product id."
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors[product_id] = "Expected a number."
+        elif not math.isfinite(value):
+            # JSON parsers accept Infinity and NaN
+            errors[product_id] = "Expected a finite number."
+        elif value < 0 or (demand is not None and not isinstance(value, int)):
+            errors[product_id] = "Expected a non-negative number of units."
+        elif value > 0:
+            targets[int(product_id)] = value
+    if errors:
+        raise InvalidPlan(errors)
+
+    # Reserved units are spoken for, plan with the rest
+    lines = (
+        ProductRequirement.objects.filter(product_id__in=list(targets), quantity__gt=0)
+        .annotate(unreserved=unreserved_stock("article__"))
+        .values_list(
+            "product_id", "article_id", "quantity", "unreserved", "product__name"
+        )
+    )
+    boms = defaultdict(lambda: defaultdict(int))
+    stock = {}
+    names = {}
+    for product_id, article_id, quantity, article_stock, name in lines:
+        boms[product_id][article_id] += quantity
+        stock[article_id] = article_stock
+        names[product_id] = name
+
+    not_found = sorted(set(targets) - set(boms))
+    targets = {
+        product_id: value for product_id, value in targets.items() if product_id in boms
+    }
+    plan, scale, leftover = (
+        BuildPlanner(boms, stock).plan(
+            targets, caps=targets if demand is not None else None
+        )
+        if targets
+        else ({}, 0.0, {})
+    )
+    return {
+        "plan": [
+            {"product_id": product_id, "name": names[product_id], "quantity": units}
+            for product_id, units in sorted(plan.items())
+        ],
+        "leftover": leftover,
+        "not_found": not_found,
+        "scale": round(scale, 6),
+    }
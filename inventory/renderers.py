@@ -0,0 +1,13 @@
+from rest_framework.renderers import JSONRenderer
+
+from inventory.metrics import track
+
+
+class InstrumentedJSONRenderer(JSONRenderer):
+    """
+    A JSON renderer recording its time as the request's serialization section.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with track("serialization"):
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,261 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from inventory.availability import articles_changed
+from inventory.models import (Article, ProductRequirement, Reservation,
+                              ReservationLine)
+from inventory.selling import (DEFAULT_QUANTITY_TO_SELL, InsufficientStock,
+                               ProductNotFound, available_quantity,
+                               demand_case, stock_sold)
+
+DEFAULT_RESERVATIONS = {
+    # Seconds a reservation holds its articles unless the request asks otherwise
+    "TTL": 900,
+    # The longest hold a request may ask for
+    "MAX_TTL": 3600,
+    # Reservations expired per transaction of the sweep
+    "SWEEP_BATCH_SIZE": 1000,
+}
+
+
+class ReservationNotFound(Exception):
+    def __init__(self, reservation_id):
+        self.reservation_id = reservation_id
+        super().__init__(f"Reservation {reservation_id} does not exist.")
+
+
+class ReservationClosed(Exception):
+    def __init__(self, reservation_id, status):
+        self.reservation_id = reservation_id
+        self.status = status
+        super().__init__(f"Reservation {reservation_id} is already {status}.")
+
+
+def get_reservation_config():
+    return {
+        **DEFAULT_RESERVATIONS,
+        **getattr(settings, "INVENTORY_RESERVATIONS", {}),
+    }
+
+
+def _adjust_articles(demand, stock_delta, reserved_delta):
+    """
+    Moves the demanded quantities into or out of the stock and the reserved units
+    of the articles with one UPDATE, e.g. ``(0, 1)`` holds and ``(-1, -1)`` sells.
+
+    :return: True if every article was updated.
+    """
+    needed = demand_case(demand)
+    articles = Article.objects.filter(id__in=list(demand))
+    if stock_delta < 0:
+        # A stock edit may have left less stock than is held
+        articles = articles.filter(stock__gte=F("located") + needed)
+    return articles.update(
+        stock=F("stock") + stock_delta * needed,
+        reserved=F("reserved") + reserved_delta * needed,
+    ) == len(demand)
+
+
+def _held(reservation_ids):
+    """
+    Returns the article quantities held by the given reservations.
+    """
+    return dict(
+        ReservationLine.objects.filter(reservation_id__in=reservation_ids)
+        .values("article_id")
+        .order_by()
+        .annotate(quantity=Sum("quantity"))
+        .values_list("article_id", "quantity")
+    )
+
+
+def _release(reservation_ids):
+    held = _held(reservation_ids)
+    if held:
+        _adjust_articles(held, 0, -1)
+        articles_changed(list(held))
+
+
+def reserve_product(product_id, quantity=DEFAULT_QUANTITY_TO_SELL, ttl=None):
+    """
+    Holds the articles of some units of a product until the reservation is
+    committed, released or expires.
+
+    Held units stay in the stock but can not be sold or reserved again. The articles
+    are held with one guarded UPDATE, so concurrent reservations and sales can not
+    overbook them.
+
+    :param product_id: The id of the product to reserve.
+    :param quantity: The number of units to reserve.
+    :param ttl: Seconds until the reservation expires, the configured TTL if None.
+    :return: The reservation.
+    :raises ProductNotFound: If the product has no articles configured.
+    :raises InsufficientStock: If the quantity is not positive or exceeds the stock
+        not held yet.
+    """
+    config = get_reservation_config()
+    ttl = config["TTL"] if ttl is None else min(ttl, config["MAX_TTL"])
+    # Give the expired holds back before checking the stock
+    expire_reservations()
+
+    with transaction.atomic():
+        requirements = list(
+            ProductRequirement.objects.filter(product_id=product_id).values_list(
+                "article_id", "quantity"
+            )
+        )
+        if not requirements:
+            raise ProductNotFound(product_id)
+
+        demand = defaultdict(int)
+        for article_id, article_quantity in requirements:
+            demand[article_id] += article_quantity * quantity
+        held = quantity > 0 and (
+            Article.objects.filter(
+                id__in=list(demand),
+                stock__gte=F("reserved") + F("located") + demand_case(demand),
+            ).update(reserved=F("reserved") + demand_case(demand))
+            == len(demand)
+        )
+        if held:
+            reservation = Reservation.objects.create(
+                product_id=product_id,
+                quantity=quantity,
+                expires_at=timezone.now() + timedelta(seconds=ttl),
+            )
+            ReservationLine.objects.bulk_create(
+                ReservationLine(
+                    reservation=reservation,
+                    article_id=article_id,
+                    quantity=held_quantity,
+                )
+                for article_id, held_quantity in demand.items()
+            )
+            articles_changed(list(demand))
+        else:
+            transaction.set_rollback(True)
+
+    if not held:
+        raise InsufficientStock(product_id, quantity, available_quantity(product_id))
+    return reservation
+
+
+def _close(reservation_id, status):
+    """
+    Moves an active reservation to ``status``.
+
+    The status is switched with a guarded UPDATE, so a reservation is committed,
+    released or expired only once even if requests race.
+
+    :return: True if the reservation is closed, False if it expired in the meantime
+        (it is expired then).
+    :raises ReservationNotFound: If the reservation does not exist.
+    :raises ReservationClosed: If the reservation is not active.
+    """
+    reservation = (
+        Reservation.objects.filter(pk=reservation_id)
+        .values("status", "expires_at")
+        .first()
+    )
+    if reservation is None:
+        raise ReservationNotFound(reservation_id)
+    expired = reservation["expires_at"] <= timezone.now()
+    closed = Reservation.objects.filter(
+        pk=reservation_id, status=Reservation.ACTIVE
+    ).update(status=Reservation.EXPIRED if expired else status)
+    if not closed:
+        raise ReservationClosed(reservation_id, reservation["status"])
+    return not expired
+
+
+def commit_reservation(reservation_id):
+    """
+    Sells the held units of a reservation.
+
+    The held quantities move from the reserved units out of the stock, the sale is
+    recorded in the ledger like any other sale.
+
+    :param reservation_id: The id of the reservation.
+    :return: The reservation.
+    :raises ReservationNotFound: If the reservation does not exist.
+    :raises ReservationClosed: If the reservation is not active or expired.
+    :raises InsufficientStock: If the stock was edited below the held units, the
+        reservation stays active.
+    """
+    with transaction.atomic():
+        committed = _close(reservation_id, Reservation.COMMITTED)
+        if not committed:
+            _release([reservation_id])
+        else:
+            held = _held([reservation_id])
+            sold = _adjust_articles(held, -1, -1)
+            if sold:
+                stock_sold(held)
+            else:
+                transaction.set_rollback(True)
+    reservation = Reservation.objects.get(pk=reservation_id)
+    if not committed:
+        raise ReservationClosed(reservation_id, Reservation.EXPIRED)
+    if not sold:
+        raise InsufficientStock(
+            reservation.product_id,
+            reservation.quantity,
+            available_quantity(reservation.product_id),
+        )
+    return reservation
+
+
+def release_reservation(reservation_id):
+    """
+    Gives the held units of a reservation back.
+
+    :param reservation_id: The id of the reservation.
+    :return: The reservation.
+    :raises ReservationNotFound: If the reservation does not exist.
+    :raises ReservationClosed: If the reservation is not active.
+    """
+    with transaction.atomic():
+        _close(reservation_id, Reservation.RELEASED)
+        _release([reservation_id])
+    return Reservation.objects.get(pk=reservation_id)
+
+
+def expire_reservations(now=None, batch_size=None):
+    """
+    Releases the holds of the active reservations which expired.
+
+    The expired reservations are read in expiry order through the partial index on
+    the expiry of active reservations, so a sweep costs O(expired) however many
+    reservations were closed before. Rows locked by a concurrent commit or sweep are
+    skipped (SKIP LOCKED on backends supporting it).
+
+    :param now: Expire the reservations up to this time, now if None.
+    :param batch_size: Reservations expired per transaction.
+    :return: The number of expired reservations.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or get_reservation_config()["SWEEP_BATCH_SIZE"]
+    expired = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Reservation.objects.select_for_update(skip_locked=True)
+                .filter(status=Reservation.ACTIVE, expires_at__lte=now)
+                .order_by("expires_at")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if ids:
+                # The rows are locked (or SQLite serializes the writers), nothing
+                # closes them in between
+                Reservation.objects.filter(id__in=ids).update(
+                    status=Reservation.EXPIRED
+                )
+                _release(ids)
+        expired += len(ids)
+        if len(ids) < batch_size:
+            return expired
@@ -0,0 +1,346 @@
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Case, ExpressionWrapper, F, Min, Value, When
+from django.db.models.functions import Greatest
+
+from inventory.availability import articles_changed
+from inventory.ledger import record_movements
+from inventory.models import Article, ProductRequirement, StockMovement
+
+DEFAULT_QUANTITY_TO_SELL = 1
+
+
+class ProductNotFound(Exception):
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f"Product {product_id} has no articles configured.")
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, quantity, available):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.available = available
+        super().__init__(
+            f"Can not sell {quantity} units of product {product_id}, "
+            f"{available} units are in stock."
+        )
+
+
+class InvalidQuantity(Exception):
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(
+            f"Can not sell {quantity!r} units of product {product_id}, the quantity "
+            f"must be a non-negative integer."
+        )
+
+
+class InvalidOrder(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"The order has {len(errors)} invalid lines.")
+
+
+def lock_articles(article_ids):
+    """
+    Returns the given articles locked for update, in primary key order.
+
+    Transactions locking overlapping articles in the same order wait for each other
+    instead of deadlocking. Backends without row locks (SQLite) ignore the lock.
+
+    :param article_ids: The ids of the articles to lock.
+    """
+    return (
+        Article.objects.select_for_update()
+        .filter(id__in=list(article_ids))
+        .order_by("id")
+    )
+
+
+def unreserved_stock(prefix=""):
+    """
+    Returns an expression for the stock of an article not held by reservations nor
+    kept at a warehouse.
+
+    :param prefix: The lookup of the article, e.g. "article__".
+    """
+    return Greatest(
+        F(f"{prefix}stock") - F(f"{prefix}reserved") - F(f"{prefix}located"), Value(0)
+    )
+
+
+def demand_case(demand):
+    """
+    Returns an expression picking the demanded quantity of every article in an
+    UPDATE of the articles.
+
+    :param demand: A dict mapping article ids to a quantity.
+    """
+    return Case(
+        *[
+            When(id=article_id, then=Value(quantity))
+            for article_id, quantity in demand.items()
+        ],
+        output_field=models.IntegerField(),
+    )
+
+
+def decrement_stock(demand):
+    """
+    Subtracts the demanded quantities from the article stock with one guarded UPDATE.
+
+    Only rows which still have enough stock beside their reserved and located units
+    are updated, so the caller has to run this inside ``transaction.atomic`` and roll
+    back if not every article was updated.
+
+    :param demand: A dict mapping article ids to the quantity to subtract.
+    :return: True if every article had enough stock.
+    """
+    if not demand:
+        return True
+    needed = demand_case(demand)
+    updated = Article.objects.filter(
+        id__in=list(demand), stock__gte=F("reserved") + F("located") + needed
+    ).update(stock=F("stock") - needed)
+    return updated == len(demand)
+
+
+def stock_sold(demand):
+    """
+    Records the decremented articles in the ledger and refreshes the availability
+    of the products using them.
+    """
+    deltas = {article_id: -quantity for article_id, quantity in demand.items()}
+    record_movements(deltas, StockMovement.SELL)
+    articles_changed(list(demand), deltas)
+
+
+def available_quantity(product_id):
+    """
+    Returns how many units of the product can be built from the stock not held by
+    reservations nor kept at a warehouse.
+    """
+    return ProductRequirement.objects.filter(product_id=product_id).aggregate(
+        stock=Min(
+            ExpressionWrapper(
+                unreserved_stock("article__") / F("quantity"),
+                output_field=models.IntegerField(),
+            )
+        )
+    )["stock"]
+
+
+def sell_product(product_id, quantity=DEFAULT_QUANTITY_TO_SELL):
+    """
+    Sells units of a product by decrementing the stock of all its articles at once.
+
+    The sale takes a constant number of queries regardless of the BOM size and
+    either decrements every article or none of them, so concurrent sales can not
+    oversell.
+
+    :param product_id: The id of the product to sell.
+    :param quantity: The number of units to sell.
+    :return: The name of the sold product.
+    :raises InvalidQuantity: If the quantity is not a non-negative integer.
+    :raises ProductNotFound: If the product has no articles configured.
+    :raises InsufficientStock: If the quantity exceeds the stock.
+    """
+    if not _is_count(quantity):
+        raise InvalidQuantity(product_id, quantity)
+    with transaction.atomic():
+        bom = list(
+            ProductRequirement.objects.filter(product_id=product_id).values_list(
+                "article_id", "quantity", "product__name"
+            )
+        )
+        if not bom:
+            raise ProductNotFound(product_id)
+        product_name = bom[0][2]
+
+        demand = defaultdict(int)
+        for article_id, article_quantity, _ in bom:
+            demand[article_id] += article_quantity * quantity
+        sold = decrement_stock(demand)
+        if sold:
+            stock_sold(demand)
+        else:
+            transaction.set_rollback(True)
+
+    if not sold:
+        raise InsufficientStock(product_id, quantity, available_quantity(product_id))
+    return product_name
+
+
+def sell_batch(sales):
+    """
+    Applies a batch of independent sales in arrival order within one transaction.
+
+    Unlike an order, every sale is accepted or rejected on its own: a sale is
+    accepted if the stock left by the earlier sales of the batch covers it. The
+    net demand of the accepted sales is decremented with one guarded UPDATE, so a
+    burst of sales costs a constant number of queries.
+
+    :param sales: A list of (product_id, quantity) tuples.
+    :return: A list with the outcome of every sale, the product name if it was
+        sold, or an ``InvalidQuantity``, ``ProductNotFound`` or
+        ``InsufficientStock`` exception.
+    """
+    with transaction.atomic():
+        bom_lines = ProductRequirement.objects.filter(
+            product_id__in=list({product_id for product_id, _ in sales})
+        ).values_list("product_id", "article_id", "quantity", "product__name")
+        boms = defaultdict(lambda: defaultdict(int))
+        names = {}
+        for product_id, article_id, article_quantity, name in bom_lines:
+            boms[product_id][article_id] += article_quantity
+            names[product_id] = name
+
+        stock = dict(
+            lock_articles({article_id for bom in boms.values() for article_id in bom})
+            .annotate(unreserved=unreserved_stock())
+            .values_list("id", "unreserved")
+        )
+
+        demand = defaultdict(int)
+        outcomes = []
+        for product_id, quantity in sales:
+            bom = boms.get(product_id)
+            if not _is_count(quantity):
+                outcomes.append(InvalidQuantity(product_id, quantity))
+            elif bom is None:
+                outcomes.append(ProductNotFound(product_id))
+            elif all(
+                stock[article_id] >= article_quantity * quantity
+                for article_id, article_quantity in bom.items()
+            ):
+                for article_id, article_quantity in bom.items():
+                    stock[article_id] -= article_quantity * quantity
+                    demand[article_id] += article_quantity * quantity
+                outcomes.append(names[product_id])
+            else:
+                available = min(
+                    (
+                        stock[article_id] // article_quantity
+                        for article_id, article_quantity in bom.items()
+                        if article_quantity > 0
+                    ),
+                    default=0,
+                )
+                outcomes.append(InsufficientStock(product_id, quantity, available))
+
+        demand = {
+            article_id: quantity for article_id, quantity in demand.items() if quantity
+        }
+        sold = decrement_stock(demand)
+        if sold:
+            if demand:
+                stock_sold(demand)
+        else:
+            transaction.set_rollback(True)
+
+    if not sold:
+        # The stock changed since it was read, fall back to one sale at a time
+        outcomes = []
+        for product_id, quantity in sales:
+            try:
+                outcomes.append(sell_product(product_id, quantity))
+            except (InvalidQuantity, ProductNotFound, InsufficientStock) as e:
+                outcomes.append(e)
+    return outcomes
+
+
+def sell_order(lines):
+    """
+    Sells all lines of an order at once, or none of them.
+
+    The component demand of all lines is summed per article, validated against the
+    stock with one query and decremented with one guarded UPDATE, so the number of
+    queries does not depend on the size of the basket.
+
+    :param lines: A list of dicts with a 'product_id' and an optional 'quantity'.
+    :return: A tuple (sold, results) where results holds the outcome of every line.
+    :raises InvalidOrder: If a line is malformed.
+    """
+    if not isinstance(lines, list) or not lines:
+        raise InvalidOrder({"lines": "Expected a non-empty list of order lines."})
+
+    errors = {}
+    order = []
+    for index, line in enumerate(lines):
+        product_id = line.get("product_id") if isinstance(line, dict) else None
+        quantity = (
+            line.get("quantity", DEFAULT_QUANTITY_TO_SELL)
+            if isinstance(line, dict)
+            else None
+        )
+        if not _is_count(product_id) or not _is_count(quantity):
+            errors[index] = "Expected a product_id and a non-negative quantity."
+        else:
+            order.append((product_id, quantity))
+    if errors:
+        raise InvalidOrder(errors)
+
+    with transaction.atomic():
+        bom_lines = ProductRequirement.objects.filter(
+            product_id__in=list({product_id for product_id, _ in order})
+        ).values_list("product_id", "article_id", "quantity", "product__name")
+        boms = defaultdict(list)
+        names = {}
+        for product_id, article_id, article_quantity, name in bom_lines:
+            boms[product_id].append((article_id, article_quantity))
+            names[product_id] = name
+
+        demand = defaultdict(int)
+        for product_id, quantity in order:
+            for article_id, article_quantity in boms.get(product_id, []):
+                demand[article_id] += article_quantity * quantity
+
+        stock = dict(
+            lock_articles(demand)
+            .annotate(unreserved=unreserved_stock())
+            .values_list("id", "unreserved")
+        )
+        short = {
+            article_id
+            for article_id, quantity in demand.items()
+            if stock.get(article_id, 0) < quantity
+        }
+
+        results = []
+        for product_id, quantity in order:
+            result = {
+                "product_id": product_id,
+                "name": names.get(product_id),
+                "quantity": quantity,
+                "status": "sold",
+            }
+            if product_id not in boms:
+                result["status"] = "not_found"
+            else:
+                short_articles = sorted(
+                    {article_id for article_id, _ in boms[product_id]} & short
+                )
+                if short_articles:
+                    result["status"] = "insufficient_stock"
+                    result["short_articles"] = short_articles
+            results.append(result)
+
+        sold = all(result["status"] == "sold" for result in results)
+        if sold and not decrement_stock(demand):
+            # Another sale got in between, report the lines as not sold
+            sold = False
+        if sold:
+            stock_sold(demand)
+        else:
+            transaction.set_rollback(True)
+            for result in results:
+                if result["status"] == "sold":
+                    result["status"] = "not_sold"
+    return sold, results
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
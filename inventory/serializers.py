@@ -1,13 +1,15 @@
 # inventory/serializers.py
 from rest_framework import serializers
 
-from .models import Article, ProductArticle, ProductConfig
+from .models import Article, ProductArticle, ProductAvailability, ProductConfig
 
 
 class ArticleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Article
         fields = "__all__"
+        # Only reservations hold units and only warehouse receipts locate them
+        read_only_fields = ["reserved", "located"]
 
 
 class ProductArticleSerializer(serializers.ModelSerializer):
@@ -26,16 +28,46 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ["name", "articles"]
 
 
+class ProductImpactSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="product_id")
+    name = serializers.CharField(source="product.name")
+    bottleneck_article = serializers.CharField(source="bottleneck_article_id")
+    # The quantity of each of the requested articles the product needs
+    uses = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductAvailability
+        fields = ["id", "name", "stock", "bottleneck_article", "uses"]
+
+    def get_uses(self, availability):
+        return {
+            line.article_id: line.quantity
+            for line in availability.product.impacted_lines
+        }
+
+
 class ArticleUploadSerializer(serializers.Serializer):
     art_id = serializers.IntegerField()
     name = serializers.CharField()
     stock = serializers.IntegerField()
 
 
+class BOMArticleUploadSerializer(serializers.Serializer):
+    art_id = serializers.CharField()
+    amount_of = serializers.IntegerField(min_value=1)
+
+
+class BOMProductUploadSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    amount_of = serializers.IntegerField(min_value=1)
+
+
 class ProductConfigUploadSerializer(serializers.Serializer):
     name = serializers.CharField()
-    contain_articles = serializers.ListField(
-        child=serializers.DictField(
-            child=serializers.CharField(),  # Or use serializers.IntegerField() if "art_id" is always an integer
-        )
+    contain_articles = BOMArticleUploadSerializer(
+        many=True, required=False, default=list
+    )
+    # Sub-assemblies, referenced by their product name
+    contain_products = BOMProductUploadSerializer(
+        many=True, required=False, default=list
     )
@@ -0,0 +1,80 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from inventory.availability import articles_changed
+from inventory.bom import bom_changed
+from inventory.cache import invalidate_products
+from inventory.changes import record_changes
+from inventory.ledger import record_movements
+from inventory.metrics import execute_wrapper
+from inventory.models import (Article, ProductArticle, ProductComponent,
+                              ProductConfig, StockMovement, deleting_products)
+
+# Bulk imports and sales bypass these signals and refresh the availability
+# themselves, the receivers cover single object edits (admin, DRF views).
+
+_suppressed = threading.local()
+
+
+@contextmanager
+def bom_signals_suppressed():
+    """
+    Skips the BOM line receivers of the current thread, for bulk changes which
+    rebuild the BOMs themselves afterwards.
+    """
+    previous = getattr(_suppressed, "bom_lines", False)
+    _suppressed.bom_lines = True
+    try:
+        yield
+    finally:
+        _suppressed.bom_lines = previous
+
+
+@receiver(pre_save, sender=Article)
+def article_saving(sender, instance, **kwargs):
+    instance._stored_stock = (
+        Article.objects.filter(pk=instance.pk).values_list("stock", flat=True).first()
+        or 0
+    )
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, **kwargs):
+    deltas = {instance.pk: int(instance.stock) - instance._stored_stock}
+    record_movements(deltas, StockMovement.ADJUSTMENT)
+    articles_changed([instance.pk], deltas)
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    record_changes(articles=[instance.pk])
+
+
+@receiver(post_save, sender=ProductArticle)
+@receiver(post_delete, sender=ProductArticle)
+@receiver(post_save, sender=ProductComponent)
+@receiver(post_delete, sender=ProductComponent)
+def bom_line_changed(sender, instance, **kwargs):
+    if getattr(_suppressed, "bom_lines", False):
+        return
+    if instance.product_id not in deleting_products():
+        bom_changed([instance.product_id])
+
+
+@receiver(post_save, sender=ProductConfig)
+@receiver(post_delete, sender=ProductConfig)
+def product_config_changed(sender, instance, **kwargs):
+    # The name is part of the cached product responses
+    invalidate_products([instance.pk])
+    record_changes(products=[instance.pk])
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # A connection wrapper is reused when it reconnects, only install the wrapper once
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
@@ -0,0 +1,235 @@
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import (Count, ExpressionWrapper, F, Min, OuterRef,
+                              Subquery)
+
+from inventory.availability import articles_changed
+from inventory.ledger import record_movements
+from inventory.models import (Article, LocationStock, ProductRequirement,
+                              StockMovement, Warehouse)
+from inventory.selling import (DEFAULT_QUANTITY_TO_SELL, InsufficientStock,
+                               ProductNotFound, lock_articles)
+
+
+class WarehouseNotFound(Exception):
+    def __init__(self, code):
+        self.code = code
+        super().__init__(f"Warehouse {code} does not exist.")
+
+
+class InvalidStockChange(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"The stock change has {len(errors)} invalid articles.")
+
+
+def site_availability(product_ids):
+    """
+    Computes how many units of the given products every warehouse can build from
+    its own stock.
+
+    All products and sites come out of one grouped query over the requirements
+    joined to the site stock through the (article, warehouse, stock) index. A site
+    missing an article of a product can not build it, so only groups holding every
+    requirement of their product are kept.
+
+    :param product_ids: A list of product ids.
+    :return: A dict mapping product ids to a dict of warehouse code to units, sites
+        which can not build a product are left out.
+    """
+    required = (
+        ProductRequirement.objects.filter(
+            product_id=OuterRef("product_id"), quantity__gt=0
+        )
+        .order_by()
+        .values("product_id")
+        .annotate(lines=Count("*"))
+        .values("lines")
+    )
+    groups = (
+        ProductRequirement.objects.filter(
+            product_id__in=product_ids,
+            quantity__gt=0,
+            article__locations__isnull=False,
+        )
+        .values("product_id", site=F("article__locations__warehouse__code"))
+        .annotate(
+            units=Min(
+                ExpressionWrapper(
+                    F("article__locations__stock") / F("quantity"),
+                    output_field=models.IntegerField(),
+                )
+            ),
+            lines=Count("article_id"),
+            required=Subquery(required),
+        )
+        .filter(lines=F("required"), units__gt=0)
+        .values_list("product_id", "site", "units")
+    )
+    availability = defaultdict(dict)
+    for product_id, site, units in groups:
+        availability[product_id][site] = units
+    return availability
+
+
+def allocate(units, quantity):
+    """
+    Splits the units to sell between the sites.
+
+    A single site is used if one can build every unit, the one with the most units
+    so the stock stays spread. Otherwise the units are taken from the sites with
+    the most units first.
+
+    :param units: A dict mapping warehouse codes to the units they can build.
+    :param quantity: The number of units to sell.
+    :return: A dict mapping warehouse codes to units, None if all sites together
+        can not build ``quantity`` units.
+    """
+    sites = sorted(units, key=lambda site: (-units[site], site))
+    if sum(units.values()) < quantity:
+        return None
+    allocation = {}
+    for site in sites:
+        if quantity <= 0:
+            break
+        allocation[site] = min(units[site], quantity)
+        quantity -= allocation[site]
+    return allocation
+
+
+def sell_from_sites(product_id, quantity=DEFAULT_QUANTITY_TO_SELL, site=None):
+    """
+    Sells units of a product from the warehouses, every unit is built from the stock
+    of a single site.
+
+    The articles and then their site rows are locked in a fixed order, so
+    concurrent site sales and stock receipts wait for each other instead of
+    overbooking a site.
+
+    :param product_id: The id of the product to sell.
+    :param quantity: The number of units to sell.
+    :param site: The code of the warehouse to sell from, any if None.
+    :return: A dict mapping warehouse codes to the units sold there.
+    :raises ProductNotFound: If the product has no articles configured.
+    :raises WarehouseNotFound: If ``site`` does not exist.
+    :raises InsufficientStock: If the quantity is not positive or the sites can not
+        build that many units.
+    """
+    with transaction.atomic():
+        requirements = dict(
+            ProductRequirement.objects.filter(
+                product_id=product_id, quantity__gt=0
+            ).values_list("article_id", "quantity")
+        )
+        if not requirements:
+            raise ProductNotFound(product_id)
+        if site is not None and not Warehouse.objects.filter(code=site).exists():
+            raise WarehouseNotFound(site)
+
+        articles = list(lock_articles(requirements))
+        # Only the stock rows are locked, not the joined warehouses
+        rows = (
+            LocationStock.objects.select_for_update(of=("self",))
+            .filter(article_id__in=list(requirements))
+            .annotate(site=F("warehouse__code"))
+            .order_by("warehouse_id", "article_id")
+        )
+        if site is not None:
+            rows = rows.filter(warehouse__code=site)
+        by_site = defaultdict(dict)
+        for row in rows:
+            by_site[row.site][row.article_id] = row
+        units = {
+            code: min(
+                site_rows[article_id].stock // article_quantity
+                for article_id, article_quantity in requirements.items()
+            )
+            for code, site_rows in by_site.items()
+            if len(site_rows) == len(requirements)
+        }
+        demand = {
+            article_id: article_quantity * quantity
+            for article_id, article_quantity in requirements.items()
+        }
+        allocation = allocate(units, quantity) if quantity > 0 else None
+        # A stock edit may have left less stock than is located
+        if allocation is None or any(
+            article.stock < demand[article.id] for article in articles
+        ):
+            raise InsufficientStock(product_id, quantity, sum(units.values()))
+
+        changed_rows = []
+        for code, sold in allocation.items():
+            for article_id, row in by_site[code].items():
+                row.stock -= requirements[article_id] * sold
+                changed_rows.append(row)
+        LocationStock.objects.bulk_update(changed_rows, ["stock"])
+        for article in articles:
+            article.stock -= demand[article.id]
+            article.located -= demand[article.id]
+        Article.objects.bulk_update(articles, ["stock", "located"])
+        deltas = {article_id: -needed for article_id, needed in demand.items()}
+        record_movements(deltas, StockMovement.SELL)
+        articles_changed(list(demand), deltas)
+    return allocation
+
+
+def receive_stock(site, quantities):
+    """
+    Changes the stock of articles at a warehouse.
+
+    Positive quantities are units arriving at the site, they are added to the site,
+    the located units and the stock of the article. Negative quantities remove
+    units from the site, e.g. write-offs.
+
+    :param site: The code of the warehouse.
+    :param quantities: A dict mapping article ids to the change of their stock.
+    :return: A dict mapping the article ids to their new stock at the site.
+    :raises WarehouseNotFound: If the warehouse does not exist.
+    :raises InvalidStockChange: If an article does not exist or a change would
+        leave a negative stock, nothing is changed then.
+    """
+    with transaction.atomic():
+        warehouse = Warehouse.objects.filter(code=site).first()
+        if warehouse is None:
+            raise WarehouseNotFound(site)
+
+        articles = {article.id: article for article in lock_articles(quantities)}
+        rows = {
+            row.article_id: row
+            for row in LocationStock.objects.select_for_update().filter(
+                warehouse=warehouse, article_id__in=list(quantities)
+            )
+        }
+        errors = {}
+        for article_id, delta in quantities.items():
+            article = articles.get(article_id)
+            row = rows.get(article_id)
+            site_stock = row.stock if row else 0
+            if article is None:
+                errors[article_id] = "Unknown article."
+            elif site_stock + delta < 0 or article.stock + delta < 0:
+                errors[article_id] = f"Only {site_stock} units are at {site}."
+        if errors:
+            raise InvalidStockChange(errors)
+
+        to_create = []
+        for article_id, delta in quantities.items():
+            if article_id in rows:
+                rows[article_id].stock += delta
+            else:
+                rows[article_id] = LocationStock(
+                    warehouse=warehouse, article_id=article_id, stock=delta
+                )
+                to_create.append(rows[article_id])
+            articles[article_id].stock += delta
+            articles[article_id].located += delta
+        LocationStock.objects.bulk_update(
+            [row for row in rows.values() if row.pk], ["stock"]
+        )
+        LocationStock.objects.bulk_create(to_create)
+        Article.objects.bulk_update(articles.values(), ["stock", "located"])
+        record_movements(quantities, StockMovement.ADJUSTMENT)
+        articles_changed(list(quantities), quantities)
+    return {article_id: rows[article_id].stock for article_id in quantities}
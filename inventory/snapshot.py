@@ -0,0 +1,385 @@
+import mmap
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory.availability import rebuild_availability
+from inventory.bom import bom_changed
+from inventory.imports import chunked
+from inventory.models import (Article, InventoryChange, LocationStock,
+                              ProductArticle, ProductComponent, ProductConfig,
+                              ProductRequirement, StockSnapshot, Warehouse)
+
+MAGIC = b"INVSNAP1"
+DEFAULT_SNAPSHOT_CHUNK_SIZE = 65536
+
+# Column encodings
+INT32 = "I"
+INT64 = "q"
+# INT32 with NULL stored as the largest value, which positive integer fields never
+# reach
+NULLABLE_INT32 = "n"
+_NULL_INT32 = 0xFFFFFFFF
+STRING = "s"
+# Distinct values once per chunk, plus one INT32 code per row
+DICTIONARY = "d"
+
+# The tables of a snapshot in insertion order, as (tag, model, columns)
+TABLES = [
+    (
+        b"ARTI",
+        Article,
+        [
+            ("id", STRING),
+            ("name", DICTIONARY),
+            ("stock", INT32),
+            ("located", INT32),
+            ("reorder_level", NULLABLE_INT32),
+        ],
+    ),
+    (
+        b"PROD",
+        ProductConfig,
+        [("id", INT64), ("name", DICTIONARY), ("reorder_level", NULLABLE_INT32)],
+    ),
+    (
+        b"PART",
+        ProductArticle,
+        [("product_id", INT64), ("article_id", DICTIONARY), ("quantity", INT32)],
+    ),
+    (
+        b"PCMP",
+        ProductComponent,
+        [("product_id", INT64), ("component_id", INT64), ("quantity", INT32)],
+    ),
+    (b"WHSE", Warehouse, [("id", INT64), ("code", STRING), ("name", DICTIONARY)]),
+    (
+        b"LSTK",
+        LocationStock,
+        [("warehouse_id", INT64), ("article_id", DICTIONARY), ("stock", INT32)],
+    ),
+]
+
+_FRAME = struct.Struct("<4sIQ")
+_LENGTH = struct.Struct("<Q")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _buffer(data):
+    return _LENGTH.pack(len(data)) + data
+
+
+def _encode_ints(values, typecode):
+    column = array(typecode, values)
+    if _BIG_ENDIAN:
+        column.byteswap()
+    return _buffer(column.tobytes())
+
+
+def _encode_strings(values):
+    encoded = [value.encode() for value in values]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return _encode_ints(offsets, INT64) + _buffer(b"".join(encoded))
+
+
+def _encode_dictionary(values):
+    codes = {}
+    for value in values:
+        codes.setdefault(value, len(codes))
+    return _encode_strings(list(codes)) + _encode_ints(
+        [codes[value] for value in values], INT32
+    )
+
+
+def encode_frame(tag, columns, rows):
+    """
+    Encodes a chunk of rows as one frame, column after column.
+
+    :param tag: The tag of the table, see ``TABLES``.
+    :param columns: The (name, encoding) pairs of the table.
+    :param rows: A list of tuples, one value per column.
+    :return: The frame as bytes.
+    """
+    body = []
+    for index, (_, encoding) in enumerate(columns):
+        values = [row[index] for row in rows]
+        if encoding == STRING:
+            body.append(_encode_strings(values))
+        elif encoding == DICTIONARY:
+            body.append(_encode_dictionary(values))
+        elif encoding == NULLABLE_INT32:
+            body.append(
+                _encode_ints(
+                    [_NULL_INT32 if value is None else value for value in values],
+                    INT32,
+                )
+            )
+        else:
+            body.append(_encode_ints(values, encoding))
+    body = b"".join(body)
+    return _FRAME.pack(tag, len(rows), len(body)) + body
+
+
+def dump_snapshot(stream, chunk_size=DEFAULT_SNAPSHOT_CHUNK_SIZE):
+    """
+    Writes the articles, products, BOMs and the stock of the warehouses to a binary
+    stream in snapshot format.
+
+    Every table is streamed from the database and written in frames of up to
+    ``chunk_size`` rows, so only one chunk is held in memory at a time.
+
+    :param stream: A binary file-like object.
+    :param chunk_size: The number of rows per frame.
+    :return: A dict mapping table tags to the number of rows written.
+    """
+    counts = {}
+    stream.write(MAGIC)
+    for tag, model, columns in TABLES:
+        rows = (
+            model.objects.order_by("pk")
+            .values_list(*(name for name, _ in columns))
+            .iterator(chunk_size=chunk_size)
+        )
+        counts[tag] = 0
+        for chunk in chunked(rows, chunk_size):
+            stream.write(encode_frame(tag, columns, chunk))
+            counts[tag] += len(chunk)
+    return counts
+
+
+class SnapshotReader:
+    """
+    Reads the frames of a snapshot file through a read-only memory map.
+
+    Iterating the reader yields ``(tag, model, columns, rows)`` per frame, where rows
+    is an iterator of tuples. Only the pages of the current frame are paged in.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise SnapshotError(f"{path} is empty.")
+        self.position = 0
+        if self._read(len(MAGIC)) != MAGIC:
+            self.close()
+            raise SnapshotError(f"{path} is not an inventory snapshot.")
+        self.tables = {tag: (model, columns) for tag, model, columns in TABLES}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def _read(self, size):
+        end = self.position + size
+        if end > len(self.map):
+            raise SnapshotError("The snapshot is truncated.")
+        data = self.map[self.position : end]
+        self.position = end
+        return data
+
+    def _read_buffer(self):
+        (size,) = _LENGTH.unpack(self._read(_LENGTH.size))
+        return self._read(size)
+
+    def _read_ints(self, typecode, count=None):
+        column = array(typecode)
+        data = self._read_buffer()
+        if len(data) % column.itemsize or (
+            count is not None and len(data) != count * column.itemsize
+        ):
+            raise SnapshotError("A column does not match the row count of its frame.")
+        column.frombytes(data)
+        if _BIG_ENDIAN:
+            column.byteswap()
+        return column
+
+    def _read_strings(self, count=None):
+        # Dictionaries are read without a count, it follows from their offsets
+        offsets = self._read_ints(INT64, None if count is None else count + 1)
+        data = self._read_buffer()
+        try:
+            return [
+                data[offsets[i] : offsets[i + 1]].decode()
+                for i in range(len(offsets) - 1)
+            ]
+        except UnicodeDecodeError:
+            raise SnapshotError("A string column is not valid UTF-8.")
+
+    def _read_dictionary(self, count):
+        values = self._read_strings()
+        try:
+            return [values[code] for code in self._read_ints(INT32, count)]
+        except IndexError:
+            raise SnapshotError("A dictionary code is out of range.")
+
+    def __iter__(self):
+        while self.position < len(self.map):
+            tag, count, size = _FRAME.unpack(self._read(_FRAME.size))
+            if tag not in self.tables:
+                raise SnapshotError(f"Unknown table {tag!r} in the snapshot.")
+            end = self.position + size
+            model, columns = self.tables[tag]
+            values = []
+            for _, encoding in columns:
+                if encoding == STRING:
+                    values.append(self._read_strings(count))
+                elif encoding == DICTIONARY:
+                    values.append(self._read_dictionary(count))
+                elif encoding == NULLABLE_INT32:
+                    values.append(
+                        [
+                            None if value == _NULL_INT32 else value
+                            for value in self._read_ints(INT32, count)
+                        ]
+                    )
+                else:
+                    values.append(self._read_ints(encoding, count))
+            if self.position != end:
+                raise SnapshotError("A frame does not match its length.")
+            yield tag, model, columns, zip(*values)
+
+
+@contextmanager
+def deferred_indexes(models):
+    """
+    Drops the secondary indexes of the given models and recreates them on exit.
+
+    Building an index once over the loaded rows is much cheaper than updating it on
+    every insert. Primary keys and unique constraints are kept. The statements run
+    on the current transaction, a failed load rolls the drop back as well.
+    """
+    # Only used to build the statements, entering the SQLite schema editor is not
+    # allowed inside a transaction
+    schema_editor = connection.SchemaEditorClass(connection)
+    with connection.cursor() as cursor:
+        for model in models:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table
+            )
+            for name, info in constraints.items():
+                if info["index"] and not info["unique"] and not info["primary_key"]:
+                    cursor.execute(str(schema_editor._delete_index_sql(model, name)))
+    yield
+    with connection.cursor() as cursor:
+        for model in models:
+            for sql in schema_editor._model_indexes_sql(model):
+                cursor.execute(str(sql))
+
+
+def _insert(cursor, model, columns, rows):
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name, _ in columns]
+    # Fields which are not part of the snapshot, e.g. the reserved units of the
+    # articles, start from their default
+    defaults = [
+        field
+        for field in model._meta.concrete_fields
+        if field not in fields and not field.primary_key and field.has_default()
+    ]
+    values = tuple(field.get_default() for field in defaults)
+    fields += defaults
+    cursor.executemany(
+        f"INSERT INTO {quote_name(model._meta.db_table)} "
+        f"({', '.join(quote_name(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})",
+        [row + values for row in rows],
+    )
+
+
+def load_snapshot(path):
+    """
+    Loads a snapshot written by ``dump_snapshot`` into an empty catalogue.
+
+    The rows are inserted frame by frame with one ``executemany`` per frame and the
+    secondary indexes are rebuilt once at the end. The stock of every article is
+    recorded as a ledger snapshot and the article requirements of products without
+    sub-assemblies are copied from their articles in SQL, then the sub-assemblies
+    are exploded and the availability of the products is rebuilt.
+
+    :param path: The path of the snapshot file.
+    :return: A dict mapping table tags to the number of rows loaded.
+    :raises SnapshotError: If the catalogue is not empty or the file is malformed.
+    """
+    models = [model for _, model, _ in TABLES]
+    non_empty = [
+        str(model._meta.verbose_name_plural)
+        for model in models
+        if model.objects.exists()
+    ]
+    if non_empty:
+        raise SnapshotError(
+            f"Snapshots are only loaded into an empty catalogue, found "
+            f"{', '.join(non_empty)}."
+        )
+
+    counts = {tag: 0 for tag, _, _ in TABLES}
+    quote_name = connection.ops.quote_name
+    with transaction.atomic():
+        with SnapshotReader(path) as reader, deferred_indexes(
+            models + [StockSnapshot, ProductRequirement]
+        ):
+            with connection.cursor() as cursor:
+                for tag, model, columns, rows in reader:
+                    rows = list(rows)
+                    _insert(cursor, model, columns, rows)
+                    counts[tag] += len(rows)
+                # The loaded stock has no movements, start the ledger of every article
+                # from a snapshot of it
+                cursor.execute(
+                    f"INSERT INTO {quote_name(StockSnapshot._meta.db_table)} "
+                    f"(article_id, movement_id, stock, taken_at) "
+                    f"SELECT id, 0, stock, %s FROM {quote_name(Article._meta.db_table)}",
+                    [connection.ops.adapt_datetimefield_value(timezone.now())],
+                )
+                # Clients following the changes feed pick up the loaded articles,
+                # the products are recorded by the availability rebuild
+                cursor.execute(
+                    f"INSERT INTO {quote_name(InventoryChange._meta.db_table)} "
+                    f"(kind, object_id, created_at) "
+                    f"SELECT %s, id, %s FROM {quote_name(Article._meta.db_table)} "
+                    f"ORDER BY id",
+                    [
+                        InventoryChange.ARTICLE,
+                        connection.ops.adapt_datetimefield_value(timezone.now()),
+                    ],
+                )
+                # The requirements of products without sub-assemblies are their own
+                # articles, the others are exploded by ``bom_changed`` below
+                cursor.execute(
+                    f"INSERT INTO {quote_name(ProductRequirement._meta.db_table)} "
+                    f"(product_id, article_id, quantity) "
+                    f"SELECT product_id, article_id, SUM(quantity) "
+                    f"FROM {quote_name(ProductArticle._meta.db_table)} "
+                    f"WHERE product_id NOT IN "
+                    f"(SELECT product_id FROM "
+                    f"{quote_name(ProductComponent._meta.db_table)}) "
+                    f"GROUP BY product_id, article_id HAVING SUM(quantity) > 0"
+                )
+                # The products keep their ids, move the sequences past them
+                for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(sql)
+        bom_changed(
+            ProductComponent.objects.values_list("product_id", flat=True).distinct()
+        )
+        rebuild_availability()
+    return counts
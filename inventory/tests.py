@@ -1,11 +1,49 @@
+import asyncio
+import importlib.util
+import io
 import json
+import math
 import os
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
 
-from django.db.models import Min
-from django.test import Client, TestCase
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import F, Min
+from django.db.models.deletion import Collector
+from django.forms.models import inlineformset_factory
+from django.test import (AsyncClient, Client, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
 
-from inventory.models import Article, ProductArticle, ProductConfig
+from inventory.admin import ProductComponentFormSet
+from inventory.alerts import deliver_alerts
+from inventory.cache import LocalLRUCache, get_product_cache
+from inventory.changes import prune_changes
+from inventory.coalescing import SellCoalescer, SellQueueFull, SellTimeout
+from inventory.idempotency import prune_idempotency_records
+from inventory.imports import iter_json_array
+from inventory.jobs import create_job, resume_jobs
+from inventory.ledger import (compact, current_stock, prune_movements,
+                              rebuild_article_stock, stock_at)
+from inventory.metrics import Histogram, registry
+from inventory.models import (AlertEvent, Article, IdempotencyRecord,
+                              ImportJob, InventoryChange, LocationStock,
+                              ProductArticle, ProductAvailability,
+                              ProductComponent, ProductConfig,
+                              ProductRequirement, Reservation, StockMovement,
+                              Warehouse, deleting_products)
+from inventory.reservations import expire_reservations
+from inventory.selling import (InsufficientStock, InvalidQuantity,
+                               ProductNotFound, sell_batch)
+from inventory.sites import receive_stock, site_availability
+from inventory.snapshot import SnapshotError, dump_snapshot, load_snapshot
 
 DEFAULT_QUANTITY_TO_SELL = 1
 
@@ -35,6 +73,78 @@ class ProductViewTestCase(TestCase):
         response = self.client.get(reverse("inventory:product-details", args=[999]))
         self.assertEqual(response.status_code, 404)
 
+    def test_sell_rejects_invalid_quantities(self):
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        for quantity in (0.5, "1", -1, True):
+            response = self.client.put(
+                reverse("inventory:product-sell", args=[chair.id]),
+                data={"quantity": quantity},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Article.objects.get(id="1").stock, 12)
+        outcomes = sell_batch([(chair.id, 0.5), (chair.id, 1)])
+        self.assertIsInstance(outcomes[0], InvalidQuantity)
+        self.assertEqual(outcomes[1], "Dining Chair")
+
+    def test_stock_follows_sales_of_products_sharing_articles(self):
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        table = ProductConfig.objects.get(name="Dinning Table")
+        self.client.put(reverse("inventory:product-sell", args=[chair.id]))
+
+        response = self.client.get(reverse("inventory:product-details", args=[table.id]))
+        # 8 legs and 9 screws are left, enough for one table
+        self.assertEqual(response.json()["products"][0]["stock"], 1)
+        self.assertEqual(ProductAvailability.objects.get(product=chair).stock, 1)
+
+    def test_stock_follows_article_edits(self):
+        Article.objects.filter(id="3").update(stock=0)
+        article = Article.objects.get(id="3")
+        article.stock = 1
+        article.save()
+
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        self.assertEqual(ProductAvailability.objects.get(product=chair).stock, 1)
+
+        ProductArticle.objects.filter(product=chair, article_id="3").delete()
+        ProductArticle.objects.get(product=chair, article_id="1").delete()
+        self.assertEqual(ProductAvailability.objects.get(product=chair).stock, 2)
+
+    def test_failed_product_delete_keeps_bom_edits(self):
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        with mock.patch.object(Collector, "delete", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                chair.delete()
+            with self.assertRaises(DatabaseError):
+                ProductConfig.objects.filter(id=chair.id).delete()
+
+        self.assertEqual(deleting_products(), set())
+        ProductConfig.objects.get(name="Dinning Table").delete()
+        self.assertEqual(deleting_products(), set())
+        ProductArticle.objects.filter(product=chair, article_id="3").delete()
+        self.assertFalse(
+            ProductRequirement.objects.filter(product=chair, article_id="3").exists()
+        )
+
+    def test_products_report_their_bottleneck(self):
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        self.client.put(reverse("inventory:product-sell", args=[chair.id]))
+
+        product = self.client.get(
+            reverse("inventory:product-details", args=[chair.id])
+        ).json()["products"][0]
+        # 9 screws and 1 seat are left for one chair, 8 legs would do for two
+        self.assertEqual(product["bottleneck_article"], "2")
+        self.assertEqual(product["second_headroom"], 1)
+
+        url = reverse("inventory:product-constrained")
+        products = self.client.get(url, {"limit": 1}).json()["products"]
+        self.assertEqual(
+            [(p["name"], p["stock"], p["bottleneck_article"]) for p in products],
+            [("Dining Chair", 1, "2")],
+        )
+        self.assertEqual(self.client.get(url, {"limit": "all"}).status_code, 400)
+
     def test_get_product_with_error(self):
         client = Client()
         url = None
@@ -44,6 +154,123 @@ class ProductViewTestCase(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+
+    def _sell(self, key, quantity=1):
+        return self.client.put(
+            reverse("inventory:product-sell", args=[self.chair.id]),
+            data={"quantity": quantity},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_sale(self):
+        response = self._sell("order-1")
+        retry = self._sell("order-1")
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.content, response.content)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        # The screws were decremented once
+        self.assertEqual(Article.objects.get(id="2").stock, 9)
+        self.assertEqual(self._sell("order-2").status_code, 200)
+        self.assertEqual(Article.objects.get(id="2").stock, 1)
+
+    def test_key_reused_for_another_request(self):
+        self._sell("order-1")
+        self.assertEqual(self._sell("order-1", quantity=2).status_code, 422)
+
+    def test_expired_keys_are_pruned(self):
+        self._sell("order-1")
+
+        pruned = prune_idempotency_records(now=timezone.now() + timedelta(days=2))
+
+        self.assertEqual(pruned, 1)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_same_upload_is_imported_once(self):
+        initial_stock = dict(Article.objects.values_list("id", "stock"))
+        for _ in range(2):
+            response = self.client.post(
+                reverse("inventory:upload-articles"), {"file": _inventory_file()}
+            )
+            self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        for article in Article.objects.all():
+            self.assertEqual(article.stock, 2 * initial_stock[article.id])
+
+
+class ProductCacheTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        get_product_cache().backend.clear()
+
+    def test_repeated_reads_are_served_from_cache(self):
+        url = reverse("inventory:product-list")
+        first = self.client.get(url)
+        # Only the inventory version of the ETag, see the shared cache below
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+
+        self.assertEqual(first.content, second.content)
+        stats = self.client.get(reverse("inventory:product-cache-stats")).json()
+        self.assertGreaterEqual(stats["hits"], 1)
+
+    def test_sale_invalidates_affected_products(self):
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        table = ProductConfig.objects.get(name="Dinning Table")
+        table_url = reverse("inventory:product-details", args=[table.id])
+        self.assertEqual(self.client.get(table_url).json()["products"][0]["stock"], 1)
+
+        self.client.put(
+            reverse("inventory:product-sell", args=[chair.id]),
+            data={"quantity": 2},
+            content_type="application/json",
+        )
+        # Only 1 screw is left
+        self.assertEqual(self.client.get(table_url).json()["products"][0]["stock"], 0)
+
+    def test_local_cache_evicts_least_recently_used(self):
+        cache = LocalLRUCache(max_entries=2, timeout=30)
+        cache.set("a", b"1")
+        cache.set("b", b"2")
+        cache.get("a")
+        cache.set("c", b"3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1")
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        registry.reset()
+
+    @override_settings(INVENTORY_PRODUCT_CACHE={"BACKEND": None})
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse("inventory:product-list"))
+        self.client.get(reverse("inventory:product-list"))
+
+        views = self.client.get(reverse("inventory:metrics")).json()["views"]
+        product_list = views["inventory:product-list"]
+        self.assertEqual(product_list["wall_ms"]["count"], 2)
+        # The inventory version and the products per request
+        self.assertEqual(product_list["db_queries"]["sum"], 4)
+        self.assertEqual(product_list["serialization_ms"]["count"], 2)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            histogram.record(value)
+
+        self.assertEqual(histogram.quantile(0.5), 10)
+        self.assertIsNone(histogram.quantile(0.99))
+        self.assertEqual(histogram.snapshot()["buckets"]["+Inf"], 1)
+
+
 class ProductSellViewTestCase(TestCase):
     def setUp(self):
         _setup()
@@ -92,7 +319,7 @@ class ProductSellViewTestCase(TestCase):
         )
 
         # Check that response is a 400
-        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.status_code, 400)
 
     def test_product_sell_view_with_no_request_body(self):
         client = Client()
@@ -126,6 +353,1211 @@ class ProductSellViewTestCase(TestCase):
         # Check that response is a 405
         self.assertEqual(response.status_code, 405)
 
+    def test_product_sell_view_with_quantity_above_stock(self):
+        product_id = ProductConfig.objects.get(name="Dining Chair").id
+        initial_stock = dict(Article.objects.values_list("id", "stock"))
+        response = self.client.put(
+            reverse("inventory:product-sell", args=[product_id]),
+            data={"quantity": 3},
+            content_type="application/json",
+        )
+
+        # Check that nothing has been decremented
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("We currently have 2 units", response.content.decode())
+        self.assertEqual(dict(Article.objects.values_list("id", "stock")), initial_stock)
+
+    def test_product_sell_view_query_count_does_not_grow_with_bom(self):
+        big_product = ProductConfig.objects.create(name="Wardrobe")
+        for index in range(10):
+            article = Article.objects.create(id=f"w{index}", name="panel", stock=10)
+            ProductArticle.objects.create(
+                product=big_product, article=article, quantity=1
+            )
+        small_product_id = ProductConfig.objects.get(name="Dining Chair").id
+
+        with CaptureQueriesContext(connection) as small_sale:
+            self.client.put(reverse("inventory:product-sell", args=[small_product_id]))
+        with CaptureQueriesContext(connection) as big_sale:
+            self.client.put(reverse("inventory:product-sell", args=[big_product.id]))
+
+        self.assertEqual(len(small_sale), len(big_sale))
+        self.assertEqual(Article.objects.get(id="w9").stock, 9)
+
+
+class OrderViewTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+        self.table = ProductConfig.objects.get(name="Dinning Table")
+
+    def _order(self, lines):
+        return self.client.post(
+            reverse("inventory:order"),
+            data={"lines": lines},
+            content_type="application/json",
+        )
+
+    def test_order_sells_all_lines(self):
+        response = self._order(
+            [
+                {"product_id": self.chair.id, "quantity": 1},
+                {"product_id": self.table.id},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [line["status"] for line in response.json()["lines"]], ["sold", "sold"]
+        )
+        self.assertEqual(Article.objects.get(id="1").stock, 4)
+        self.assertEqual(Article.objects.get(id="2").stock, 1)
+
+    def test_order_is_rejected_when_combined_demand_exceeds_stock(self):
+        # Each product alone can be sold, together they need 24 screws
+        response = self._order(
+            [
+                {"product_id": self.chair.id, "quantity": 2},
+                {"product_id": self.table.id, "quantity": 1},
+                {"product_id": 999, "quantity": 1},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 409)
+        lines = response.json()["lines"]
+        self.assertEqual(
+            [line["status"] for line in lines],
+            ["insufficient_stock", "insufficient_stock", "not_found"],
+        )
+        self.assertEqual(lines[0]["short_articles"], ["2"])
+        self.assertEqual(Article.objects.get(id="2").stock, 17)
+
+    def test_order_with_invalid_lines(self):
+        response = self._order([{"product_id": self.chair.id, "quantity": -1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("0", response.json()["errors"])
+
+
+class ReservationTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+
+    def _reserve(self, quantity=1, **data):
+        return self.client.post(
+            reverse("inventory:product-reserve", args=[self.chair.id]),
+            data={"quantity": quantity, **data},
+            content_type="application/json",
+        )
+
+    def _close(self, action, reservation_id):
+        return self.client.post(
+            reverse(f"inventory:reservation-{action}", args=[reservation_id])
+        )
+
+    def _availability(self):
+        return ProductAvailability.objects.get(product=self.chair)
+
+    def test_reservation_holds_stock_without_selling_it(self):
+        response = self._reserve(2)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["status"], Reservation.ACTIVE)
+        self.assertEqual(Article.objects.get(id="2").stock, 17)
+        self.assertEqual(Article.objects.get(id="2").reserved, 16)
+        self.assertEqual(self._availability().stock, 2)
+        self.assertEqual(self._availability().available, 0)
+        # The held units can neither be sold nor reserved again
+        (outcome,) = sell_batch([(self.chair.id, 1)])
+        self.assertIsInstance(outcome, InsufficientStock)
+        self.assertEqual(self._reserve().status_code, 400)
+
+    def test_commit_sells_the_held_units(self):
+        reservation_id = self._reserve().json()["id"]
+
+        response = self._close("commit", reservation_id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], Reservation.COMMITTED)
+        self.assertEqual(Article.objects.get(id="2").stock, 9)
+        self.assertEqual(Article.objects.get(id="2").reserved, 0)
+        self.assertEqual(self._availability().available, 1)
+        # A reservation is closed once
+        self.assertEqual(self._close("commit", reservation_id).status_code, 409)
+        self.assertEqual(self._close("release", reservation_id).status_code, 409)
+        self.assertEqual(self._close("commit", 999).status_code, 404)
+
+    def test_release_gives_the_units_back(self):
+        reservation_id = self._reserve(2).json()["id"]
+
+        response = self._close("release", reservation_id)
+
+        self.assertEqual(response.json()["status"], Reservation.RELEASED)
+        self.assertEqual(Article.objects.get(id="2").stock, 17)
+        self.assertEqual(Article.objects.get(id="2").reserved, 0)
+        self.assertEqual(self._availability().available, 2)
+
+    def test_expired_reservations_are_released(self):
+        reservation_id = self._reserve(2, ttl=60).json()["id"]
+
+        expired = expire_reservations(now=timezone.now() + timedelta(seconds=61))
+
+        self.assertEqual(expired, 1)
+        self.assertEqual(Reservation.objects.get(id=reservation_id).status, "expired")
+        self.assertEqual(Article.objects.get(id="2").reserved, 0)
+        self.assertEqual(self._availability().available, 2)
+        self.assertEqual(self._close("commit", reservation_id).status_code, 409)
+
+    def test_reserve_with_invalid_request(self):
+        self.assertEqual(self._reserve(0).status_code, 400)
+        self.assertEqual(self._reserve(ttl="soon").status_code, 400)
+        response = self.client.post(
+            reverse("inventory:product-reserve", args=[999]),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class WarehouseTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+        self.table = ProductConfig.objects.get(name="Dinning Table")
+        Warehouse.objects.create(code="A", name="Amsterdam")
+        Warehouse.objects.create(code="B", name="Berlin")
+        # A keeps the articles of 2 chairs, B of 1 chair
+        self._receive("A", {"1": 8, "2": 16, "3": 2})
+        self._receive("B", {"1": 4, "2": 8, "3": 1})
+
+    def _receive(self, code, articles):
+        return self.client.post(
+            reverse("inventory:warehouse-stock", args=[code]),
+            data={"articles": articles},
+            content_type="application/json",
+        )
+
+    def _sell(self, quantity, **data):
+        return self.client.post(
+            reverse("inventory:product-site-sell", args=[self.chair.id]),
+            data={"quantity": quantity, **data},
+            content_type="application/json",
+        )
+
+    def test_receipts_add_located_stock(self):
+        leg = Article.objects.get(id="1")
+        self.assertEqual((leg.stock, leg.located), (24, 12))
+        # The global sales only use the stock outside the warehouses
+        self.assertEqual(ProductAvailability.objects.get(product=self.chair).available, 2)
+        outcomes = sell_batch([(self.chair.id, 2), (self.chair.id, 1)])
+        self.assertEqual(outcomes[0], "Dining Chair")
+        self.assertIsInstance(outcomes[1], InsufficientStock)
+
+    def test_site_availability_is_one_query(self):
+        with self.assertNumQueries(1):
+            availability = site_availability([self.chair.id, self.table.id])
+
+        self.assertEqual(availability, {self.chair.id: {"A": 2, "B": 1}})
+        response = self.client.get(
+            reverse("inventory:product-sites"), {"ids": f"{self.chair.id}"}
+        )
+        self.assertEqual(response.json()["products"][0]["total"], 3)
+
+    def test_sale_is_fulfilled_by_one_site_or_split(self):
+        response = self._sell(2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["sites"], {"A": 2})
+
+        self._receive("A", {"1": 4, "2": 8, "3": 1})
+        response = self._sell(2)
+        self.assertEqual(response.json()["sites"], {"A": 1, "B": 1})
+        leg = Article.objects.get(id="1")
+        self.assertEqual((leg.stock, leg.located), (12, 0))
+
+    def test_sale_from_a_site(self):
+        self.assertEqual(self._sell(2, site="B").status_code, 400)
+        self.assertEqual(self._sell(1, site="C").status_code, 404)
+        response = self._sell(1, site="B")
+        self.assertEqual(response.json()["sites"], {"B": 1})
+        self.assertEqual(site_availability([self.chair.id]), {self.chair.id: {"A": 2}})
+
+    def test_invalid_stock_changes(self):
+        response = self._receive("B", {"1": -5, "99": 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["errors"]), {"1", "99"})
+        self.assertEqual(self._receive("C", {"1": 1}).status_code, 404)
+        self.assertEqual(Article.objects.get(id="1").located, 12)
+
+
+class AlertTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+        self.path = os.path.join(tempfile.mkdtemp(), "alerts.jsonl")
+        # The seats run low after one sale, the chairs after two
+        Article.objects.filter(id="3").update(reorder_level=1)
+        ProductConfig.objects.filter(id=self.chair.id).update(reorder_level=0)
+
+    def _sell(self):
+        return self.client.put(reverse("inventory:product-sell", args=[self.chair.id]))
+
+    def _events(self):
+        return list(
+            AlertEvent.objects.order_by("id").values_list("kind", "object_id", "state")
+        )
+
+    def test_crossings_raise_events_once(self):
+        self._sell()
+        self.assertEqual(self._events(), [("article", "3", "low")])
+        self._sell()
+        self.assertEqual(
+            self._events(),
+            [("article", "3", "low"), ("product", str(self.chair.id), "low")],
+        )
+
+        seat = Article.objects.get(id="3")
+        seat.stock = 5
+        seat.save()
+        event = AlertEvent.objects.latest("id")
+        self.assertEqual(
+            (event.object_id, event.state, event.old_stock, event.new_stock),
+            ("3", "restocked", 0, 5),
+        )
+
+    def test_deliver_to_file(self):
+        self._sell()
+        with override_settings(INVENTORY_ALERTS={"PATH": self.path}):
+            self.assertEqual(deliver_alerts(), 1)
+            self.assertEqual(deliver_alerts(), 0)
+
+        with open(self.path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(
+            [(line["object_id"], line["state"], line["new_stock"]) for line in lines],
+            [("3", "low", 1)],
+        )
+        self.assertFalse(AlertEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_failed_webhook_is_retried(self):
+        received = []
+        statuses = [500, 204]
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append(json.loads(body))
+                self.send_response(statuses.pop(0))
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self._sell()
+        config = {
+            "SINK": "webhook",
+            "URL": f"http://127.0.0.1:{server.server_port}/alerts",
+        }
+        with override_settings(INVENTORY_ALERTS=config):
+            self.assertEqual(deliver_alerts(), 0)
+            self.assertEqual(AlertEvent.objects.get().attempts, 1)
+            self.assertEqual(deliver_alerts(), 1)
+
+        self.assertEqual(len(received), 2)
+        self.assertEqual(received[1]["events"][0]["object_id"], "3")
+        self.assertIsNotNone(AlertEvent.objects.get().delivered_at)
+
+
+class BuildPlanViewTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+        self.table = ProductConfig.objects.get(name="Dinning Table")
+
+    def _plan(self, data):
+        return self.client.post(
+            reverse("inventory:build-plan"), data=data, content_type="application/json"
+        )
+
+    def test_plan_shares_articles_between_products(self):
+        # Alone 2 chairs and 1 table can be built, together the 17 screws only do
+        # for 2 products
+        response = self._plan({"weights": {self.chair.id: 1, self.table.id: 1}})
+
+        self.assertEqual(response.status_code, 200)
+        plan = response.json()
+        self.assertEqual([line["quantity"] for line in plan["plan"]], [1, 1])
+        self.assertEqual(plan["leftover"], {"1": 4, "2": 1, "3": 1, "4": 0})
+
+    def test_plan_is_capped_by_demand(self):
+        plan = self._plan({"demand": {self.chair.id: 1, 999: 1}}).json()
+
+        self.assertEqual(plan["plan"][0]["quantity"], 1)
+        self.assertEqual(plan["not_found"], [999])
+
+    def test_plan_with_invalid_mix(self):
+        response = self._plan({"weights": {self.chair.id: 1}, "demand": {}})
+        self.assertEqual(response.status_code, 400)
+        response = self._plan({"demand": {self.chair.id: 0.5}})
+        self.assertIn(str(self.chair.id), response.json()["errors"])
+        for weight in (math.inf, math.nan):
+            response = self._plan(
+                {"weights": {self.chair.id: weight, self.table.id: 1}}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(str(self.chair.id), response.json()["errors"])
+
+
+class InventoryChangesTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        get_product_cache().backend.clear()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+        self.table = ProductConfig.objects.get(name="Dinning Table")
+
+    def _sell_chair(self):
+        self.client.put(reverse("inventory:product-sell", args=[self.chair.id]))
+
+    def test_unchanged_polls_are_not_modified(self):
+        urls = [
+            reverse("inventory:product-list"),
+            reverse("inventory:article-list-create"),
+            reverse("inventory:product-config-list-create"),
+        ]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        self.assertEqual(len(set(etags)), 1)
+
+        # Answered from the inventory version alone, without touching the products
+        with self.assertNumQueries(1):
+            response = self.client.get(urls[0], HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, 304)
+
+        self._sell_chair()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(INVENTORY_PRODUCT_CACHE={"BACKEND": "django"})
+    def test_shared_cache_keeps_the_version_until_a_change(self):
+        get_product_cache().backend.clear()
+        url = reverse("inventory:product-list")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self._sell_chair()
+        self.assertNotEqual(self.client.get(url)["ETag"], etag)
+
+    def test_local_cache_does_not_keep_the_version(self):
+        url = reverse("inventory:product-list")
+        etag = self.client.get(url)["ETag"]
+        # A change made by another process, it invalidates nothing here
+        InventoryChange.objects.create(kind=InventoryChange.ARTICLE, object_id="1")
+        self.assertNotEqual(self.client.get(url)["ETag"], etag)
+
+    def test_changes_since_version(self):
+        url = reverse("inventory:inventory-changes")
+        version = int(self.client.get(reverse("inventory:product-list"))["ETag"][1:-1])
+
+        self._sell_chair()
+        table_id = self.table.id
+        Article.objects.get(id="3").delete()
+        self.table.delete()
+        changes = self.client.get(url, {"since": version}).json()
+
+        self.assertGreater(changes["version"], version)
+        self.assertFalse(changes["more"])
+        self.assertEqual(
+            [(a["id"], a["stock"]) for a in changes["articles"]],
+            [("1", 8), ("2", 9)],
+        )
+        self.assertEqual(changes["removed"]["articles"], ["3"])
+        self.assertEqual([p["id"] for p in changes["products"]], [self.chair.id])
+        self.assertEqual(changes["removed"]["products"], [table_id])
+
+        caught_up = self.client.get(url, {"since": changes["version"]}).json()
+        self.assertEqual(caught_up["version"], changes["version"])
+        self.assertEqual(caught_up["articles"], [])
+
+        first = self.client.get(url, {"since": version, "limit": 1}).json()
+        self.assertTrue(first["more"])
+        self.assertEqual(first["version"], version + 1)
+
+    def test_pruned_changes_expire(self):
+        self._sell_chair()
+        self._sell_chair()
+        prune_changes(timezone.now() + timezone.timedelta(days=1))
+
+        response = self.client.get(
+            reverse("inventory:inventory-changes"), {"since": 0}
+        )
+        self.assertEqual(response.status_code, 410)
+
+
+class ListingViewTestCase(TestCase):
+    def setUp(self):
+        _setup()
+
+    def test_articles_are_paginated_by_id(self):
+        url = reverse("inventory:article-list-create")
+        first_page = self.client.get(url, {"page_size": 3}).json()
+        second_page = self.client.get(first_page["next"]).json()
+
+        ids = [a["id"] for a in first_page["results"] + second_page["results"]]
+        self.assertEqual(ids, ["1", "2", "3", "4"])
+        self.assertIsNone(second_page["next"])
+
+    def test_articles_filters(self):
+        url = reverse("inventory:article-list-create")
+        response = self.client.get(url, {"name": "s", "stock_min": 3})
+        self.assertEqual([a["name"] for a in response.json()["results"]], ["screw"])
+
+        response = self.client.get(url, {"stock_max": "many"})
+        self.assertEqual(response.status_code, 400)
+
+        # Prefixes ending in the highest code point have no upper bound
+        Article.objects.create(id="9", name="s\U0010ffff\U0010ffffx", stock=1)
+        for name in ("s\U0010ffff", "\U0010ffff", "s\ud7ff"):
+            response = self.client.get(url, {"name": name})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, {"name": "s\U0010ffff"})
+        self.assertEqual([a["id"] for a in response.json()["results"]], ["9"])
+
+    def test_products_config_filtered_by_article(self):
+        url = reverse("inventory:product-config-list-create")
+        # The inventory version of the ETag, the page and its articles
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"article": "4"})
+
+        results = response.json()["results"]
+        self.assertEqual([p["name"] for p in results], ["Dinning Table"])
+        self.assertEqual(len(results[0]["articles"]), 3)
+
+    def test_article_impact(self):
+        url = reverse("inventory:article-impact")
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"ids": "2,4"})
+
+        results = response.json()["results"]
+        self.assertEqual(
+            [(p["name"], p["stock"], p["bottleneck_article"]) for p in results],
+            [("Dining Chair", 2, "2"), ("Dinning Table", 1, "4")],
+        )
+        self.assertEqual(results[1]["uses"], {"2": 8, "4": 1})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
+
+
+class StockLedgerTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+
+    def test_ledger_follows_sales_uploads_and_edits(self):
+        self.client.put(reverse("inventory:product-sell", args=[self.chair.id]))
+        self.client.post(
+            reverse("inventory:upload-articles"), {"file": _inventory_file()}
+        )
+        article = Article.objects.get(id="4")
+        article.stock = 5
+        article.save()
+
+        self.assertEqual(
+            current_stock(), dict(Article.objects.values_list("id", "stock"))
+        )
+        self.assertEqual(StockMovement.objects.filter(article_id="1").count(), 3)
+
+    def test_compaction_keeps_stock_and_point_in_time_lookups(self):
+        before_sale = timezone.now()
+        self.client.put(reverse("inventory:product-sell", args=[self.chair.id]))
+
+        # Every article has movements since it was created
+        self.assertEqual(compact(), 4)
+        self.assertEqual(compact(), 0)
+        self.assertEqual(current_stock(["1"]), {"1": 8})
+        self.assertEqual(stock_at(["1"], before_sale), {"1": 12})
+
+        response = self.client.get(reverse("inventory:article-stock", args=["1"]))
+        self.assertEqual(response.json()["stock"], 8)
+
+    def test_point_in_time_lookups_survive_pruning(self):
+        self.client.put(reverse("inventory:product-sell", args=[self.chair.id]))
+        compact()
+        after_compaction = timezone.now()
+
+        self.assertEqual(prune_movements(timezone.now()), 7)
+        self.assertFalse(StockMovement.objects.filter(article_id="1").exists())
+        self.assertEqual(stock_at(["1", "3"], after_compaction), {"1": 8, "3": 1})
+        self.assertEqual(current_stock(["1"]), {"1": 8})
+
+    def test_rebuild_replays_ledger_into_stock(self):
+        Article.objects.filter(id="2").update(stock=0)
+
+        self.assertEqual(rebuild_article_stock(), ["2"])
+        self.assertEqual(Article.objects.get(id="2").stock, 17)
+        self.assertEqual(ProductAvailability.objects.get(product=self.chair).stock, 2)
+
+
+class InventorySnapshotTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        Article.objects.create(id="5", name="Tischbein für Stühle", stock=7)
+        table = ProductConfig.objects.get(name="Dinning Table")
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        ProductComponent.objects.create(product=table, component=chair, quantity=2)
+        Warehouse.objects.create(code="A", name="Amsterdam")
+        receive_stock("A", {"1": 4, "3": 1})
+        Article.objects.filter(id="1").update(reorder_level=5)
+        ProductConfig.objects.filter(id=chair.id).update(reorder_level=0)
+        self.path = os.path.join(tempfile.mkdtemp(), "inventory.snapshot")
+        self.addCleanup(os.remove, self.path)
+
+    def _catalogue(self):
+        return (
+            list(
+                Article.objects.order_by("id").values_list(
+                    "id", "name", "stock", "located", "reorder_level"
+                )
+            ),
+            list(
+                ProductConfig.objects.order_by("id").values_list(
+                    "id", "name", "reorder_level"
+                )
+            ),
+            sorted(
+                ProductArticle.objects.values_list(
+                    "product_id", "article_id", "quantity"
+                )
+            ),
+            list(
+                ProductComponent.objects.values_list(
+                    "product_id", "component_id", "quantity"
+                )
+            ),
+            sorted(
+                ProductRequirement.objects.values_list(
+                    "product_id", "article_id", "quantity"
+                )
+            ),
+            sorted(ProductAvailability.objects.values_list("product_id", "stock")),
+            list(Warehouse.objects.values_list("id", "code", "name")),
+            sorted(
+                LocationStock.objects.values_list(
+                    "warehouse__code", "article_id", "stock"
+                )
+            ),
+        )
+
+    def _clear(self):
+        ProductConfig.objects.all().delete()
+        Article.objects.all().delete()
+        Warehouse.objects.all().delete()
+
+    def test_dump_and_load_round_trip(self):
+        with open(self.path, "wb") as stream:
+            # Several frames per table
+            counts = dump_snapshot(stream, chunk_size=2)
+        self.assertEqual(
+            counts,
+            {
+                b"ARTI": 5,
+                b"PROD": 2,
+                b"PART": 6,
+                b"PCMP": 1,
+                b"WHSE": 1,
+                b"LSTK": 2,
+            },
+        )
+        catalogue = self._catalogue()
+
+        self._clear()
+        load_snapshot(self.path)
+
+        self.assertEqual(self._catalogue(), catalogue)
+        # The loaded stock is the start of the ledger
+        self.assertEqual(
+            current_stock(), dict(Article.objects.values_list("id", "stock"))
+        )
+        # New products do not collide with the loaded ids
+        product = ProductConfig.objects.create(name="Stool")
+        self.assertGreater(product.id, max(row[0] for row in catalogue[1]))
+
+    def test_load_rejects_non_empty_catalogue_and_malformed_files(self):
+        with open(self.path, "wb") as stream:
+            dump_snapshot(stream)
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.path)
+
+        self._clear()
+        with open(self.path, "rb") as stream:
+            data = stream.read()
+        for malformed in [b"", b"not a snapshot", data[:-3]]:
+            with open(self.path, "wb") as stream:
+                stream.write(malformed)
+            with self.assertRaises(SnapshotError):
+                load_snapshot(self.path)
+        self.assertFalse(Article.objects.exists())
+
+
+class ArticleUploadViewTestCase(TestCase):
+    def setUp(self):
+        _setup()
+
+    def test_upload_adds_stock_to_existing_articles(self):
+        initial_stock = dict(Article.objects.values_list("id", "stock"))
+        response = self.client.post(
+            reverse("inventory:upload-articles"), {"file": _inventory_file()}
+        )
+
+        self.assertEqual(response.status_code, 302)
+        for article in Article.objects.all():
+            self.assertEqual(article.stock, 2 * initial_stock[article.id])
+
+    @override_settings(INVENTORY_IMPORT_CHUNK_SIZE=2)
+    def test_upload_creates_new_articles_in_chunks(self):
+        inventory = {
+            "inventory": [
+                {"art_id": "5", "name": "drawer", "stock": "3"},
+                {"art_id": "1", "name": "leg", "stock": "1"},
+                {"art_id": "5", "name": "drawer", "stock": "4"},
+            ]
+        }
+        response = self.client.post(
+            reverse("inventory:upload-articles"),
+            {"file": _upload_file(inventory)},
+            HTTP_ACCEPT="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        chunks = response.json()["chunks"]
+        self.assertEqual([chunk["rows"] for chunk in chunks], [2, 1])
+        self.assertEqual(Article.objects.get(id="5").name, "drawer")
+        self.assertEqual(Article.objects.get(id="5").stock, 7)
+        self.assertEqual(Article.objects.get(id="1").stock, 13)
+
+    def test_iter_json_array_with_small_reads(self):
+        data = json.dumps({"other": [1, {"a": 2}], "inventory": [{"x": 1}, 12345]})
+        items = list(iter_json_array(io.BytesIO(data.encode()), "inventory", 3))
+        self.assertEqual(items, [{"x": 1}, 12345])
+
+
+class ProductConfigUploadViewTestCase(TestCase):
+    def setUp(self):
+        _setup()
+
+    def test_reupload_keeps_existing_lines(self):
+        line_ids = set(ProductArticle.objects.values_list("id", flat=True))
+        response = self.client.post(
+            reverse("inventory:upload-products-config"), {"file": _products_file()}
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ProductConfig.objects.count(), 2)
+        self.assertEqual(
+            set(ProductArticle.objects.values_list("id", flat=True)), line_ids
+        )
+
+    def test_upload_diffs_bom_lines(self):
+        products = {
+            "products": [
+                {
+                    "name": "Dining Chair",
+                    "contain_articles": [
+                        {"art_id": "1", "amount_of": "2"},
+                        {"art_id": "3", "amount_of": "1"},
+                        {"art_id": "4", "amount_of": "1"},
+                    ],
+                },
+                {
+                    "name": "Stool",
+                    "contain_articles": [{"art_id": "1", "amount_of": "3"}],
+                },
+            ]
+        }
+        response = self.client.post(
+            reverse("inventory:upload-products-config"),
+            {"file": _upload_file(products)},
+            HTTP_ACCEPT="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        chunk = response.json()["chunks"][0]
+        self.assertEqual(chunk["created"], 1)
+        self.assertEqual(chunk["lines_created"], 2)
+        self.assertEqual(chunk["lines_updated"], 1)
+        self.assertEqual(chunk["lines_deleted"], 1)
+        chair_bom = dict(
+            ProductArticle.objects.filter(product__name="Dining Chair").values_list(
+                "article_id", "quantity"
+            )
+        )
+        self.assertEqual(chair_bom, {"1": 2, "3": 1, "4": 1})
+
+    def test_reupload_deletes_bom_lines_in_constant_queries(self):
+        queries = {}
+        for size in (5, 50):
+            Article.objects.bulk_create(
+                Article(id=f"{size}-{index}", name="part", stock=10)
+                for index in range(size)
+            )
+            shelf = ProductConfig.objects.create(name=f"Shelf {size}")
+            ProductArticle.objects.bulk_create(
+                ProductArticle(product=shelf, article_id=f"{size}-{index}", quantity=1)
+                for index in range(size)
+            )
+            products = [
+                {
+                    "name": shelf.name,
+                    "contain_articles": [{"art_id": f"{size}-0", "amount_of": "2"}],
+                }
+            ]
+            with CaptureQueriesContext(connection) as context:
+                response = self._upload_products(products)
+            self.assertEqual(response.json()["chunks"][0]["lines_deleted"], size - 1)
+            self.assertEqual(
+                dict(
+                    ProductRequirement.objects.filter(product=shelf).values_list(
+                        "article_id", "quantity"
+                    )
+                ),
+                {f"{size}-0": 2},
+            )
+            queries[size] = len(context.captured_queries)
+
+        self.assertEqual(queries[5], queries[50])
+
+    def test_upload_reports_all_unknown_articles(self):
+        products = {
+            "products": [
+                {"name": "Lamp", "contain_articles": [{"art_id": "8", "amount_of": "1"}]},
+                {"name": "Shelf", "contain_articles": [{"art_id": "1", "amount_of": "1"}]},
+                {"name": "Sofa", "contain_articles": [{"art_id": "9", "amount_of": "1"}]},
+            ]
+        }
+        response = self.client.post(
+            reverse("inventory:upload-products-config"),
+            {"file": _upload_file(products)},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["unknown_articles"], {"Lamp": ["8"], "Sofa": ["9"]}
+        )
+        self.assertEqual(ProductConfig.objects.count(), 2)
+
+    def _upload_products(self, products):
+        return self.client.post(
+            reverse("inventory:upload-products-config"),
+            {"file": _upload_file({"products": products})},
+            HTTP_ACCEPT="application/json",
+        )
+
+    def test_upload_nested_boms(self):
+        # The drawer is defined after the dresser using it
+        dresser = {
+            "name": "Dresser",
+            "contain_articles": [{"art_id": "4", "amount_of": "1"}],
+            "contain_products": [{"name": "Drawer", "amount_of": "2"}],
+        }
+        drawer = {
+            "name": "Drawer",
+            "contain_articles": [{"art_id": "2", "amount_of": "2"}],
+        }
+        response = self._upload_products([dresser, drawer])
+        self.assertEqual(response.status_code, 200)
+
+        def requirements():
+            return dict(
+                ProductRequirement.objects.filter(
+                    product__name="Dresser"
+                ).values_list("article_id", "quantity")
+            )
+
+        self.assertEqual(requirements(), {"2": 4, "4": 1})
+        dresser_id = ProductConfig.objects.get(name="Dresser").id
+        self.assertEqual(ProductAvailability.objects.get(pk=dresser_id).stock, 1)
+
+        self.client.put(reverse("inventory:product-sell", args=[dresser_id]))
+        self.assertEqual(Article.objects.get(id="2").stock, 13)
+
+        # Changing the sub-assembly updates the products using it
+        drawer["contain_articles"] = [{"art_id": "2", "amount_of": "3"}]
+        self._upload_products([drawer])
+        self.assertEqual(requirements(), {"2": 6, "4": 1})
+
+    def test_upload_rejects_unknown_and_cyclic_sub_assemblies(self):
+        response = self._upload_products(
+            [{"name": "Bed", "contain_products": [{"name": "Frame", "amount_of": "1"}]}]
+        )
+        self.assertEqual(response.json(), {"unknown_products": {"Bed": ["Frame"]}})
+
+        response = self._upload_products(
+            [
+                {"name": "Bed", "contain_products": [{"name": "Frame", "amount_of": "1"}]},
+                {"name": "Frame", "contain_products": [{"name": "Bed", "amount_of": "1"}]},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            response.json()["cycle"],
+            [["Bed", "Frame", "Bed"], ["Frame", "Bed", "Frame"]],
+        )
+        self.assertEqual(ProductConfig.objects.count(), 2)
+
+    def test_upload_rejects_invalid_bom_lines(self):
+        for line in [
+            {"art_id": "1", "amount_of": "x"},
+            {"art_id": "1", "amount_of": "-1"},
+            {"amount_of": "1"},
+        ]:
+            response = self._upload_products(
+                [{"name": "Stool", "contain_articles": [line]}]
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("contain_articles", response.json()["errors"][0])
+        self.assertFalse(ProductConfig.objects.filter(name="Stool").exists())
+
+    def test_admin_rejects_cyclic_sub_assemblies(self):
+        chair = ProductConfig.objects.get(name="Dining Chair")
+        table = ProductConfig.objects.get(name="Dinning Table")
+        ProductComponent.objects.create(product=table, component=chair, quantity=1)
+        ComponentFormSet = inlineformset_factory(
+            ProductConfig,
+            ProductComponent,
+            formset=ProductComponentFormSet,
+            fk_name="product",
+            fields=["component", "quantity"],
+        )
+
+        def formset(*lines):
+            data = {
+                "components-TOTAL_FORMS": str(len(lines)),
+                "components-INITIAL_FORMS": "0",
+            }
+            for index, (component, quantity) in enumerate(lines):
+                data[f"components-{index}-component"] = str(component.id)
+                data[f"components-{index}-quantity"] = str(quantity)
+            return ComponentFormSet(data, instance=chair, prefix="components")
+
+        cyclic = formset((table, 1))
+        self.assertFalse(cyclic.is_valid())
+        self.assertEqual(
+            cyclic.non_form_errors(),
+            [
+                "A product can not contain itself: "
+                "Dining Chair -> Dinning Table -> Dining Chair"
+            ],
+        )
+        cushion = ProductConfig.objects.create(name="Cushion")
+        self.assertTrue(formset((cushion, 2)).is_valid())
+
+
+class ImportJobTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Jobs run within the request, worker threads would not see the test data
+        settings = override_settings(
+            INVENTORY_IMPORT_CHUNK_SIZE=2,
+            INVENTORY_IMPORT_JOBS={
+                "THRESHOLD": 0,
+                "WORKERS": 0,
+                "DIRECTORY": directory.name,
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.inventory = {
+            "inventory": [
+                {"art_id": "1", "name": "leg", "stock": "1"},
+                {"art_id": "2", "name": "screw", "stock": "2"},
+                {"art_id": "x", "name": "nail", "stock": "3"},
+                {"art_id": "5", "name": "drawer", "stock": "4"},
+            ]
+        }
+
+    def test_large_upload_is_imported_by_a_job(self):
+        response = self.client.post(
+            reverse("inventory:upload-articles"),
+            {"file": _upload_file(self.inventory)},
+        )
+
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(response["Location"]).json()
+        self.assertEqual(job["status"], ImportJob.SUCCEEDED)
+        self.assertEqual(job["progress"], 1.0)
+        self.assertEqual((job["rows_done"], job["chunks_done"]), (4, 2))
+        # The invalid row is reported and skipped, the others are imported
+        self.assertEqual(job["error_count"], 1)
+        self.assertEqual(job["errors"][0]["row"], 2)
+        self.assertIn("art_id", job["errors"][0]["errors"])
+        self.assertEqual(Article.objects.get(id="1").stock, 13)
+        self.assertEqual(Article.objects.get(id="5").stock, 4)
+        self.assertFalse(os.path.exists(ImportJob.objects.get().path))
+
+    def test_resumed_job_skips_committed_chunks(self):
+        job = create_job(ImportJob.ARTICLES, _upload_file(self.inventory))
+        # The process crashed after committing the first chunk
+        Article.objects.filter(id__in=["1", "2"]).update(stock=F("stock") + 1)
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.RUNNING, rows_done=2, chunks_done=1
+        )
+
+        (job,) = resume_jobs()
+
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual((job.rows_done, job.chunks_done), (4, 2))
+        self.assertEqual(Article.objects.get(id="1").stock, 13)
+        self.assertEqual(Article.objects.get(id="5").stock, 4)
+        self.assertEqual(resume_jobs(), [])
+
+    def test_products_job_skips_invalid_products(self):
+        products = {
+            "products": [
+                {
+                    "name": "Stool",
+                    "contain_articles": [{"art_id": "1", "amount_of": "3"}],
+                },
+                {
+                    "name": "Shelf",
+                    "contain_articles": [{"art_id": "99", "amount_of": "1"}],
+                },
+                {
+                    "name": "Bench",
+                    "contain_articles": [{"art_id": "1", "amount_of": "2"}],
+                    "contain_products": [{"name": "Ottoman", "amount_of": "1"}],
+                },
+                {
+                    "name": "Desk",
+                    "contain_articles": [{"art_id": "1", "amount_of": "x"}],
+                },
+                {
+                    "name": "Chest",
+                    "contain_articles": [{"art_id": "1", "amount_of": "-1"}],
+                },
+            ]
+        }
+        response = self.client.post(
+            reverse("inventory:upload-products-config"),
+            {"file": _upload_file(products)},
+        )
+
+        job = response.json()
+        self.assertEqual(job["status"], ImportJob.SUCCEEDED)
+        # Unknown sub-assemblies are only known, and reported, once all rows are read
+        errors = {error["row"]: error["errors"] for error in job["errors"]}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4])
+        self.assertEqual(job["error_count"], 4)
+        self.assertIn("amount_of", errors[3]["contain_articles"][0])
+        self.assertIn("amount_of", errors[4]["contain_articles"][0])
+        self.assertFalse(
+            ProductConfig.objects.filter(name__in=["Desk", "Chest"]).exists()
+        )
+        self.assertEqual(ProductAvailability.objects.get(product__name="Stool").stock, 4)
+        self.assertFalse(ProductConfig.objects.filter(name="Shelf").exists())
+        self.assertFalse(ProductComponent.objects.exists())
+
+    def test_failed_job_upload_can_be_retried(self):
+        for _ in range(2):
+            response = self.client.post(
+                reverse("inventory:upload-articles"),
+                {"file": SimpleUploadedFile("inventory.json", b'{"inventory": [')},
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()["status"], ImportJob.FAILED)
+
+        # The second upload queued a new job instead of replaying the failed one
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(ImportJob.objects.count(), 2)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse("inventory:import-job", args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SellCoalescingTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+        self.table = ProductConfig.objects.get(name="Dinning Table")
+
+    def test_batch_accepts_sales_in_arrival_order(self):
+        with CaptureQueriesContext(connection) as context:
+            outcomes = sell_batch(
+                [(self.chair.id, 1), (self.table.id, 1), (self.chair.id, 1), (999, 1)]
+            )
+        queries = len(context)
+
+        self.assertEqual(outcomes[:2], ["Dining Chair", "Dinning Table"])
+        # The first two sales left a single screw
+        self.assertIsInstance(outcomes[2], InsufficientStock)
+        self.assertEqual(outcomes[2].available, 0)
+        self.assertIsInstance(outcomes[3], ProductNotFound)
+        self.assertEqual(Article.objects.get(id="2").stock, 1)
+
+        # The query count does not depend on the number of sales
+        with CaptureQueriesContext(connection) as context:
+            sell_batch([(self.chair.id, 0)] * 20)
+        self.assertLessEqual(len(context), queries)
+
+    def test_coalescer_batches_queued_sales(self):
+        batches = []
+
+        def apply_batch(sales):
+            batches.append(sales)
+            return [product_id for product_id, _ in sales]
+
+        coalescer = SellCoalescer(max_wait_ms=100, apply_batch=apply_batch)
+        try:
+            futures = [coalescer.submit(product_id, 1) for product_id in (1, 2, 3)]
+            self.assertEqual([future.result(5) for future in futures], [1, 2, 3])
+        finally:
+            coalescer.stop()
+        self.assertEqual(batches, [[(1, 1), (2, 1), (3, 1)]])
+
+    def test_coalescer_backpressure(self):
+        coalescer = SellCoalescer(max_pending=1, timeout=0.01)
+        # Without a worker nothing drains the queue
+        coalescer.stop()
+
+        with self.assertRaises(SellTimeout):
+            coalescer.sell(self.chair.id, 1)
+        with self.assertRaises(SellQueueFull):
+            coalescer.submit(self.chair.id, 1)
+
+
+class AsyncViewTestCase(TestCase):
+    def setUp(self):
+        _setup()
+        registry.reset()
+        self.chair = ProductConfig.objects.get(name="Dining Chair")
+
+    async def test_async_product_list(self):
+        response = await AsyncClient().get(reverse("inventory:async-product-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["products"]), 2)
+
+    async def test_concurrent_sales_of_a_product_do_not_oversell(self):
+        # Two chairs are in stock, the sales are serialized on the product lock
+        url = reverse("inventory:async-product-sell", args=[self.chair.id])
+        client = AsyncClient()
+        responses = await asyncio.gather(
+            *(
+                client.put(url, data={"quantity": 1}, content_type="application/json")
+                for _ in range(3)
+            )
+        )
+
+        self.assertEqual(
+            sorted(response.status_code for response in responses), [200, 200, 400]
+        )
+
+    async def test_async_retry_replays_the_sale(self):
+        url = reverse("inventory:async-product-sell", args=[self.chair.id])
+        client = AsyncClient()
+        responses = [
+            await client.put(
+                url,
+                data={"quantity": 1},
+                content_type="application/json",
+                # The async client of Django 3.2 takes raw ASGI header names
+                **{"idempotency-key": "order-1"},
+            )
+            for _ in range(2)
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(responses[1]["Idempotent-Replayed"], "true")
+        # The screws were decremented once
+        stock = await sync_to_async(Article.objects.get)(id="2")
+        self.assertEqual(stock.stock, 9)
+
+    async def test_async_requests_are_recorded(self):
+        await AsyncClient().get(reverse("inventory:async-article-list"))
+
+        views = registry.snapshot()
+        self.assertGreater(
+            views["inventory:async-article-list"]["db_queries"]["sum"], 0
+        )
+
+
+class InMemoryWarehouseTestCase(SimpleTestCase):
+    def setUp(self):
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.assignment_dir = os.path.join(base_dir, "../assignment")
+        spec = importlib.util.spec_from_file_location(
+            "in_memory_warehouse",
+            os.path.join(
+                self.assignment_dir,
+                "warehouse_implemenation_if_data_stored_in_application_memory.py",
+            ),
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.warehouse = module.Warehouse(module.Inventory, module.Product)
+
+    def _quantities(self):
+        return {
+            product["name"]: product["quantity"]
+            for product in self.warehouse.get_product()
+        }
+
+    def test_listing(self):
+        self.assertEqual(self._quantities(), {"Dining Chair": 2, "Dinning Table": 1})
+        self.assertEqual(
+            self.warehouse.get_product("dining chair"),
+            {"name": "Dining Chair", "quantity": 2},
+        )
+
+    def test_sale_updates_products_sharing_articles(self):
+        self.assertIsNone(self.warehouse.sell_product("Dining Chair", 1))
+        # 8 legs and 9 screws are left, enough for one table or one chair
+        self.assertEqual(self._quantities(), {"Dining Chair": 1, "Dinning Table": 1})
+
+        # Without a quantity every unit in stock is sold
+        self.warehouse.sell_product("Dinning Table")
+        self.assertEqual(self._quantities(), {})
+
+    def test_sold_out_shared_article_hides_every_product(self):
+        # Selling more than is in stock sells both chairs, the 1 screw left is not
+        # enough for the table either
+        self.warehouse.sell_product("Dining Chair", 5)
+        self.assertEqual(self._quantities(), {})
+        self.assertIn("not present", self.warehouse.sell_product("Dinning Table", 1))
+        self.assertIn("not present", self.warehouse.sell_product("Dining Chair", 1))
+
+        self.warehouse.upload_inventory(
+            os.path.join(self.assignment_dir, "inventory.json")
+        )
+        self.assertEqual(self._quantities(), {"Dining Chair": 2, "Dinning Table": 2})
+
+
+def _upload_file(data):
+    return SimpleUploadedFile(
+        "upload.json", json.dumps(data).encode(), content_type="application/json"
+    )
+
+
+def _inventory_file():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base_dir, "../assignment/inventory.json")) as f:
+        return _upload_file(json.load(f))
+
+
+def _products_file():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base_dir, "../assignment/products.json")) as f:
+        return _upload_file(json.load(f))
+
 
 def _setup():
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -1,12 +1,20 @@
 from django.contrib import admin
 from django.urls import path
 
-from inventory.views import (ArticleListCreateView,
+from inventory.views import (ArticleImpactView, ArticleListCreateView,
                              ArticleRetrieveUpdateDestroyView,
-                             ArticleUploadView, ProductConfigListCreateView,
+                             ArticleStockView, ArticleUploadView,
+                             BuildPlanView, ConstrainedProductsView,
+                             ImportJobView, InventoryChangesView, MetricsView,
+                             OrderView, ProductCacheStatsView,
+                             ProductConfigListCreateView,
                              ProductConfigRetrieveUpdateDestroyView,
-                             ProductConfigUploadView, ProductSellView,
-                             ProductView)
+                             ProductConfigUploadView, ProductReserveView,
+                             ProductSellView, ProductView,
+                             ReservationCommitView, ReservationReleaseView,
+                             SiteAvailabilityView, SiteSellView,
+                             WarehouseStockView, async_article_list_view,
+                             async_product_sell_view, async_product_view)
 
 app_name = "inventory"
 
@@ -23,6 +31,8 @@ urlpatterns = [
         ProductConfigUploadView.as_view(),
         name="upload-products-config",
     ),
+    # Path to the progress of an upload imported in the background
+    path("import-jobs/<int:job_id>/", ImportJobView.as_view(), name="import-job"),
     # Path to list and create articles
     path("articles/", ArticleListCreateView.as_view(), name="article-list-create"),
     # Path to retrieve, update, and delete a specific article
@@ -31,6 +41,14 @@ urlpatterns = [
         ArticleRetrieveUpdateDestroyView.as_view(),
         name="article-retrieve-update-destroy",
     ),
+    # Path to the products affected by a change of the given articles
+    path("articles/impact/", ArticleImpactView.as_view(), name="article-impact"),
+    # Path to the current or point in time stock of an article from the ledger
+    path(
+        "articles/<str:article_id>/stock/",
+        ArticleStockView.as_view(),
+        name="article-stock",
+    ),
     # Path to list and create product configurations
     path(
         "products-config/",
@@ -53,4 +71,68 @@ urlpatterns = [
         ProductSellView.as_view(),
         name="product-sell",
     ),
+    # Path to hold units of a specific product for a checkout
+    path(
+        "products/<int:product_id>/reserve/",
+        ProductReserveView.as_view(),
+        name="product-reserve",
+    ),
+    # Paths to sell or give back the units held by a reservation
+    path(
+        "reservations/<int:reservation_id>/commit/",
+        ReservationCommitView.as_view(),
+        name="reservation-commit",
+    ),
+    path(
+        "reservations/<int:reservation_id>/release/",
+        ReservationReleaseView.as_view(),
+        name="reservation-release",
+    ),
+    # Path to sell a specific product from the warehouse stock
+    path(
+        "products/<int:product_id>/sell-from-sites/",
+        SiteSellView.as_view(),
+        name="product-site-sell",
+    ),
+    # Path to the units of products every warehouse can build
+    path("products/sites/", SiteAvailabilityView.as_view(), name="product-sites"),
+    # Path to book stock arriving at or leaving a warehouse
+    path(
+        "warehouses/<str:code>/stock/",
+        WarehouseStockView.as_view(),
+        name="warehouse-stock",
+    ),
+    # Path to the products that can be built the least
+    path(
+        "products/constrained/",
+        ConstrainedProductsView.as_view(),
+        name="product-constrained",
+    ),
+    # Path to the hit and miss counters of the product response cache
+    path(
+        "products/cache-stats/",
+        ProductCacheStatsView.as_view(),
+        name="product-cache-stats",
+    ),
+    # Path to sell a whole order of products at once
+    path("orders/", OrderView.as_view(), name="order"),
+    # Path to plan a joint build of products sharing articles
+    path("plan/", BuildPlanView.as_view(), name="build-plan"),
+    # Path to the articles and products changed since an inventory version
+    path("changes/", InventoryChangesView.as_view(), name="inventory-changes"),
+    # Path to the per-view request metrics
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    # Async variants of the hot endpoints, for ASGI deployments
+    path("async/articles/", async_article_list_view, name="async-article-list"),
+    path("async/products/", async_product_view, name="async-product-list"),
+    path(
+        "async/products/<int:product_id>/",
+        async_product_view,
+        name="async-product-details",
+    ),
+    path(
+        "async/products/<int:product_id>/sell/",
+        async_product_sell_view,
+        name="async-product-sell",
+    ),
 ]
@@ -1,6 +1,18 @@
-from .articles import (ArticleListCreateView, ArticleRetrieveUpdateDestroyView,
+from .articles import (ArticleImpactView, ArticleListCreateView,
+                       ArticleRetrieveUpdateDestroyView, ArticleStockView,
                        ArticleUploadView)
-from .products import ProductSellView, ProductView
+from .async_views import (async_article_list_view, async_product_sell_view,
+                          async_product_view)
+from .changes import InventoryChangesView
+from .jobs import ImportJobView
+from .metrics import MetricsView
+from .orders import OrderView
+from .planning import BuildPlanView
+from .products import (ConstrainedProductsView, ProductCacheStatsView,
+                       ProductSellView, ProductView)
 from .products_config import (ProductConfigListCreateView,
                               ProductConfigRetrieveUpdateDestroyView,
                               ProductConfigUploadView)
+from .reservations import (ProductReserveView, ReservationCommitView,
+                           ReservationReleaseView)
+from .sites import SiteAvailabilityView, SiteSellView, WarehouseStockView
@@ -1,24 +1,42 @@
 import os
 
+from django.db.models import Prefetch
+from django.http import (HttpResponseBadRequest, HttpResponseNotFound,
+                         JsonResponse)
 from django.shortcuts import redirect, render
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
 from django.views import View
 from rest_framework import generics
-
-from inventory.models import Article
-from inventory.serializers import ArticleSerializer, ArticleUploadSerializer
+from rest_framework.exceptions import ValidationError
+
+from inventory.idempotency import idempotent
+from inventory.imports import ArticleImporter
+from inventory.jobs import get_import_jobs_config
+from inventory.ledger import current_stock, stock_at
+from inventory.models import (Article, ImportJob, ProductAvailability,
+                              ProductRequirement)
+from inventory.pagination import (PrimaryKeyCursorPagination, int_param,
+                                  prefix_range)
+from inventory.serializers import ArticleSerializer, ProductImpactSerializer
+from inventory.views.jobs import queue_upload
+from inventory.views.utils import inventory_condition, wants_json
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-from rest_framework.parsers import JSONParser
-
 from inventory.logger import setup_logger
 
 # Setup logging
 logger = setup_logger(__name__, " articles ")
 
 
+@method_decorator(idempotent(dedupe_uploads=True), name="post")
 class ArticleUploadView(View):
     """
     A view to upload articles from a JSON file.
+
+    A file which was already imported, or a retry with the same ``Idempotency-Key``
+    header, gets the stored response instead of adding the stock again.
     """
 
     def get(self, request):
@@ -36,38 +54,51 @@ class ArticleUploadView(View):
         Handles POST requests to upload articles from a JSON file.
 
         The request body should contain a 'file' field indicating the JSON file to upload.
+        The file is parsed incrementally and applied in chunks, see ``ArticleImporter``.
+        Files larger than the configured threshold are stored and imported in the
+        background, see ``inventory.jobs``.
 
         :param request: The incoming HTTP request object.
-        :return: A redirect to the admin index page.
+        :return: A redirect to the admin index page, or the per-chunk import stats
+            as JSON if the client accepts application/json. A 202 response with the
+            import job for background uploads.
         """
         file = request.FILES["file"]
-        data = JSONParser().parse(file)
-
-        serializer = ArticleUploadSerializer(data=data.get("inventory", []), many=True)
-        serializer.is_valid(raise_exception=True)
-
-        for article_data in serializer.validated_data:
-            article_obj, created = Article.objects.get_or_create(
-                id=article_data["art_id"]
-            )
-
-            if not created:
-                article_obj.stock += article_data["stock"]
-            else:
-                article_obj.name = article_data["name"]
-                article_obj.stock = article_data["stock"]
-            article_obj.save()
+        if file.size > get_import_jobs_config()["THRESHOLD"]:
+            return queue_upload(ImportJob.ARTICLES, file)
+        stats = ArticleImporter().run(file)
 
+        if wants_json(request):
+            return JsonResponse({"chunks": stats})
         return redirect("admin:index")
 
 
+@method_decorator(inventory_condition, name="get")
 class ArticleListCreateView(generics.ListCreateAPIView):
     """
     A view to list and create articles.
+
+    The listing is paginated by article id and can be filtered by a name prefix
+    (``?name=``) and a stock range (``?stock_min=`` and ``?stock_max=``). Its ETag is
+    the inventory version.
     """
 
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
+    pagination_class = PrimaryKeyCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        name = self.request.query_params.get("name")
+        if name:
+            queryset = queryset.filter(**prefix_range("name", name))
+        stock_min = int_param(self.request, "stock_min")
+        if stock_min is not None:
+            queryset = queryset.filter(stock__gte=stock_min)
+        stock_max = int_param(self.request, "stock_max")
+        if stock_max is not None:
+            queryset = queryset.filter(stock__lte=stock_max)
+        return queryset
 
 class ArticleRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     """
@@ -77,3 +108,77 @@ class ArticleRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
 
+
+
+class ArticleStockView(View):
+    """
+    A view to look up the stock of an article in the stock movement ledger.
+    """
+
+    def get(self, request, article_id):
+        """
+        Returns the current stock of an article, or its stock at the time given by
+        the 'at' query parameter (an ISO 8601 datetime).
+
+        :param request: The incoming HTTP request object.
+        :param article_id: The id of the article.
+        :return: A JSON response object containing the stock of the article.
+        """
+        if not Article.objects.filter(id=article_id).exists():
+            return HttpResponseNotFound()
+
+        at = request.GET.get("at")
+        if not at:
+            stock = current_stock([article_id])[article_id]
+            return JsonResponse({"id": article_id, "stock": stock})
+
+        try:
+            at = parse_datetime(at)
+        except ValueError:
+            at = None
+        if at is None:
+            return HttpResponseBadRequest("Please pass 'at' as an ISO 8601 datetime.")
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        stock = stock_at([article_id], at)[article_id]
+        return JsonResponse({"id": article_id, "at": at.isoformat(), "stock": stock})
+
+
+class ArticleImpactView(generics.ListAPIView):
+    """
+    A view to list the products affected by a change of one or more articles.
+
+    The articles are passed as comma separated ids (``?ids=1,2``). Every dependent
+    product is listed once with its buildable stock, its bottleneck article and the
+    quantities of the requested articles it needs (including its sub-assemblies),
+    paginated by product id.
+    """
+
+    serializer_class = ProductImpactSerializer
+    pagination_class = PrimaryKeyCursorPagination
+
+    def get_queryset(self):
+        article_ids = [
+            article_id
+            for article_id in self.request.query_params.get("ids", "").split(",")
+            if article_id
+        ]
+        if not article_ids:
+            raise ValidationError({"ids": "Please pass one or more article ids."})
+
+        # Both lookups are served by the (article, product, quantity) index
+        lines = ProductRequirement.objects.filter(article_id__in=article_ids)
+        return (
+            ProductAvailability.objects.filter(
+                product_id__in=lines.values("product_id")
+            )
+            .select_related("product")
+            .only("stock", "bottleneck_article_id", "product__name")
+            .prefetch_related(
+                Prefetch(
+                    "product__requirements",
+                    queryset=lines.only("product_id", "article_id", "quantity"),
+                    to_attr="impacted_lines",
+                )
+            )
+        )
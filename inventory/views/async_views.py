@@ -0,0 +1,81 @@
+import asyncio
+from weakref import WeakValueDictionary
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed
+
+from inventory.idempotency import idempotent
+from inventory.views.articles import ArticleListCreateView
+from inventory.views.products import product_stock_response, sell_response
+
+# Django 3.2 has no async ORM, so the views below await the sync code in the
+# ``sync_to_async`` thread. Under ASGI the event loop keeps accepting requests
+# while one of them waits on the database, but the thread sensitive default runs
+# the database work of all requests one at a time in that single thread.
+
+# One lock per product being sold, dropped once no sale of the product is pending
+_sell_locks = WeakValueDictionary()
+
+article_list_view = ArticleListCreateView.as_view()
+
+
+def _sell_lock(product_id):
+    lock = _sell_locks.get(product_id)
+    if lock is None:
+        lock = _sell_locks[product_id] = asyncio.Lock()
+    return lock
+
+
+@idempotent
+def _sell(request, product_id):
+    # The stored response is claimed and written in the sync thread with the sale
+    return sell_response(product_id, request.body)
+
+
+def _render_article_list(request):
+    # Render in the sync thread as well, the serializers may hit the database
+    return article_list_view(request).render()
+
+
+async def async_product_view(request, product_id=None):
+    """
+    Async variant of ``ProductView``.
+
+    :param request: The incoming HTTP request object.
+    :param product_id: The id of the product to retrieve.
+    :return: A JSON response object containing product data.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    return await sync_to_async(product_stock_response)(product_id)
+
+
+async def async_product_sell_view(request, product_id):
+    """
+    Async variant of ``ProductSellView``.
+
+    Sales of the same product are serialized on a per-product lock, so concurrent
+    requests for a popular product queue up in the event loop instead of contending
+    for the row locks of its articles in the database. Retries sent with the same
+    ``Idempotency-Key`` header get the stored response, like ``ProductSellView``.
+
+    :param request: The incoming HTTP request object.
+    :param product_id: The id of the product to sell.
+    :return: An HTTP response indicating the success or failure of the sale.
+    """
+    if request.method != "PUT":
+        return HttpResponseNotAllowed(["PUT"])
+    async with _sell_lock(product_id):
+        return await sync_to_async(_sell)(request, product_id)
+
+
+async def async_article_list_view(request):
+    """
+    Async variant of the article listing of ``ArticleListCreateView``.
+
+    :param request: The incoming HTTP request object.
+    :return: A page of articles, see ``ArticleListCreateView``.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    return await sync_to_async(_render_article_list)(request)
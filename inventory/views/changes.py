@@ -0,0 +1,41 @@
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views import View
+
+from inventory.changes import (DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT,
+                               ChangesExpired, changes_since)
+from inventory.metrics import track
+
+
+class InventoryChangesView(View):
+    """
+    A view to list the articles and products changed since an inventory version.
+    """
+
+    def get(self, request):
+        """
+        Returns the changes after the version given by the 'since' query parameter.
+
+        Clients fetch a listing first and use its ETag as the version to start from,
+        then poll with the returned 'version' until 'more' is false. At most 'limit'
+        changes (1000 by default, at most 10000) are read per request.
+
+        :param request: The incoming HTTP request object.
+        :return: A JSON response with the version reached, the current state of the
+            changed articles and products and the removed ones, or a 410 response if
+            the changes were already pruned.
+        """
+        try:
+            since = int(request.GET.get("since", 0))
+            limit = int(request.GET.get("limit", DEFAULT_CHANGES_LIMIT))
+        except ValueError:
+            return HttpResponseBadRequest(
+                "Please pass 'since' and 'limit' as integers."
+            )
+        limit = max(min(limit, MAX_CHANGES_LIMIT), 1)
+
+        try:
+            changes = changes_since(since, limit)
+        except ChangesExpired as e:
+            return JsonResponse({"detail": str(e), "oldest": e.oldest}, status=410)
+        with track("serialization"):
+            return JsonResponse(changes)
@@ -0,0 +1,66 @@
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views import View
+
+from inventory.jobs import create_job, submit_job
+from inventory.models import ImportJob
+
+
+def job_response(job, status=200):
+    """
+    Builds the JSON response describing an import job and its progress.
+
+    :param job: The import job.
+    :param status: The status code of the response.
+    :return: A JSON response object.
+    """
+    response = JsonResponse(
+        {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "progress": round(job.position / job.size, 4) if job.size else 1.0,
+            "rows_done": job.rows_done,
+            "chunks_done": job.chunks_done,
+            "error_count": job.error_count,
+            "errors": job.errors,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        },
+        status=status,
+    )
+    response["Location"] = reverse("inventory:import-job", args=[job.id])
+    return response
+
+
+def queue_upload(kind, file):
+    """
+    Stores an uploaded file and queues its import.
+
+    :return: A 202 JSON response with the job, polled through its Location header.
+    """
+    return job_response(submit_job(create_job(kind, file)), status=202)
+
+
+class ImportJobView(View):
+    """
+    A view to poll the progress of a background upload.
+    """
+
+    def get(self, request, job_id):
+        """
+        Returns the status of an import job, the rows imported so far and the invalid
+        rows which were skipped.
+
+        :param request: The incoming HTTP request object.
+        :param job_id: The id of the import job.
+        :return: A JSON response object containing the job, or a 404 response.
+        """
+        job = ImportJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return JsonResponse(
+                {"error": f"Import job {job_id} does not exist."}, status=404
+            )
+        return job_response(job)
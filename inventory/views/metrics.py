@@ -0,0 +1,20 @@
+from django.http import JsonResponse
+from django.views import View
+
+from inventory.metrics import registry
+
+
+class MetricsView(View):
+    """
+    A view to expose the per-view request metrics of this process.
+    """
+
+    def get(self, request):
+        """
+        Returns the wall time, DB time, DB query count and section histograms of
+        every view handled by this process since it started.
+
+        :param request: The incoming HTTP request object.
+        :return: A JSON response object containing the histograms per view name.
+        """
+        return JsonResponse({"views": registry.snapshot()})
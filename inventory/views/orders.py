@@ -0,0 +1,47 @@
+import json
+
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from inventory.idempotency import idempotent
+from inventory.logger import setup_logger
+from inventory.metrics import track
+from inventory.selling import InvalidOrder, sell_order
+
+# Setup logging
+logger = setup_logger(__name__)
+
+
+@method_decorator(idempotent, name="post")
+class OrderView(View):
+    """
+    A view to sell a whole basket of products at once.
+
+    Retries sent with the same ``Idempotency-Key`` header get the stored response.
+    """
+
+    def post(self, request):
+        """
+        Handles POST requests to sell all lines of an order atomically.
+
+        The request body should contain a 'lines' list, every line holding a
+        'product_id' and an optional 'quantity' (1 by default). Either every line
+        is sold or none of them.
+
+        :param request: The incoming HTTP request object.
+        :return: A JSON response with the result of every line, 200 if the order was
+            sold and 409 if any line could not be fulfilled.
+        """
+        try:
+            lines = json.loads(request.body).get("lines") if request.body else None
+            sold, results = sell_order(lines)
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest("Please send the order as a JSON object.")
+        except InvalidOrder as e:
+            return JsonResponse({"errors": e.errors}, status=400)
+
+        with track("serialization"):
+            return JsonResponse(
+                {"sold": sold, "lines": results}, status=200 if sold else 409
+            )
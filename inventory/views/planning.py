@@ -0,0 +1,37 @@
+import json
+
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views import View
+
+from inventory.metrics import track
+from inventory.planning import InvalidPlan, plan_builds
+
+
+class BuildPlanView(View):
+    """
+    A view to plan how many units of several products to build from the shared stock.
+    """
+
+    def post(self, request):
+        """
+        Handles POST requests to compute a joint build plan.
+
+        The request body should contain either 'weights', an object mapping product
+        ids to the ratio to build them in, or 'demand', an object mapping product ids
+        to the number of units wanted. The plan is computed from the current stock,
+        nothing is reserved or sold.
+
+        :param request: The incoming HTTP request object.
+        :return: A JSON response with the units to build per product and the stock
+            left over, see ``plan_builds``.
+        """
+        try:
+            body = json.loads(request.body) if request.body else {}
+            plan = plan_builds(body.get("weights"), body.get("demand"))
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest("Please send the mix as a JSON object.")
+        except InvalidPlan as e:
+            return JsonResponse({"errors": e.errors}, status=400)
+
+        with track("serialization"):
+            return JsonResponse(plan)
@@ -1,14 +1,21 @@
 import json
 import os
 
-from django.db import models
-from django.db.models import ExpressionWrapper, F, Min
+from django.db.models import F
 from django.http import (HttpResponse, HttpResponseBadRequest,
                          HttpResponseNotAllowed, HttpResponseNotFound,
                          JsonResponse)
+from django.utils.decorators import method_decorator
 from django.views import View
 
-from inventory.models import Article, ProductArticle
+from inventory.cache import get_product_cache
+from inventory.coalescing import SellQueueFull, SellTimeout, get_sell_coalescer
+from inventory.idempotency import idempotent
+from inventory.metrics import track
+from inventory.models import ProductAvailability
+from inventory.selling import (DEFAULT_QUANTITY_TO_SELL, InsufficientStock,
+                               InvalidQuantity, ProductNotFound, sell_product)
+from inventory.views.utils import inventory_condition
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -18,9 +25,73 @@ from inventory.logger import setup_logger
 logger = setup_logger(__name__, " products ")
 
 
+def product_stock_response(product_id=None):
+    """
+    Builds the JSON response of the products listing, or of one product.
+
+    Shared by the sync and the async product views.
+
+    :param product_id: The id of the product to retrieve, None for all products.
+    :return: A JSON response object containing product data, or a 404 response.
+    """
+    # Serve the serialized response from the cache if nothing changed since
+    cache = get_product_cache()
+    content = cache.get(product_id) if cache else None
+    if content is not None:
+        return HttpResponse(content, content_type="application/json")
+
+    try:
+        # Read the materialized stock levels, see inventory.availability
+        data = ProductAvailability.objects.order_by("product_id").values(
+            "product_id",
+            "product__name",
+            "stock",
+            "available",
+            "bottleneck_article_id",
+            "second_headroom",
+        )
+
+        # Filter the data based on the specified product_id, if present
+        if product_id:
+            data = data.filter(product_id=product_id)
+        data = list(data)
+
+        # If no data exists after filtering, return a 404 response
+        if not data:
+            return HttpResponseNotFound()
+
+        with track("serialization"):
+            # Convert the query results to the desired response format
+            context = {
+                "products": [
+                    {
+                        "id": d["product_id"],
+                        "name": d["product__name"],
+                        "stock": d["stock"],
+                        "available": d["available"],
+                        "bottleneck_article": d["bottleneck_article_id"],
+                        "second_headroom": d["second_headroom"],
+                    }
+                    for d in data
+                ]
+            }
+
+            # Return the response as a JSON object
+            response = JsonResponse(context)
+        if cache:
+            cache.set(product_id, response.content)
+        return response
+    except ValueError:
+        # Return a 400 response for invalid requests
+        return HttpResponseBadRequest()
+
+
+@method_decorator(inventory_condition, name="get")
 class ProductView(View):
     """
     A view to handle product related requests.
+
+    Its ETag is the inventory version, unchanged polls get a 304 response.
     """
 
     def get(self, request, product_id=None):
@@ -33,52 +104,118 @@ class ProductView(View):
         :param product_id: The id of the product to retrieve.
         :return: A JSON response object containing product data.
         """
-        try:
-            # Query the database to get the product name and the minimum stock level of all the articles
-            data = (
-                ProductArticle.objects.values("product_id", "product__name")
-                .annotate(
-                    product_stock=ExpressionWrapper(
-                        Min(F("article__stock") / F("quantity")),
-                        output_field=models.IntegerField(),
-                    )
-                )
-                .values("product_id", "product__name", "product_stock")
-            )
+        return product_stock_response(product_id)
 
-            # Filter the data based on the specified product_id, if present
-            if product_id:
-                data = data.filter(product_id=product_id)
 
-            # If no data exists after filtering, return a 404 response
-            if not data.exists():
-                return HttpResponseNotFound()
+class ConstrainedProductsView(View):
+    """
+    A view to list the products that can be built the least, for replenishment.
+    """
 
-            # Convert the query results to the desired response format
-            context = {
-                "products": [
-                    {
-                        "id": d["product_id"],
-                        "name": d["product__name"],
-                        "stock": d["product_stock"],
-                    }
-                    for d in data
-                ]
-            }
+    default_limit = 100
+    max_limit = 1000
 
-            # Return the response as a JSON object
-            return JsonResponse(context)
+    def get(self, request):
+        """
+        Returns the products with the lowest stock, tightest first.
+
+        Ties are broken by the headroom of the second tightest article, so products
+        held back by more than one article come first. The number of products is
+        set by the 'limit' query parameter (100 by default, at most 1000).
+
+        :param request: The incoming HTTP request object.
+        :return: A JSON response object containing product data.
+        """
+        try:
+            limit = int(request.GET.get("limit", self.default_limit))
         except ValueError:
-            # Return a 400 response for invalid requests
-            return HttpResponseBadRequest()
+            return HttpResponseBadRequest("Please pass 'limit' as an integer.")
+        limit = max(min(limit, self.max_limit), 0)
+
+        data = ProductAvailability.objects.order_by(
+            "stock", F("second_headroom").asc(nulls_last=True), "product_id"
+        ).values(
+            "product_id",
+            "product__name",
+            "stock",
+            "available",
+            "bottleneck_article_id",
+            "second_headroom",
+        )[:limit]
+        with track("serialization"):
+            return JsonResponse(
+                {
+                    "products": [
+                        {
+                            "id": d["product_id"],
+                            "name": d["product__name"],
+                            "stock": d["stock"],
+                            "available": d["available"],
+                            "bottleneck_article": d["bottleneck_article_id"],
+                            "second_headroom": d["second_headroom"],
+                        }
+                        for d in data
+                    ]
+                }
+            )
 
 
-DEFAULT_QUANTITY_TO_SELL = 1
+class ProductCacheStatsView(View):
+    """
+    A view to expose the hit and miss counters of the product response cache.
+    """
+
+    def get(self, request):
+        cache = get_product_cache()
+        stats = cache.stats() if cache else {}
+        return JsonResponse({"enabled": cache is not None, **stats})
 
 
+def sell_response(product_id, body):
+    """
+    Sells a product and builds the response of the sell endpoints.
+
+    The body may contain a 'quantity' field indicating the number of products to sell.
+    All articles of the product are decremented atomically, see ``sell_product``. If
+    sell coalescing is enabled the sale is applied in a batch with concurrent sales,
+    see ``inventory.coalescing``.
+
+    :param product_id: The id of the product to sell.
+    :param body: The raw request body.
+    :return: An HTTP response indicating the success or failure of the sale.
+    """
+    try:
+        given_quantity = (json.loads(body).get("quantity", DEFAULT_QUANTITY_TO_SELL) if body else DEFAULT_QUANTITY_TO_SELL)
+
+        coalescer = get_sell_coalescer()
+        sell = coalescer.sell if coalescer else sell_product
+        product_name = sell(product_id, given_quantity)
+
+        # Return a success response
+        return HttpResponse(f"Product {product_name} with quantity {given_quantity} sold successfully.")
+    except InvalidQuantity:
+        return HttpResponseBadRequest(f"Please enter the quantity for product ID {product_id} as a whole, non-negative number.")
+    except ProductNotFound:
+        return HttpResponse(f"We're sorry, but we couldn't find a product in our inventory with the ID {product_id}.")
+    except InsufficientStock as e:
+        return HttpResponseBadRequest(f"Please enter a valid quantity for product ID {product_id}. We currently have {e.available} units in stock.")
+    except (SellQueueFull, SellTimeout):
+        # Ask the client to back off until the queued sales are applied
+        response = HttpResponse("We're receiving too many orders right now, please try again shortly.", status=503)
+        response["Retry-After"] = "1"
+        return response
+    except Exception as e:
+        # Return a 405 response for other errors
+        return HttpResponseNotAllowed("Method not allowed.")
+
+
+@method_decorator(idempotent, name="put")
 class ProductSellView(View):
     """
     A view to handle product sales.
+
+    Retries sent with the same ``Idempotency-Key`` header get the stored response
+    and do not sell again, see ``inventory.idempotency``.
     """
 
     def put(self, request, product_id):
@@ -91,41 +228,4 @@ class ProductSellView(View):
         :param product_id: The id of the product to sell.
         :return: An HTTP response indicating the success or failure of the sale.
         """
-        try:
-            product_article_entries = (
-                ProductArticle.objects.filter(product_id=product_id).values("article_id", "quantity", "product__name")
-                .annotate(
-                    possible_product_stock=ExpressionWrapper(
-                        (F("article__stock") / F("quantity")),
-                        output_field=models.IntegerField(),
-                    )
-                )
-                .values("article_id", "quantity", "product__name", "possible_product_stock")
-            )
-
-            if not product_article_entries:
-                return HttpResponse(f"We're sorry, but we couldn't find a product in our inventory with the ID {product_id}.")
-
-            product_stock = product_article_entries.aggregate(min_possible_product_stock=Min("possible_product_stock"))["min_possible_product_stock"]
-
-            given_quantity = (json.loads(request.body).get("quantity", DEFAULT_QUANTITY_TO_SELL) if request.body else DEFAULT_QUANTITY_TO_SELL)
-
-            if given_quantity > product_stock  or given_quantity < 0:
-                return HttpResponseBadRequest(f"Please enter a valid quantity for product ID {product_id}. We currently have {product_stock} units in stock.")
-
-
-            # For each article, update its stock level based on the quantity sold
-            for entry in product_article_entries:
-                article_id = entry["article_id"]
-                article = Article.objects.get(id=article_id)
-                article.stock -= given_quantity * entry["quantity"]
-                article.save()
-
-            # Return a success response
-            return HttpResponse(f"Product {product_article_entries[0]['product__name']} with quantity {given_quantity} sold successfully.")
-        except (ProductArticle.DoesNotExist, Article.DoesNotExist):
-            # Return a 404 response for invalid product or article ids
-            return HttpResponseNotFound("Invalid product id or article id.")
-        except Exception as e:
-            # Return a 405 response for other errors
-            return HttpResponseNotAllowed("Method not allowed.")
+        return sell_response(product_id, request.body)
@@ -1,13 +1,23 @@
 import os
 
+from django.db.models import Prefetch
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.utils.decorators import method_decorator
 from django.views import View
 from rest_framework import generics
-from rest_framework.parsers import JSONParser
-
-from inventory.models import Article, ProductConfig
-from inventory.serializers import (ProductConfigUploadSerializer,
-                                   ProductSerializer)
+from rest_framework.exceptions import ValidationError
+
+from inventory.bom import BOMCycleError
+from inventory.idempotency import idempotent
+from inventory.imports import (ProductConfigImporter, UnknownArticlesError,
+                               UnknownProductsError)
+from inventory.jobs import get_import_jobs_config
+from inventory.models import Article, ImportJob, ProductArticle, ProductConfig
+from inventory.pagination import PrimaryKeyCursorPagination, prefix_range
+from inventory.serializers import ProductSerializer
+from inventory.views.jobs import queue_upload
+from inventory.views.utils import inventory_condition, wants_json
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -17,9 +27,13 @@ from inventory.logger import setup_logger
 logger = setup_logger(__name__, "products config")
 
 
+@method_decorator(idempotent(dedupe_uploads=True), name="post")
 class ProductConfigUploadView(View):
     """
     A view to upload a JSON file containing products configuration data.
+
+    A file which was already imported, or a retry with the same ``Idempotency-Key``
+    header, gets the stored response.
     """
 
     def get(self, request):
@@ -42,42 +56,68 @@ class ProductConfigUploadView(View):
         """
         Handles POST requests to upload the JSON file and update the database.
 
+        The stored BOMs are diffed against the uploaded ones and updated in bulk, see
+        ``ProductConfigImporter``. If any BOM references unknown articles nothing is
+        imported and all unknown article ids are returned at once. The same goes for
+        unknown sub-assemblies and products containing themselves, and for invalid
+        rows, e.g. BOM lines without an id or with an amount below 1.
+
+        Files larger than the configured threshold are stored and imported in the
+        background instead, skipping and reporting the invalid products.
+
         :param request: The incoming HTTP request object.
-        :return: A redirect to the admin index page.
+        :return: A redirect to the admin index page, or the per-chunk import stats
+            as JSON if the client accepts application/json. A 202 response with the
+            import job for background uploads.
         """
         file = request.FILES["file"]
-        data = JSONParser().parse(file)
-
-        serializer = ProductConfigUploadSerializer(
-            data=data.get("products", []), many=True
-        )
-        serializer.is_valid(raise_exception=True)
-
-        for product_data in serializer.validated_data:
-            product_config_obj, _ = ProductConfig.objects.get_or_create(
-                name=product_data["name"]
-            )
-            product_config_obj.articles.clear()
-
-            for article_data in product_data["contain_articles"]:
-                article = Article.objects.get(id=article_data["art_id"])
-                quantity = int(article_data["amount_of"])
-                product_config_obj.articles.add(
-                    article, through_defaults={"quantity": quantity}
-                )
-
-            product_config_obj.save()
-
+        if file.size > get_import_jobs_config()["THRESHOLD"]:
+            return queue_upload(ImportJob.PRODUCTS, file)
+        try:
+            stats = ProductConfigImporter().run(file)
+        except ValidationError as e:
+            return JsonResponse({"errors": e.detail}, status=400)
+        except UnknownArticlesError as e:
+            return JsonResponse({"unknown_articles": e.unknown_articles}, status=400)
+        except UnknownProductsError as e:
+            return JsonResponse({"unknown_products": e.unknown_products}, status=400)
+        except BOMCycleError as e:
+            return JsonResponse({"cycle": e.cycle}, status=400)
+
+        if wants_json(request):
+            return JsonResponse({"chunks": stats})
         return redirect("admin:index")
 
 
+@method_decorator(inventory_condition, name="get")
 class ProductConfigListCreateView(generics.ListCreateAPIView):
     """
     A view to list and create product configurations.
+
+    The listing is paginated by product id and can be filtered by a name prefix
+    (``?name=``) and by an article the products contain (``?article=``). Its ETag
+    is the inventory version.
     """
 
-    queryset = ProductConfig.objects.all()
+    queryset = ProductConfig.objects.only("id", "name").prefetch_related(
+        Prefetch("articles", queryset=Article.objects.only("id", "name"))
+    )
     serializer_class = ProductSerializer
+    pagination_class = PrimaryKeyCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        name = self.request.query_params.get("name")
+        if name:
+            queryset = queryset.filter(**prefix_range("name", name))
+        article_id = self.request.query_params.get("article")
+        if article_id:
+            queryset = queryset.filter(
+                id__in=ProductArticle.objects.filter(article_id=article_id).values(
+                    "product_id"
+                )
+            )
+        return queryset
 
 
 class ProductConfigRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
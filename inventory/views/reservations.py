@@ -0,0 +1,115 @@
+import json
+
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from inventory.idempotency import idempotent
+from inventory.metrics import track
+from inventory.reservations import (ReservationClosed, ReservationNotFound,
+                                    commit_reservation, release_reservation,
+                                    reserve_product)
+from inventory.selling import (DEFAULT_QUANTITY_TO_SELL, InsufficientStock,
+                               ProductNotFound)
+
+
+def reservation_response(reservation, status=200):
+    with track("serialization"):
+        return JsonResponse(
+            {
+                "id": reservation.id,
+                "product_id": reservation.product_id,
+                "quantity": reservation.quantity,
+                "status": reservation.status,
+                "expires_at": reservation.expires_at,
+            },
+            status=status,
+        )
+
+
+def _positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+@method_decorator(idempotent, name="post")
+class ProductReserveView(View):
+    """
+    A view to hold units of a product for a checkout.
+
+    Retries sent with the same ``Idempotency-Key`` header get the stored reservation.
+    """
+
+    def post(self, request, product_id):
+        """
+        Handles POST requests to reserve a product.
+
+        The request body may contain a 'quantity' (1 by default) and a 'ttl', the
+        seconds until the reservation expires (the configured TTL by default, capped
+        at the configured maximum). The held units can not be sold by anyone else
+        until the reservation is committed, released or expires.
+
+        :param request: The incoming HTTP request object.
+        :param product_id: The id of the product to reserve.
+        :return: A JSON response with the reservation and status 201, 400 if the
+            stock is insufficient and 404 if the product does not exist.
+        """
+        try:
+            body = json.loads(request.body) if request.body else {}
+            quantity = body.get("quantity", DEFAULT_QUANTITY_TO_SELL)
+            ttl = body.get("ttl")
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest(
+                "Please send the reservation as a JSON object."
+            )
+        if not _positive_int(quantity) or not (ttl is None or _positive_int(ttl)):
+            return HttpResponseBadRequest(
+                "Please pass 'quantity' and 'ttl' as positive integers."
+            )
+
+        try:
+            reservation = reserve_product(product_id, quantity, ttl)
+        except ProductNotFound:
+            return JsonResponse(
+                {"error": f"Product {product_id} does not exist."}, status=404
+            )
+        except InsufficientStock as e:
+            return JsonResponse({"error": str(e), "available": e.available}, status=400)
+        return reservation_response(reservation, status=201)
+
+
+class ReservationActionView(View):
+    """
+    A view to close a reservation, ``action`` commits or releases it.
+    """
+
+    action = None
+
+    def post(self, request, reservation_id):
+        """
+        Handles POST requests to commit or release a reservation.
+
+        Committing sells the held units, releasing gives them back. Expired
+        reservations can not be committed any more.
+
+        :param request: The incoming HTTP request object.
+        :param reservation_id: The id of the reservation.
+        :return: A JSON response with the reservation, 404 if it does not exist and
+            409 if it is already closed or expired.
+        """
+        try:
+            reservation = self.action(reservation_id)
+        except ReservationNotFound as e:
+            return JsonResponse({"error": str(e)}, status=404)
+        except ReservationClosed as e:
+            return JsonResponse({"error": str(e), "status": e.status}, status=409)
+        except InsufficientStock as e:
+            return JsonResponse({"error": str(e), "available": e.available}, status=409)
+        return reservation_response(reservation)
+
+
+class ReservationCommitView(ReservationActionView):
+    action = staticmethod(commit_reservation)
+
+
+class ReservationReleaseView(ReservationActionView):
+    action = staticmethod(release_reservation)
@@ -0,0 +1,143 @@
+import json
+
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from inventory.idempotency import idempotent
+from inventory.metrics import track
+from inventory.selling import (DEFAULT_QUANTITY_TO_SELL, InsufficientStock,
+                               ProductNotFound)
+from inventory.sites import (InvalidStockChange, WarehouseNotFound,
+                             receive_stock, sell_from_sites, site_availability)
+
+
+class SiteAvailabilityView(View):
+    """
+    A view to list how many units of products every warehouse can build.
+    """
+
+    max_ids = 1000
+
+    def get(self, request):
+        """
+        Returns the units every warehouse can build from its own stock for the
+        products passed as comma separated ids (``?ids=1,2``, at most 1000), plus
+        their total over all sites.
+
+        :param request: The incoming HTTP request object.
+        :return: A JSON response object containing the availability per product.
+        """
+        try:
+            product_ids = [
+                int(product_id)
+                for product_id in request.GET.get("ids", "").split(",")
+                if product_id
+            ]
+        except ValueError:
+            return HttpResponseBadRequest("Please pass 'ids' as comma separated ids.")
+        if not product_ids or len(product_ids) > self.max_ids:
+            return HttpResponseBadRequest(
+                f"Please pass between 1 and {self.max_ids} product ids."
+            )
+
+        availability = site_availability(product_ids)
+        with track("serialization"):
+            return JsonResponse(
+                {
+                    "products": [
+                        {
+                            "id": product_id,
+                            "sites": availability.get(product_id, {}),
+                            "total": sum(availability.get(product_id, {}).values()),
+                        }
+                        for product_id in dict.fromkeys(product_ids)
+                    ]
+                }
+            )
+
+
+@method_decorator(idempotent, name="post")
+class SiteSellView(View):
+    """
+    A view to sell a product from the warehouse stock.
+    """
+
+    def post(self, request, product_id):
+        """
+        Handles POST requests to sell a product from the warehouses.
+
+        The request body may contain a 'quantity' (1 by default) and a 'site', the
+        code of the warehouse to sell from. Without a site the units are taken from
+        the one site which can build them all, or split over several sites.
+
+        :param request: The incoming HTTP request object.
+        :param product_id: The id of the product to sell.
+        :return: A JSON response with the units sold per site, 400 if the stock is
+            insufficient and 404 if the product or the site does not exist.
+        """
+        try:
+            body = json.loads(request.body) if request.body else {}
+            quantity = body.get("quantity", DEFAULT_QUANTITY_TO_SELL)
+            site = body.get("site")
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest("Please send the sale as a JSON object.")
+        if not isinstance(quantity, int) or isinstance(quantity, bool):
+            return HttpResponseBadRequest("Please pass 'quantity' as an integer.")
+
+        try:
+            allocation = sell_from_sites(product_id, quantity, site)
+        except (ProductNotFound, WarehouseNotFound) as e:
+            return JsonResponse({"error": str(e)}, status=404)
+        except InsufficientStock as e:
+            return JsonResponse({"error": str(e), "available": e.available}, status=400)
+        with track("serialization"):
+            return JsonResponse(
+                {"product_id": product_id, "quantity": quantity, "sites": allocation}
+            )
+
+
+@method_decorator(idempotent, name="post")
+class WarehouseStockView(View):
+    """
+    A view to book stock arriving at or leaving a warehouse.
+    """
+
+    def post(self, request, code):
+        """
+        Handles POST requests to change the stock of articles at a warehouse.
+
+        The request body should contain 'articles', an object mapping article ids to
+        the change of their stock at the site (negative to remove units). Either
+        every change is applied or none.
+
+        :param request: The incoming HTTP request object.
+        :param code: The code of the warehouse.
+        :return: A JSON response with the new stock of the articles at the site, 400
+            if a change is invalid and 404 if the warehouse does not exist.
+        """
+        try:
+            articles = (
+                json.loads(request.body).get("articles") if request.body else None
+            )
+        except (ValueError, AttributeError):
+            return HttpResponseBadRequest("Please send the changes as a JSON object.")
+        if (
+            not isinstance(articles, dict)
+            or not articles
+            or not all(
+                isinstance(delta, int) and not isinstance(delta, bool)
+                for delta in articles.values()
+            )
+        ):
+            return HttpResponseBadRequest(
+                "Please pass 'articles' as an object of article ids to integers."
+            )
+
+        try:
+            stock = receive_stock(code, articles)
+        except WarehouseNotFound as e:
+            return JsonResponse({"error": str(e)}, status=404)
+        except InvalidStockChange as e:
+            return JsonResponse({"errors": e.errors}, status=400)
+        return JsonResponse({"warehouse": code, "articles": stock})
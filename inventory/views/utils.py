@@ -0,0 +1,27 @@
+from django.views.decorators.http import condition
+
+from inventory.changes import current_version
+
+
+def wants_json(request):
+    """
+    Returns True if the client explicitly asked for a JSON response.
+
+    Browsers submitting the upload forms send a generic Accept header and keep
+    getting redirected to the admin, API clients get the import stats instead.
+    """
+    return "application/json" in request.headers.get("Accept", "")
+
+
+def version_etag(request, *args, **kwargs):
+    """
+    Returns the ETag of the inventory listings, the current inventory version.
+
+    Used with ``condition``, so a poll with a matching If-None-Match header gets a
+    304 response from a single index lookup, without running the view.
+    """
+    return str(current_version())
+
+
+# Conditional GET for the views whose responses only change with the inventory
+inventory_condition = condition(etag_func=version_etag)
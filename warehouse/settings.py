@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "inventory.middleware.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -54,6 +56,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "warehouse.urls"
 
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "inventory.renderers.InstrumentedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -82,12 +91,37 @@ CORS_ALLOW_METHODS = ("GET", "PUT", "PATCH", "DELETE", "OPTIONS")
 # CORS_ORIGIN_ALLOW_ALL = False
 CORS_ORIGIN_WHITELIST = ("http://localhost:8000",)
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# PostgreSQL is used when POSTGRES_DB is set, SQLite otherwise. SQLite allows a
+# single writer at a time, concurrent sales and uploads need PostgreSQL.
+if os.environ.get("POSTGRES_DB"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ["POSTGRES_DB"],
+            "USER": os.environ.get("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            # Seconds a connection is reused across requests, 0 closes it after
+            # every request
+            "CONN_MAX_AGE": int(os.environ.get("POSTGRES_CONN_MAX_AGE", 60)),
+            # Server side cursors (used by .iterator()) do not survive a pooler in
+            # transaction mode, e.g. PgBouncer
+            "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("POSTGRES_POOLER", "")
+            == "transaction",
+            "OPTIONS": {
+                "connect_timeout": int(os.environ.get("POSTGRES_CONNECT_TIMEOUT", 5)),
+                "application_name": "warehouse",
+            },
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
     }
-}
 
 
 # Password validation
@@ -132,3 +166,67 @@ STATIC_URL = "/static/"
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Inventory
+
+# Number of uploaded rows validated and written per bulk query
+INVENTORY_IMPORT_CHUNK_SIZE = 1000
+
+# Cache for the serialized product stock responses, "BACKEND" is "local" for an
+# in-process LRU, "django" to use the CACHES entry named by "ALIAS", or None.
+# "local" is only invalidated in the process changing the stock, with several
+# worker processes use "django" with a shared cache (memcached, redis) or None
+INVENTORY_PRODUCT_CACHE = {
+    "BACKEND": "local",
+    "TIMEOUT": 30,
+    "MAX_ENTRIES": 1024,
+    "ALIAS": "default",
+}
+
+# Level of the per-request metrics log lines of inventory.middleware
+INVENTORY_METRICS_LOG_LEVEL = "INFO"
+
+# Opt-in micro-batching of the sell endpoint, see inventory.coalescing
+INVENTORY_SELL_COALESCING = {
+    "ENABLED": False,
+    "MAX_BATCH": 500,
+    "MAX_WAIT_MS": 5,
+    "MAX_PENDING": 10000,
+    "TIMEOUT": 5,
+}
+
+# Stock reservations of a checkout, see inventory.reservations
+INVENTORY_RESERVATIONS = {
+    "TTL": 900,
+    "MAX_TTL": 3600,
+    "SWEEP_BATCH_SIZE": 1000,
+}
+
+# Uploads imported by background jobs, see inventory.jobs. "DIRECTORY" is
+# BASE_DIR/uploads if None
+INVENTORY_IMPORT_JOBS = {
+    "THRESHOLD": 1024 * 1024,
+    "WORKERS": 2,
+    "DIRECTORY": None,
+    "MAX_ERRORS": 1000,
+}
+
+# Responses replayed to retries with the same Idempotency-Key header, see
+# inventory.idempotency
+INVENTORY_IDEMPOTENCY = {
+    "TTL": 24 * 60 * 60,
+    "PENDING_TTL": 60,
+    "DEDUPE_UPLOADS": True,
+}
+
+# Reorder alerts and where they are delivered, see inventory.alerts. "PATH" is
+# BASE_DIR/alerts.jsonl if None
+INVENTORY_ALERTS = {
+    "ENABLED": True,
+    "SINK": "file",
+    "PATH": None,
+    "URL": None,
+    "TIMEOUT": 5,
+    "BATCH_SIZE": 100,
+}